@@ -15,6 +15,11 @@ from django.utils.http import url_has_allowed_host_and_scheme
 class RestaurantMenuItemInline(admin.TabularInline):
     model = RestaurantMenuItem
     extra = 0
+    # Обычный select в каждой строке выводил бы все товары и рестораны
+    autocomplete_fields = ['restaurant', 'product']
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('restaurant', 'product')
 
 
 @admin.register(Restaurant)
@@ -34,12 +39,16 @@ class RestaurantAdmin(admin.ModelAdmin):
 class OrderItemInline(admin.TabularInline):
     model = OrderItem
     extra = 0
+    autocomplete_fields = ['product']
     fields = [
         'product', 
         'quantity',
         'price'
     ]
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product')
+
     def formfield_for_dbfield(self, db_field, request, **kwargs):
         field = super().formfield_for_dbfield(db_field, request, **kwargs)
         if db_field.name == 'price':
@@ -57,8 +66,12 @@ class OrderAdmin(admin.ModelAdmin):
         'phonenumber', 
         'address',
         'status',
+        'restaurant',
+        'total_price',
         'registrated_at'
     ]
+    list_select_related = ['restaurant']
+    raw_id_fields = ['restaurant']
     search_fields = [
         'firstname', 
         'lastname', 
@@ -70,7 +83,8 @@ class OrderAdmin(admin.ModelAdmin):
         'payment_method'
     ]
     readonly_fields = [
-        'registrated_at'
+        'registrated_at',
+        'total_price'
     ]
     
     fieldsets = (
@@ -78,7 +92,7 @@ class OrderAdmin(admin.ModelAdmin):
             'fields': ('firstname', 'lastname', 'phonenumber', 'address')
         }),
         ('Заказ', {
-            'fields': ('status','payment_method', 'restaurant', 'comment')
+            'fields': ('status','payment_method', 'restaurant', 'total_price', 'comment')
         }),
         ('Временные метки', {
             'fields': ('registrated_at', 'called_at', 'delivered_at'),
@@ -86,6 +100,11 @@ class OrderAdmin(admin.ModelAdmin):
     )
     
     
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        # Позиции могли измениться в инлайне — пересчитываем хранимую стоимость
+        form.instance.update_total_price()
+    
     def response_change(self, request, obj):
         next_url = request.GET.get('next')
         
@@ -110,6 +129,7 @@ class ProductAdmin(admin.ModelAdmin):
     list_display_links = [
         'name',
     ]
+    list_select_related = ['category']
     list_filter = [
         'category',
     ]
@@ -0,0 +1,110 @@
+import threading
+
+from star_burger.replicas import read_from_primary
+from star_burger.versioning import VersionTracker
+
+AVAILABILITY_VERSION_KEY = 'foodcartapp:availability-version'
+
+
+class AvailabilityIndex:
+    """
+    Матрица «продукт × ресторан» в виде целочисленных битсетов.
+
+    Для каждого продукта хранится int, в котором бит с номером
+    restaurant_id выставлен, если ресторан готовит продукт.
+    Пересечение меню — это побитовое И нескольких чисел.
+
+    Индекс строится лениво одним запросом. Сигналы RestaurantMenuItem
+    помечают изменённые продукты как грязные, и при следующем обращении
+    перечитываются только их строки, если индекс не устарел (VersionTracker).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._bits = None
+        self._dirty_products = set()
+        self._version = VersionTracker(AVAILABILITY_VERSION_KEY)
+
+    def restaurants_for(self, product_ids, bits=None):
+        """
+        Возвращает id ресторанов, у которых в наличии ВСЕ продукты.
+        bits — снимок из snapshot(), чтобы не сверять версию на каждый вызов.
+        """
+        product_ids = set(product_ids)
+        if not product_ids:
+            return []
+
+        if bits is None:
+            bits = self.snapshot()
+        common = -1
+        for product_id in product_ids:
+            common &= bits.get(product_id, 0)
+            if not common:
+                return []
+        return _bits_to_ids(common)
+
+    def snapshot(self):
+        """
+        Словарь продукт → битсет ресторанов, актуальный на момент вызова.
+        Версия в кэше сверяется один раз, поэтому для пачки заказов или
+        страницы товаров снимок берут один раз и дальше читают его.
+        Словарь не меняется: изменения индекса создают новый.
+        """
+        with self._lock:
+            if not self._version.is_current() or self._bits is None:
+                self._bits = self._load()
+                self._dirty_products.clear()
+            elif self._dirty_products:
+                self._bits = {**self._bits, **self._load(self._dirty_products)}
+                self._dirty_products.clear()
+            return self._bits
+
+    def mark_dirty(self, *product_ids):
+        with self._lock:
+            self._dirty_products.update(product_ids)
+            self._version.bump()
+
+    def reset(self):
+        with self._lock:
+            self._bits = None
+            self._dirty_products.clear()
+
+    def _load(self, product_ids=None):
+        from .models import RestaurantMenuItem
+
+        menu_items = RestaurantMenuItem.objects.filter(availability=True)
+        bits = {}
+        if product_ids is not None:
+            menu_items = menu_items.filter(product_id__in=product_ids)
+            bits = dict.fromkeys(product_ids, 0)
+
+        with read_from_primary():
+            for product_id, restaurant_id in menu_items.values_list('product_id', 'restaurant_id'):
+                bits[product_id] = bits.get(product_id, 0) | (1 << restaurant_id)
+        return bits
+
+
+availability_index = AvailabilityIndex()
+
+
+def attach_available_restaurants(orders):
+    """
+    Ставит заказам атрибут available_restaurant_ids.
+    Позиции заказов должны быть уже загружены через prefetch_related('items').
+    """
+    bits = availability_index.snapshot()
+    for order in orders:
+        product_ids = {item.product_id for item in order.items.all()}
+        # Побитовое И по битсетам продуктов: рестораны, у которых есть ВСЕ товары
+        order.available_restaurant_ids = availability_index.restaurants_for(product_ids, bits)
+    return orders
+
+
+def _bits_to_ids(bits):
+    ids = []
+    while bits:
+        lowest = bits & -bits
+        ids.append(lowest.bit_length() - 1)
+        bits ^= lowest
+    return ids
+
@@ -0,0 +1,49 @@
+import time
+
+from django.db import transaction
+
+
+def run_in_batches(queryset, process, fields, chunk_size=1000, checkpoint=None, log=None):
+    """
+    Обходит queryset пачками по первичному ключу и сохраняет изменения bulk_update.
+
+    process(obj) меняет объект и возвращает True, если его нужно сохранить.
+    Каждая пачка сохраняется в своей транзакции, поэтому не держит
+    долгих блокировок, а уже обработанные пачки не откатываются при сбое.
+    checkpoint — запись BatchCheckpoint: после каждой пачки в неё пишется
+    последний обработанный pk, и повторный запуск продолжает с него.
+    log(message) получает прогресс со скоростью в строках в секунду.
+    Подходит и для RunPython: туда передаётся queryset исторической модели.
+    Возвращает пару (обработано строк, сохранено строк).
+    """
+    last_pk = checkpoint.last_pk if checkpoint else None
+    processed = checkpoint.processed if checkpoint else 0
+    updated = checkpoint.updated if checkpoint else 0
+    started_at = time.monotonic()
+    processed_now = 0
+
+    queryset = queryset.order_by('pk')
+    while True:
+        chunk_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+        chunk = list(chunk_queryset[:chunk_size])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+
+        changed = [obj for obj in chunk if process(obj)]
+        with transaction.atomic(using=queryset.db):
+            if changed:
+                queryset.model._default_manager.db_manager(queryset.db).bulk_update(changed, fields)
+            processed += len(chunk)
+            updated += len(changed)
+            if checkpoint:
+                checkpoint.advance(last_pk, processed, updated)
+
+        processed_now += len(chunk)
+        if log:
+            rate = processed_now / max(time.monotonic() - started_at, 1e-6)
+            log(f'Обработано {processed}, сохранено {updated}, до pk={last_pk}, {rate:.0f} строк/с')
+
+    if checkpoint:
+        checkpoint.finish()
+    return processed, updated
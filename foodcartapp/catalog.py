@@ -0,0 +1,56 @@
+import hashlib
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.renderers import JSONRenderer
+
+from star_burger.metrics import registry
+from star_burger.replicas import read_from_primary
+
+from .models import Product
+
+
+CATALOG_VERSION_KEY = 'foodcartapp:catalog-version'
+
+
+def get_catalog():
+    """
+    Возвращает пару (etag, json_bytes) с каталогом доступных товаров.
+
+    Готовый JSON хранится в кэше Django под ключом текущей версии каталога.
+    Версия увеличивается при изменении товаров, категорий и пунктов меню,
+    поэтому каталог собирается заново только после правок.
+    """
+    version = cache.get(CATALOG_VERSION_KEY, 0)
+    cache_key = f'foodcartapp:catalog:{version}'
+    catalog = cache.get(cache_key)
+    registry.inc('catalog_cache_requests_total', result='miss' if catalog is None else 'hit')
+    if catalog is None:
+        # Каталог кэшируется под текущей версией, поэтому читаем его не с реплики
+        with read_from_primary():
+            content = JSONRenderer().render(serialize_products())
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        catalog = (etag, content)
+        cache.set(cache_key, catalog, settings.CATALOG_CACHE_TIMEOUT)
+    return catalog
+
+
+def serialize_products():
+    products = Product.objects.select_related('category').available()
+
+    dumped_products = []
+    for product in products:
+        dumped_product = {
+            'id': product.id,
+            'name': product.name,
+            'price': product.price,
+            'special_status': product.special_status,
+            'description': product.description,
+            'category': {
+                'id': product.category.id,
+                'name': product.category.name,
+            } if product.category else None,
+            'image': product.image.url,
+        }
+        dumped_products.append(dumped_product)
+    return dumped_products
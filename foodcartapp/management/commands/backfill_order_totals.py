@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.batching import run_in_batches
+from foodcartapp.models import BatchCheckpoint, Order
+
+
+class Command(BaseCommand):
+    help = 'Заполняет хранимую стоимость заказов по их позициям, пачками'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--only-mismatched', action='store_true',
+            help='Сохранять только заказы, у которых стоимость отличается от суммы позиций',
+        )
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала таблицы, даже если прошлый запуск был прерван',
+        )
+
+    def handle(self, *args, **options):
+        only_mismatched = options['only_mismatched']
+
+        def update_total_price(order):
+            if order.total_price == order.computed_total_price:
+                if only_mismatched:
+                    return False
+            else:
+                # Дату изменения сдвигаем только там, где сумма правда поменялась,
+                # иначе доска менеджера получит весь архив как изменённые заказы
+                order.updated_at = timezone.now()
+            order.total_price = order.computed_total_price
+            return True
+
+        checkpoint = BatchCheckpoint.start('backfill_order_totals', restart=options['restart'])
+        processed, updated = run_in_batches(
+            Order.objects.with_computed_total_price().only('id', 'total_price', 'updated_at'),
+            update_total_price,
+            ['total_price', 'updated_at'],
+            chunk_size=options['chunk_size'],
+            checkpoint=checkpoint,
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(f'Готово, обновлено заказов: {updated}'))
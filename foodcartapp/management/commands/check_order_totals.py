@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F
+
+from foodcartapp.models import Order
+
+
+class Command(BaseCommand):
+    help = 'Сверяет хранимую стоимость заказов с суммой их позиций'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=20, help='Сколько расхождений показать')
+
+    def handle(self, *args, **options):
+        mismatched = (
+            Order.objects
+            .with_computed_total_price()
+            .exclude(total_price=F('computed_total_price'))
+            .order_by('id')
+            .values_list('id', 'total_price', 'computed_total_price')
+        )
+        count = mismatched.count()
+        if not count:
+            self.stdout.write(self.style.SUCCESS('Расхождений нет'))
+            return
+
+        for order_id, total_price, computed_total_price in mismatched[:options['limit']]:
+            self.stdout.write(f'Заказ {order_id}: сохранено {total_price}, по позициям {computed_total_price}')
+        raise CommandError(
+            f'Расхождений: {count}. Исправьте командой backfill_order_totals --only-mismatched'
+        )
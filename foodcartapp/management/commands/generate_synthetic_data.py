@@ -0,0 +1,155 @@
+import random
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from foodcartapp.availability import AVAILABILITY_VERSION_KEY, availability_index
+from foodcartapp.catalog import CATALOG_VERSION_KEY
+from foodcartapp.models import (
+    ORDER_STATUSES,
+    PAYMENT_METHODS,
+    Order,
+    OrderItem,
+    Product,
+    ProductCategory,
+    Restaurant,
+    RestaurantMenuItem,
+)
+from foodcartapp.nearby import RESTAURANT_INDEX_VERSION_KEY, restaurant_index
+from geocoding.addresses import canonicalize_address
+from geocoding.cache import location_cache
+from geocoding.models import Location
+from star_burger.versioning import bump_cache_version
+
+# Центры городов, вокруг которых разбрасываются адреса
+CITIES = {
+    'Москва': (55.751, 37.618),
+    'Санкт-Петербург': (59.939, 30.316),
+    'Казань': (55.796, 49.106),
+    'Новосибирск': (55.030, 82.920),
+}
+STREETS = ['Ленина', 'Мира', 'Садовая', 'Лесная', 'Школьная', 'Центральная', 'Новая', 'Полевая']
+CITY_RADIUS_DEGREES = 0.15
+
+
+class Command(BaseCommand):
+    help = (
+        'Создаёт синтетические рестораны, товары, меню и заказы с уже найденными '
+        'координатами для бенчмарков. Запускайте на отдельной базе'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--restaurants', type=int, default=50)
+        parser.add_argument('--products', type=int, default=200)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument(
+            '--menu-density', type=float, default=0.5,
+            help='Доля товаров, которые есть в меню каждого ресторана',
+        )
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--items-per-order', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            categories = ProductCategory.objects.bulk_create([
+                ProductCategory(name=f'Категория {index}')
+                for index in range(options['categories'])
+            ])
+            products = Product.objects.bulk_create([
+                Product(
+                    name=f'Товар {index}',
+                    category=rng.choice(categories) if categories else None,
+                    price=Decimal(rng.randrange(50, 1000)),
+                    image='synthetic.jpg',
+                )
+                for index in range(options['products'])
+            ], batch_size=batch_size)
+
+            restaurant_addresses = [self.make_address(rng) for _ in range(options['restaurants'])]
+            order_addresses = [self.make_address(rng) for _ in range(options['orders'])]
+            locations = self.create_locations(rng, [*restaurant_addresses, *order_addresses], batch_size)
+
+            restaurants = Restaurant.objects.bulk_create([
+                Restaurant(
+                    name=f'Ресторан {index}',
+                    address=address,
+                    location=locations[address],
+                )
+                for index, address in enumerate(restaurant_addresses)
+            ], batch_size=batch_size)
+
+            menu_items = []
+            for restaurant in restaurants:
+                for product in products:
+                    if rng.random() < options['menu_density']:
+                        menu_items.append(RestaurantMenuItem(restaurant=restaurant, product=product))
+            RestaurantMenuItem.objects.bulk_create(menu_items, batch_size=batch_size)
+
+            orders = []
+            order_products = []
+            for address in order_addresses:
+                items = [
+                    (product, rng.randint(1, 3))
+                    for product in rng.sample(products, min(options['items_per_order'], len(products)))
+                ]
+                orders.append(Order(
+                    firstname='Синтетический',
+                    lastname='Клиент',
+                    phonenumber='+79161234567',
+                    address=address,
+                    location=locations[address],
+                    status=rng.choice(ORDER_STATUSES)[0],
+                    payment_method=rng.choice(PAYMENT_METHODS)[0],
+                    total_price=sum(product.price * quantity for product, quantity in items),
+                ))
+                order_products.append(items)
+            orders = Order.objects.bulk_create(orders, batch_size=batch_size)
+            OrderItem.objects.bulk_create([
+                OrderItem(order=order, product=product, quantity=quantity, price=product.price)
+                for order, items in zip(orders, order_products)
+                for product, quantity in items
+            ], batch_size=batch_size)
+
+        # bulk_create не шлёт сигналов, поэтому сбрасываем кэши сами
+        for key in (CATALOG_VERSION_KEY, AVAILABILITY_VERSION_KEY, RESTAURANT_INDEX_VERSION_KEY):
+            bump_cache_version(key)
+        availability_index.reset()
+        restaurant_index.reset()
+        location_cache.invalidate()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: ресторанов {len(restaurants)}, товаров {len(products)}, '
+            f'пунктов меню {len(menu_items)}, заказов {len(orders)}'
+        ))
+
+    def make_address(self, rng):
+        city = rng.choice(list(CITIES))
+        return f'{city}, {rng.choice(STREETS)} {rng.randint(1, 200)}к{rng.randint(1, 9)}'
+
+    def create_locations(self, rng, addresses, batch_size):
+        """Создаёт Location с координатами рядом с центром города. Возвращает адрес → Location."""
+        keys = {canonicalize_address(address): address for address in addresses}
+        existing = set(
+            Location.objects
+            .filter(canonical_key__in=keys)
+            .values_list('canonical_key', flat=True)
+        )
+        new_locations = []
+        for key, address in keys.items():
+            if key in existing:
+                continue
+            lat, lon = CITIES[address.split(',')[0]]
+            new_locations.append(Location(
+                address=address,
+                canonical_key=key,
+                lat=lat + rng.uniform(-CITY_RADIUS_DEGREES, CITY_RADIUS_DEGREES),
+                lon=lon + rng.uniform(-CITY_RADIUS_DEGREES, CITY_RADIUS_DEGREES),
+            ))
+        Location.objects.bulk_create(new_locations, batch_size=batch_size)
+        return Location.objects.for_addresses(addresses)
@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from foodcartapp.batching import run_in_batches
+from foodcartapp.models import BatchCheckpoint, Order
+from foodcartapp.phones import normalize_order_phonenumber
+
+
+class Command(BaseCommand):
+    help = (
+        'Приводит телефоны в заказах к формату E.164 пачками. '
+        'Прерванный запуск продолжается с места остановки'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+        parser.add_argument(
+            '--restart', action='store_true',
+            help='Начать с начала таблицы, даже если прошлый запуск был прерван',
+        )
+
+    def handle(self, *args, **options):
+        checkpoint = BatchCheckpoint.start('normalize_phonenumbers', restart=options['restart'])
+        if checkpoint.last_pk:
+            self.stdout.write(f'Продолжаем после заказа id={checkpoint.last_pk}')
+
+        processed, updated = run_in_batches(
+            Order.objects.only('id', 'phonenumber'),
+            normalize_order_phonenumber,
+            ['phonenumber'],
+            chunk_size=options['chunk_size'],
+            checkpoint=checkpoint,
+            log=self.stdout.write,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово, проверено заказов: {processed}, исправлено номеров: {updated}'
+        ))
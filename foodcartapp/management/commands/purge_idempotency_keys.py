@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from foodcartapp.models import IdempotencyKey
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет ключи идемпотентности старше IDEMPOTENCY_KEY_TTL. '
+        'Удаляет пачками, чтобы не держать долгую блокировку таблицы'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        expired = IdempotencyKey.objects.filter(
+            created_at__lt=timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
+        )
+        deleted = 0
+        while True:
+            ids = list(expired.order_by('created_at').values_list('id', flat=True)[:options['chunk_size']])
+            if not ids:
+                break
+            deleted += IdempotencyKey.objects.filter(id__in=ids).delete()[0]
+
+        self.stdout.write(self.style.SUCCESS(f'Удалено ключей: {deleted}'))
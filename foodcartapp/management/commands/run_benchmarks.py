@@ -0,0 +1,156 @@
+import json
+import platform
+import statistics
+import time
+import tracemalloc
+
+import django
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from foodcartapp.models import Order, Product, Restaurant, RestaurantMenuItem
+from geocoding.utils import get_geolocator
+
+BENCHMARK_USER = 'benchmark'
+
+
+class Command(BaseCommand):
+    help = (
+        'Замеряет горячие пути API и страниц менеджера на текущей базе: время, '
+        'число запросов и пиковую память. Печатает JSON, который удобно сравнивать '
+        'между коммитами. Геокодер подменяется заглушкой, сеть не нужна'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=5)
+        parser.add_argument('--output', help='Файл для JSON, по умолчанию stdout')
+        parser.add_argument(
+            '--only', action='append',
+            help='Запустить только этот бенчмарк, можно указать несколько раз',
+        )
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('product_id', flat=True)
+            .distinct()[:3]
+        )
+        if not product_ids:
+            raise CommandError('В базе нет меню. Сначала запустите generate_synthetic_data')
+
+        benchmarks = {
+            'product_list_api': lambda client: client.get('/api/products/'),
+            'register_order': lambda client: client.post(
+                '/api/order/',
+                {
+                    'firstname': 'Бенчмарк',
+                    'lastname': 'Бенчмарков',
+                    'phonenumber': '+79161234567',
+                    'address': 'Москва, Тверская 1',
+                    'products': [{'product': product_id, 'quantity': 1} for product_id in product_ids],
+                },
+                content_type='application/json',
+            ),
+            'view_orders': lambda client: client.get(reverse('restaurateur:view_orders')),
+            'view_products': lambda client: client.get(reverse('restaurateur:ProductsView')),
+            'with_available_restaurants': lambda client: Order.objects.exclude(
+                status='COMPLETED'
+            ).with_available_restaurants(),
+        }
+        unknown = set(options['only'] or ()) - set(benchmarks)
+        if unknown:
+            raise CommandError(f'Неизвестные бенчмарки: {", ".join(sorted(unknown))}')
+
+        settings_override = override_settings(
+            GEOCODER_BACKEND='geocoding.stub.StubGeocoder',
+            ALLOWED_HOSTS=['testserver'],
+            # Без DEBUG не подключается debug_toolbar и не копятся запросы в connection.queries
+            DEBUG=False,
+            # Повторы одного и того же заказа иначе упрутся в лимит на номер телефона
+            API_THROTTLE_ENABLED=False,
+        )
+        get_geolocator.cache_clear()
+        results = {}
+        with settings_override:
+            client = Client()
+            client.force_login(self.get_manager())
+            for name, benchmark in benchmarks.items():
+                if options['only'] and name not in options['only']:
+                    continue
+                results[name] = self.measure(client, benchmark, options['repeat'])
+        get_geolocator.cache_clear()
+
+        report = {
+            'environment': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'dataset': {
+                'restaurants': Restaurant.objects.count(),
+                'products': Product.objects.count(),
+                'menu_items': RestaurantMenuItem.objects.count(),
+                'orders': Order.objects.count(),
+            },
+            'repeat': options['repeat'],
+            'benchmarks': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def get_manager(self):
+        manager, _ = User.objects.get_or_create(username=BENCHMARK_USER, defaults={'is_staff': True})
+        return manager
+
+    def measure(self, client, benchmark, repeat):
+        """
+        Первый вызов прогревает кэши и замеряется отдельно как «холодный».
+        Пиковая память снимается отдельным прогоном: tracemalloc сильно
+        замедляет код и исказил бы время.
+        """
+        cold_ms, cold_queries = self.run_once(client, benchmark)
+
+        timings = []
+        queries = 0
+        for _ in range(repeat):
+            elapsed_ms, queries = self.run_once(client, benchmark)
+            timings.append(elapsed_ms)
+
+        tracemalloc.start()
+        try:
+            self.run_once(client, benchmark)
+            _, peak_memory = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        return {
+            'cold_ms': round(cold_ms, 2),
+            'cold_queries': cold_queries,
+            'min_ms': round(min(timings), 2) if timings else None,
+            'median_ms': round(statistics.median(timings), 2) if timings else None,
+            'max_ms': round(max(timings), 2) if timings else None,
+            'queries': queries if timings else None,
+            'peak_memory_kb': round(peak_memory / 1024, 1),
+        }
+
+    def run_once(self, client, benchmark):
+        # Изменения, которые делает бенчмарк (например, новый заказ), откатываются
+        with transaction.atomic(), CaptureQueriesContext(connection) as captured:
+            started_at = time.perf_counter()
+            response = benchmark(client)
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            transaction.set_rollback(True)
+
+        status_code = getattr(response, 'status_code', 200)
+        if status_code >= 400:
+            raise CommandError(f'Бенчмарк вернул статус {status_code}')
+        return elapsed_ms, len(captured)
@@ -0,0 +1,115 @@
+import json
+import random
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+from foodcartapp.models import RestaurantMenuItem
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагружает запущенный сервер параллельными запросами к API и печатает '
+        'JSON с запросами в секунду и перцентилями времени ответа. Запустите '
+        'одну и ту же базу под WSGI и под ASGI и сравните отчёты'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый эндпоинт')
+        parser.add_argument('--timeout', type=float, default=30)
+        parser.add_argument('--output', help='Файл для JSON, по умолчанию stdout')
+        parser.add_argument(
+            '--only', action='append',
+            help='Нагрузить только этот эндпоинт, можно указать несколько раз',
+        )
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            RestaurantMenuItem.objects
+            .filter(availability=True)
+            .values_list('product_id', flat=True)
+            .distinct()[:3]
+        )
+        if not product_ids:
+            raise CommandError('В базе нет меню. Сначала запустите generate_synthetic_data')
+
+        base_url = options['base_url'].rstrip('/')
+        endpoints = {
+            'product_list_api': lambda: Request(f'{base_url}/api/products/'),
+            'banners_list_api': lambda: Request(f'{base_url}/api/banners/'),
+            'register_order': lambda: Request(
+                f'{base_url}/api/order/',
+                data=json.dumps({
+                    'firstname': 'Нагрузка',
+                    'lastname': 'Тестовая',
+                    # Разные номера, чтобы не упереться в лимит на один телефон
+                    'phonenumber': f'+7916{random.randrange(10 ** 7):07d}',
+                    'address': 'Москва, Тверская 1',
+                    'products': [{'product': product_id, 'quantity': 1} for product_id in product_ids],
+                }).encode('utf-8'),
+                headers={'Content-Type': 'application/json'},
+                method='POST',
+            ),
+        }
+        unknown = set(options['only'] or ()) - set(endpoints)
+        if unknown:
+            raise CommandError(f'Неизвестные эндпоинты: {", ".join(sorted(unknown))}')
+
+        results = {}
+        for name, make_request in endpoints.items():
+            if options['only'] and name not in options['only']:
+                continue
+            results[name] = self.load(make_request, options)
+
+        report = {
+            'base_url': base_url,
+            'concurrency': options['concurrency'],
+            'requests': options['requests'],
+            'endpoints': results,
+        }
+        output = json.dumps(report, ensure_ascii=False, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(output + '\n')
+        else:
+            self.stdout.write(output)
+
+    def load(self, make_request, options):
+        """
+        Шлёт запросы из пула потоков. Потоки сами почти не работают, поэтому
+        при достаточной параллельности упираемся в сервер, а не в клиента.
+        """
+        def send(_):
+            started_at = time.perf_counter()
+            try:
+                with urlopen(make_request(), timeout=options['timeout']) as response:
+                    response.read()
+                    status = response.status
+            except HTTPError as error:
+                status = error.code
+            except (URLError, OSError):
+                status = None
+            return status, time.perf_counter() - started_at
+
+        started_at = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            responses = list(executor.map(send, range(options['requests'])))
+        elapsed = time.perf_counter() - started_at
+
+        timings = sorted(duration * 1000 for status, duration in responses if status and status < 400)
+        statuses = {}
+        for status, _ in responses:
+            statuses[str(status or 'error')] = statuses.get(str(status or 'error'), 0) + 1
+        return {
+            'rps': round(len(timings) / elapsed, 1),
+            'p50_ms': round(statistics.median(timings), 2) if timings else None,
+            'p99_ms': round(timings[min(len(timings) - 1, int(len(timings) * 0.99))], 2) if timings else None,
+            'max_ms': round(timings[-1], 2) if timings else None,
+            'statuses': statuses,
+        }
@@ -1,29 +1,58 @@
 # Generated by Django 5.2.10 on 2026-01-18 14:50
-from django.db import migrations
 import phonenumbers
-from phonenumber_field.phonenumber import PhoneNumber
+from django.db import migrations, transaction
+
+# Копии помощников на момент написания миграции: живой код из foodcartapp
+# может измениться и незаметно поменять то, что делает уже применённая миграция
+CHUNK_SIZE = 1000
+
+
+def normalize_phonenumber(raw_number):
+    raw_number = str(raw_number or '').strip()
+    if not raw_number:
+        return None
+    try:
+        parsed = phonenumbers.parse(raw_number, 'RU')
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
 
 def normalize_phonenumbers(apps, schema_editor):
     Order = apps.get_model('foodcartapp', 'Order')
-    for order in Order.objects.all():
-        raw_number = str(order.phonenumber).strip()
-        if not raw_number:
-            continue
-        try:
-            parsed = phonenumbers.parse(raw_number, 'RU')
-            if phonenumbers.is_valid_number(parsed):
-                normalized = phonenumbers.format_number(
-                    parsed, phonenumbers.PhoneNumberFormat.E164
-                )
+    db_alias = schema_editor.connection.alias
+    orders = Order.objects.using(db_alias).only('id', 'phonenumber').order_by('pk')
+    # Пачками по pk, каждая в своей транзакции: прерванную миграцию можно
+    # запустить снова, уже нормализованные номера просто пропустятся.
+    # Дозапустить нормализацию отдельно можно командой normalize_phonenumbers
+    last_pk = 0
+    while True:
+        chunk = list(orders.filter(pk__gt=last_pk)[:CHUNK_SIZE])
+        if not chunk:
+            break
+        last_pk = chunk[-1].pk
+
+        changed = []
+        for order in chunk:
+            # PhoneNumber при выводе уже форматирует номер, сравниваем с исходной строкой
+            raw_number = getattr(order.phonenumber, 'raw_input', None) or str(order.phonenumber or '')
+            normalized = normalize_phonenumber(raw_number)
+            if normalized is not None and normalized != raw_number:
                 order.phonenumber = normalized
-                order.save(update_fields=['phonenumber'])
-        except Exception:
-            pass
+                changed.append(order)
+        if changed:
+            with transaction.atomic(using=db_alias):
+                Order.objects.using(db_alias).bulk_update(changed, ['phonenumber'])
+
 
 def reverse_normalize_phonenumbers(apps, schema_editor):
     pass
 
 class Migration(migrations.Migration):
+    atomic = False
+
     dependencies = [
         ('foodcartapp', '0038_order_orderitem'),
     ]
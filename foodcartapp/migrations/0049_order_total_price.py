@@ -0,0 +1,58 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:02
+
+from decimal import Decimal
+
+from django.db import migrations, models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+
+CHUNK_SIZE = 1000
+
+
+def fill_total_price(apps, schema_editor):
+    """
+    UPDATE с подзапросом по позициям, пачками по pk, каждая в своей транзакции:
+    миграция не держит блокировку на всю таблицу заказов.
+    Прерванное заполнение можно закончить командой backfill_order_totals.
+    """
+    db_alias = schema_editor.connection.alias
+    Order = apps.get_model('foodcartapp', 'Order')
+    OrderItem = apps.get_model('foodcartapp', 'OrderItem')
+    totals = (
+        OrderItem.objects
+        .filter(order=OuterRef('pk'))
+        .values('order')
+        .annotate(total=Sum(F('price') * F('quantity')))
+        .values('total')
+    )
+    orders = Order.objects.using(db_alias).order_by('pk')
+    last_pk = 0
+    while True:
+        pks = list(orders.filter(pk__gt=last_pk).values_list('pk', flat=True)[:CHUNK_SIZE])
+        if not pks:
+            break
+        with transaction.atomic(using=db_alias):
+            orders.filter(pk__gt=last_pk, pk__lte=pks[-1]).update(
+                total_price=Coalesce(
+                    Subquery(totals, output_field=models.DecimalField(max_digits=10, decimal_places=2)),
+                    Value(Decimal('0')),
+                ),
+            )
+        last_pk = pks[-1]
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('foodcartapp', '0048_order_coords_error_alter_order_called_at_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='total_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, help_text='Пересчитывается при изменении позиций заказа', max_digits=10, verbose_name='Стоимость заказа'),
+        ),
+        migrations.RunPython(fill_total_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,127 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:03
+
+import re
+
+import django.db.models.deletion
+from django.db import migrations, models, transaction
+
+# Копия geocoding.addresses на момент написания миграции: правки живого
+# канонизатора не должны менять то, что делает уже применённая миграция
+# Сокращения с дефисом нужно развернуть до того, как пунктуация станет пробелами
+HYPHENATED_ABBREVIATIONS = {
+    'пр-т': 'проспект',
+    'пр-кт': 'проспект',
+    'б-р': 'бульвар',
+    'р-н': 'район',
+}
+
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'мкр': 'микрорайон',
+    'обл': 'область',
+    'г': 'город',
+    'д': 'дом',
+    'стр': 'строение',
+    'к': 'корпус',
+    'корп': 'корпус',
+}
+
+# Слова, которые обычно опускают, не меняя смысла адреса:
+# «Москва, Тверская 1» и «г. Москва, ул. Тверская, д. 1» — один адрес
+OPTIONAL_WORDS = {'город', 'улица', 'дом'}
+
+HYPHENATED_RE = re.compile(
+    r'(?<!\w)(' + '|'.join(re.escape(abbr) for abbr in HYPHENATED_ABBREVIATIONS) + r')(?!\w)'
+)
+NON_WORD_RE = re.compile(r'[\W_]+')
+# «5к2» — то же, что «5 корпус 2»
+HOUSE_WITH_BLOCK_RE = re.compile(r'(\d+)(к|корп|стр)(\d+)')
+
+
+def canonicalize_address(address):
+    if not address:
+        return ''
+    address = address.lower().replace('ё', 'е')
+    address = HYPHENATED_RE.sub(lambda match: HYPHENATED_ABBREVIATIONS[match.group(1)], address)
+
+    address = NON_WORD_RE.sub(' ', address)
+    address = HOUSE_WITH_BLOCK_RE.sub(r'\1 \2 \3', address)
+
+    words = []
+    for word in address.split():
+        word = ABBREVIATIONS.get(word, word)
+        if word not in OPTIONAL_WORDS:
+            words.append(word)
+    return ' '.join(words)
+
+
+def link_locations(apps, schema_editor):
+    db_alias = schema_editor.connection.alias
+    Location = apps.get_model('geocoding', 'Location')
+    for model_name in ('Restaurant', 'Order'):
+        Model = apps.get_model('foodcartapp', model_name)
+        last_id = 0
+        while True:
+            chunk = list(
+                Model.objects.using(db_alias)
+                .filter(id__gt=last_id, location__isnull=True)
+                .exclude(address='')
+                .order_by('id')
+                .only('id', 'address')[:1000]
+            )
+            if not chunk:
+                break
+            last_id = chunk[-1].id
+
+            keys = {obj.address: canonicalize_address(obj.address) for obj in chunk}
+            # Каждая пачка в своей транзакции: миграция не держит блокировки на всю таблицу заказов
+            with transaction.atomic(using=db_alias):
+                existing = set(
+                    Location.objects.using(db_alias)
+                    .filter(canonical_key__in=set(keys.values()))
+                    .values_list('canonical_key', flat=True)
+                )
+                missing = {}
+                for address, key in keys.items():
+                    if key not in existing:
+                        missing.setdefault(key, address)
+                Location.objects.using(db_alias).bulk_create(
+                    [Location(address=address, canonical_key=key) for key, address in missing.items()],
+                    ignore_conflicts=True,
+                )
+
+                locations = {}
+                for location in Location.objects.using(db_alias).filter(canonical_key__in=set(keys.values())).order_by(models.F('lat').desc(nulls_last=True)):
+                    locations.setdefault(location.canonical_key, location)
+                for obj in chunk:
+                    obj.location = locations.get(keys[obj.address])
+                Model.objects.using(db_alias).bulk_update(chunk, ['location'])
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('foodcartapp', '0049_order_total_price'),
+        ('geocoding', '0004_location_retry_schedule'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='location',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='orders', to='geocoding.location', verbose_name='Координаты адреса'),
+        ),
+        migrations.AddField(
+            model_name='restaurant',
+            name='location',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='restaurants', to='geocoding.location', verbose_name='координаты адреса'),
+        ),
+        migrations.RunPython(link_locations, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0050_restaurant_order_location'),
+        ('geocoding', '0004_location_retry_schedule'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['registrated_at', 'id'], name='order_board_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['status', 'registrated_at', 'id'], name='order_board_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['payment_method', 'registrated_at', 'id'], name='order_board_payment_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['restaurant', 'registrated_at', 'id'], name='order_board_restaurant_idx'),
+        ),
+    ]
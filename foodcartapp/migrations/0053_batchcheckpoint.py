@@ -0,0 +1,31 @@
+# Generated by Django 5.2.10 on 2026-10-18 03:15
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodcartapp', '0052_order_updated_at'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BatchCheckpoint',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='задача')),
+                ('last_pk', models.BigIntegerField(blank=True, null=True, verbose_name='последний обработанный pk')),
+                ('processed', models.PositiveBigIntegerField(default=0, verbose_name='обработано строк')),
+                ('updated', models.PositiveBigIntegerField(default=0, verbose_name='сохранено строк')),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='начало')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='последняя пачка')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='окончание')),
+            ],
+            options={
+                'verbose_name': 'прогресс пакетной обработки',
+                'verbose_name_plural': 'прогресс пакетных обработок',
+            },
+        ),
+    ]
@@ -1,14 +1,29 @@
+from datetime import timedelta
 from functools import lru_cache
-from django.db.models import Sum, F
+from decimal import Decimal
+from django.db.models import Sum, F, Value
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.core.validators import MinValueValidator
 from phonenumber_field.modelfields import PhoneNumberField
 
+from geocoding.models import Location
+
 
 class OrderQuerySet(models.QuerySet):
-    def with_total_price(self):
+    def with_computed_total_price(self):
+        """
+        Считает сумму заказа по позициям агрегатом.
+        Нужна для заполнения и сверки хранимого поля total_price.
+        """
         return self.annotate(
-            total_price=Sum(F('items__price') * F('items__quantity'))
+            computed_total_price=Coalesce(
+                Sum(F('items__price') * F('items__quantity')),
+                Value(Decimal('0')),
+                output_field=models.DecimalField(max_digits=10, decimal_places=2),
+            )
         )
         
     def with_available_restaurants(self):
@@ -17,44 +32,34 @@ class OrderQuerySet(models.QuerySet):
         НЕ работает с координатами - только находит рестораны, 
         которые могут выполнить заказ (пересечение меню).
         """
-        from .models import RestaurantMenuItem
-        
-        # Получаем маппинг: product_id → set(restaurant_ids)
-        menu_items = (
-            RestaurantMenuItem.objects
-            .filter(availability=True)
-            .values('product_id', 'restaurant_id')
-        )
-        
-        product_to_restaurants = {}
-        for item in menu_items:
-            product_to_restaurants.setdefault(
-                item['product_id'], set()
-            ).add(item['restaurant_id'])
-        
-        orders = list(self.prefetch_related('items'))
-        
-        for order in orders:
-            product_ids = {item.product_id for item in order.items.all()}
-            
-            if not product_ids:
-                order.available_restaurant_ids = []
-                continue
-            
-            # Пересечение множеств: рестораны, у которых есть ВСЕ товары
-            common_ids = None
-            for pid in product_ids:
-                rids = product_to_restaurants.get(pid, set())
-                if common_ids is None:
-                    common_ids = rids.copy()
-                else:
-                    common_ids &= rids
-                if not common_ids:
-                    break
-            
-            order.available_restaurant_ids = list(common_ids) if common_ids else []
-        
-        return orders
+        from .availability import attach_available_restaurants
+
+        return attach_available_restaurants(list(self.prefetch_related('items')))
+
+
+class AddressLocationMixin:
+    """
+    Привязывает запись к Location по адресу при сохранении.
+    Сам геокодер не вызывается: координаты в Location появятся позже.
+    """
+    loaded_address = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_address = instance.__dict__.get('address')
+        return instance
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        address_saved = update_fields is None or 'address' in update_fields
+        address_changed = self.address != self.loaded_address or self.location_id is None
+        if address_saved and address_changed:
+            self.location = Location.objects.get_for_address(self.address) if self.address else None
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'location'}
+        super().save(*args, **kwargs)
+        self.loaded_address = self.address
 
 
 ORDER_STATUSES = [
@@ -71,12 +76,21 @@ PAYMENT_METHODS = [
 ]
 
 
-class Order(models.Model):
+class Order(AddressLocationMixin, models.Model):
     address = models.CharField('Адрес доставки', max_length=200)
     firstname = models.CharField('Имя', max_length=50)
     lastname = models.CharField('Фамилия', max_length=50)
     phonenumber = PhoneNumberField('Мобильный номер', db_index=True)
     comment = models.TextField('Комментарий', blank=True)
+    location = models.ForeignKey(
+        Location,
+        verbose_name='Координаты адреса',
+        related_name='orders',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False
+    )
     
     restaurant = models.ForeignKey(
         'Restaurant',
@@ -97,6 +111,7 @@ class Order(models.Model):
     registrated_at = models.DateTimeField('Дата создания заказа', auto_now_add=True, db_index=True)
     called_at = models.DateTimeField('Дата звонка', blank=True, null=True, db_index=True)
     delivered_at = models.DateTimeField('Дата доставки', blank=True, null=True, db_index=True)
+    updated_at = models.DateTimeField('Дата изменения', auto_now=True)
     
     objects = OrderQuerySet.as_manager()
     
@@ -114,15 +129,46 @@ class Order(models.Model):
         help_text='Адрес не найден геокодером'
     ) 
     
+    total_price = models.DecimalField(
+        'Стоимость заказа',
+        max_digits=10,
+        decimal_places=2,
+        default=0,
+        db_index=True,
+        editable=False,
+        help_text='Пересчитывается при изменении позиций заказа'
+    )
+    
     class Meta:
         verbose_name = 'заказ'
         verbose_name_plural = 'заказы'
+        # Доска менеджера листает заказы по ключу (registrated_at, id),
+        # в том числе внутри фильтров по статусу, оплате и ресторану
+        indexes = [
+            models.Index(fields=['registrated_at', 'id'], name='order_board_idx'),
+            models.Index(fields=['status', 'registrated_at', 'id'], name='order_board_status_idx'),
+            models.Index(fields=['payment_method', 'registrated_at', 'id'], name='order_board_payment_idx'),
+            models.Index(fields=['restaurant', 'registrated_at', 'id'], name='order_board_restaurant_idx'),
+            # Поток изменений для доски читает заказы по ключу (updated_at, id)
+            models.Index(fields=['updated_at', 'id'], name='order_updates_idx'),
+        ]
                  
     def __str__(self):
         return f"{self.firstname} {self.lastname}, {self.phonenumber}"   
+    
+    def update_total_price(self):
+        """Пересчитывает и сохраняет стоимость заказа по его позициям."""
+        self.total_price = (
+            Order.objects
+            .filter(pk=self.pk)
+            .with_computed_total_price()
+            .values_list('computed_total_price', flat=True)
+            .get()
+        )
+        self.save(update_fields=['total_price', 'updated_at'])
 
 
-class Restaurant(models.Model):
+class Restaurant(AddressLocationMixin, models.Model):
     name = models.CharField(
         'название',
         max_length=50
@@ -137,6 +183,15 @@ class Restaurant(models.Model):
         max_length=50,
         blank=True,
     )
+    location = models.ForeignKey(
+        Location,
+        verbose_name='координаты адреса',
+        related_name='restaurants',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+    )
 
     class Meta:
         verbose_name = 'ресторан'
@@ -232,6 +287,8 @@ class RestaurantMenuItem(models.Model):
         db_index=True
     )
 
+    loaded_product_id = None
+
     class Meta:
         verbose_name = 'пункт меню ресторана'
         verbose_name_plural = 'пункты меню ресторана'
@@ -242,6 +299,14 @@ class RestaurantMenuItem(models.Model):
     def __str__(self):
         return f"{self.restaurant.name} - {self.product.name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный продукт, чтобы при смене продукта в пункте меню
+        # сбросить в индексе наличия и старый продукт тоже
+        instance.loaded_product_id = instance.__dict__.get('product_id')
+        return instance
+
 
 class OrderItem(models.Model):
     order = models.ForeignKey(
@@ -272,4 +337,70 @@ class OrderItem(models.Model):
         verbose_name_plural = 'элементы заказа'
 
     def __str__(self):
-        return f"{self.product.name} × {self.quantity}"
\ No newline at end of file
+        return f"{self.product.name} × {self.quantity}"
+
+
+class BatchCheckpoint(models.Model):
+    """Прогресс пакетной обработки таблицы, чтобы после сбоя продолжить с места остановки."""
+    name = models.CharField('задача', max_length=100, unique=True)
+    last_pk = models.BigIntegerField('последний обработанный pk', null=True, blank=True)
+    processed = models.PositiveBigIntegerField('обработано строк', default=0)
+    updated = models.PositiveBigIntegerField('сохранено строк', default=0)
+    started_at = models.DateTimeField('начало', default=timezone.now)
+    updated_at = models.DateTimeField('последняя пачка', auto_now=True)
+    finished_at = models.DateTimeField('окончание', null=True, blank=True)
+
+    class Meta:
+        verbose_name = 'прогресс пакетной обработки'
+        verbose_name_plural = 'прогресс пакетных обработок'
+
+    def __str__(self):
+        return self.name
+
+    @classmethod
+    def start(cls, name, restart=False):
+        """
+        Возвращает прогресс задачи. Прерванная задача продолжается,
+        а законченная или перезапущенная начинается с начала таблицы.
+        """
+        checkpoint, _ = cls.objects.get_or_create(name=name)
+        if restart or checkpoint.finished_at:
+            checkpoint.last_pk = None
+            checkpoint.processed = 0
+            checkpoint.updated = 0
+            checkpoint.started_at = timezone.now()
+            checkpoint.finished_at = None
+            checkpoint.save()
+        return checkpoint
+
+    def advance(self, last_pk, processed, updated):
+        self.last_pk = last_pk
+        self.processed = processed
+        self.updated = updated
+        self.save(update_fields=['last_pk', 'processed', 'updated', 'updated_at'])
+
+    def finish(self):
+        self.finished_at = timezone.now()
+        self.save(update_fields=['finished_at', 'updated_at'])
+
+
+class IdempotencyKey(models.Model):
+    """
+    Ответ на запрос с заголовком Idempotency-Key. Повтор запроса с тем же
+    ключом получает сохранённый ответ, а заказ второй раз не создаётся.
+    """
+    key = models.CharField('ключ', max_length=255, unique=True)
+    request_hash = models.CharField('хэш тела запроса', max_length=64)
+    response_status = models.PositiveSmallIntegerField('код ответа')
+    response_body = models.JSONField('тело ответа')
+    created_at = models.DateTimeField('создан', default=timezone.now, db_index=True)
+
+    class Meta:
+        verbose_name = 'ключ идемпотентности'
+        verbose_name_plural = 'ключи идемпотентности'
+
+    def __str__(self):
+        return self.key
+
+    def is_expired(self):
+        return self.created_at < timezone.now() - timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL)
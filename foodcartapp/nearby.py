@@ -0,0 +1,115 @@
+import threading
+
+from django.conf import settings
+from django.db.models import Q
+
+from geocoding.spatial import GridIndex
+from star_burger.replicas import read_from_primary
+from star_burger.versioning import VersionTracker
+
+RESTAURANT_INDEX_VERSION_KEY = 'foodcartapp:restaurant-index-version'
+
+
+class RestaurantIndex:
+    """
+    Пространственный индекс ресторанов по координатам их Location.
+
+    Обновляется так же, как AvailabilityIndex: грязными сигналы Restaurant
+    и геокодера помечают рестораны и Location. Рестораны, у которых ещё
+    нет координат, в сетку не попадают, их id доступны через unlocated_ids().
+    """
+
+    def __init__(self, cell_size_km=None):
+        self.cell_size_km = cell_size_km
+        self._lock = threading.Lock()
+        self._grid = None
+        self._locations = {}
+        self._unlocated = set()
+        self._dirty_restaurants = set()
+        self._dirty_locations = set()
+        self._version = VersionTracker(RESTAURANT_INDEX_VERSION_KEY)
+
+    def nearest(self, coords, k=None, radius_km=None, allowed_ids=None):
+        """
+        Возвращает до k пар (restaurant_id, расстояние в км) по возрастанию
+        расстояния, не дальше radius_km. allowed_ids ограничивает рестораны,
+        например теми, что могут приготовить заказ.
+        """
+        with self._lock:
+            return self._get_grid().nearest(coords, k, radius_km, allowed_ids)
+
+    def nearest_many(self, queries, k=None, radius_km=None):
+        """
+        nearest() для пачки точек: queries — список пар (coords, allowed_ids).
+        Версия в кэше сверяется один раз на всю пачку, а не на каждую точку.
+        """
+        with self._lock:
+            grid = self._get_grid()
+            return [grid.nearest(coords, k, radius_km, allowed_ids) for coords, allowed_ids in queries]
+
+    def unlocated_ids(self):
+        """Возвращает id ресторанов, для которых координаты ещё не известны."""
+        with self._lock:
+            self._get_grid()
+            return set(self._unlocated)
+
+    def mark_dirty(self, restaurant_ids=(), location_ids=()):
+        with self._lock:
+            self._dirty_restaurants.update(restaurant_ids)
+            self._dirty_locations.update(location_ids)
+            self._version.bump()
+
+    def reset(self):
+        with self._lock:
+            self._grid = None
+            self._dirty_restaurants.clear()
+            self._dirty_locations.clear()
+
+    def _get_grid(self):
+        if not self._version.is_current() or self._grid is None:
+            self._grid = GridIndex(
+                self.cell_size_km or settings.RESTAURANT_GRID_CELL_KM,
+                method=settings.DISTANCE_METHOD,
+            )
+            self._locations.clear()
+            self._unlocated.clear()
+            self._load()
+        elif self._dirty_restaurants or self._dirty_locations:
+            restaurant_ids = self._dirty_restaurants | {
+                restaurant_id
+                for restaurant_id, location_id in self._locations.items()
+                if location_id in self._dirty_locations
+            }
+            # Удалённые рестораны и отвязанные Location при перечитывании
+            # не найдутся, поэтому сначала убираем все затронутые записи
+            for restaurant_id in restaurant_ids:
+                self._grid.remove(restaurant_id)
+                self._locations.pop(restaurant_id, None)
+                self._unlocated.discard(restaurant_id)
+            self._load(restaurant_ids, self._dirty_locations)
+        self._dirty_restaurants.clear()
+        self._dirty_locations.clear()
+        return self._grid
+
+    def _load(self, restaurant_ids=None, location_ids=None):
+        from .models import Restaurant
+
+        restaurants = Restaurant.objects.all()
+        if restaurant_ids is not None:
+            restaurants = restaurants.filter(
+                Q(id__in=restaurant_ids) | Q(location_id__in=location_ids)
+            )
+
+        with read_from_primary():
+            rows = list(restaurants.values_list('id', 'location_id', 'location__lat', 'location__lon'))
+        for restaurant_id, location_id, lat, lon in rows:
+            self._locations[restaurant_id] = location_id
+            if lat is None or lon is None:
+                self._grid.remove(restaurant_id)
+                self._unlocated.add(restaurant_id)
+            else:
+                self._grid.insert(restaurant_id, (lat, lon))
+                self._unlocated.discard(restaurant_id)
+
+
+restaurant_index = RestaurantIndex()
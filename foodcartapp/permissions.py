@@ -0,0 +1,21 @@
+import hmac
+
+from django.conf import settings
+from rest_framework.permissions import BasePermission
+
+
+class HasPartnerToken(BasePermission):
+    """
+    Пускает партнёров-агрегаторов с заголовком Authorization: Bearer <токен>,
+    где токен — один из PARTNER_API_TOKENS. Без настроенных токенов закрыто для всех.
+    """
+    message = 'Нужен токен партнёра в заголовке Authorization: Bearer <токен>'
+
+    def has_permission(self, request, view):
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not token:
+            return False
+        return any(
+            hmac.compare_digest(token.encode(), partner_token.encode())
+            for partner_token in settings.PARTNER_API_TOKENS
+        )
@@ -0,0 +1,32 @@
+import phonenumbers
+
+
+def normalize_phonenumber(raw_number, region='RU'):
+    """
+    Приводит номер телефона к формату E.164: «8 (916) 123-45-67» → «+79161234567».
+    Возвращает None для пустых и некорректных номеров.
+    """
+    raw_number = str(raw_number or '').strip()
+    if not raw_number:
+        return None
+    try:
+        parsed = phonenumbers.parse(raw_number, region)
+    except phonenumbers.NumberParseException:
+        return None
+    if not phonenumbers.is_valid_number(parsed):
+        return None
+    return phonenumbers.format_number(parsed, phonenumbers.PhoneNumberFormat.E164)
+
+
+def normalize_order_phonenumber(order):
+    """
+    Нормализует номер заказа на месте. Возвращает True, если номер изменился.
+    Сравнивает с исходной строкой из базы: PhoneNumber при выводе уже
+    форматирует номер и скрыл бы, что в таблице он записан иначе.
+    """
+    raw_number = getattr(order.phonenumber, 'raw_input', None) or str(order.phonenumber or '')
+    normalized = normalize_phonenumber(raw_number)
+    if normalized is None or normalized == raw_number:
+        return False
+    order.phonenumber = normalized
+    return True
@@ -0,0 +1,41 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from geocoding.signals import coordinates_changed
+from star_burger.versioning import bump_cache_version
+
+from .availability import availability_index
+from .catalog import CATALOG_VERSION_KEY
+from .models import Product, ProductCategory, Restaurant, RestaurantMenuItem
+from .nearby import restaurant_index
+
+
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_availability(sender, instance, **kwargs):
+    product_ids = {instance.product_id, instance.loaded_product_id}
+    product_ids.discard(None)
+    transaction.on_commit(lambda: availability_index.mark_dirty(*product_ids))
+
+
+@receiver(post_save, sender=Restaurant)
+@receiver(post_delete, sender=Restaurant)
+def invalidate_restaurant_index(sender, instance, **kwargs):
+    restaurant_id = instance.pk
+    transaction.on_commit(lambda: restaurant_index.mark_dirty(restaurant_ids=[restaurant_id]))
+
+
+@receiver(coordinates_changed)
+def refresh_restaurant_locations(sender, location_ids, **kwargs):
+    transaction.on_commit(lambda: restaurant_index.mark_dirty(location_ids=location_ids))
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=ProductCategory)
+@receiver(post_delete, sender=ProductCategory)
+@receiver(post_save, sender=RestaurantMenuItem)
+@receiver(post_delete, sender=RestaurantMenuItem)
+def invalidate_catalog(sender, **kwargs):
+    transaction.on_commit(lambda: bump_cache_version(CATALOG_VERSION_KEY))
@@ -0,0 +1,806 @@
+import json
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.db import connection
+from django.test import AsyncRequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from foodcartapp.availability import AVAILABILITY_VERSION_KEY, availability_index
+from foodcartapp.models import (
+    BatchCheckpoint, IdempotencyKey, Order, OrderItem, Product, ProductCategory, Restaurant,
+    RestaurantMenuItem,
+)
+from foodcartapp.nearby import restaurant_index
+from foodcartapp.throttling import api_concurrency_limiter
+from foodcartapp.views import product_list_api_async, register_order_async
+from geocoding.models import Location
+from geocoding.utils import save_coordinates
+from star_burger.metrics import registry
+from star_burger.versioning import bump_cache_version
+
+
+class RegisterOrderTest(TestCase):
+    # SELECT товаров, SAVEPOINT, SELECT локации, INSERT заказа, INSERT позиций,
+    # INSERT в очередь геокодирования, RELEASE SAVEPOINT
+    EXPECTED_QUERIES = 7
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Бургер {index}', price=100 + index, image='burger.jpg')
+            for index in range(5)
+        ]
+        Location.objects.create(address='Москва, Тверская 1')
+
+    def setUp(self):
+        # Вёдра токенов живут в кэше между тестами
+        cache.clear()
+
+    def make_order(self, products):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Тверская 1',
+            'products': [{'product': product.id, 'quantity': 2} for product in products],
+        }
+
+    def test_query_count_does_not_depend_on_cart_size(self):
+        for products in (self.products[:1], self.products):
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self.client.post(
+                    '/api/order/',
+                    self.make_order(products),
+                    content_type='application/json',
+                )
+            self.assertEqual(response.status_code, 201)
+
+    def test_items_get_current_product_prices(self):
+        response = self.client.post(
+            '/api/order/',
+            self.make_order(self.products[:2]),
+            content_type='application/json',
+        )
+
+        order = Order.objects.get(id=response.json()['id'])
+        self.assertEqual(
+            sorted(order.items.values_list('price', flat=True)),
+            [product.price for product in self.products[:2]],
+        )
+        self.assertEqual(order.total_price, 2 * (self.products[0].price + self.products[1].price))
+
+    def test_unknown_product_is_rejected(self):
+        order = self.make_order(self.products[:1])
+        order['products'].append({'product': 999, 'quantity': 1})
+
+        response = self.client.post('/api/order/', order, content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'products': ['Недопустимый первичный ключ "999"']})
+
+
+@override_settings(PARTNER_API_TOKENS=['partner-token'], ORDERS_BATCH_MAX_SIZE=3)
+class RegisterOrdersBatchTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.products = [
+            Product.objects.create(name=f'Бургер {index}', price=100 + index, image='burger.jpg')
+            for index in range(2)
+        ]
+        cls.location = Location.objects.create(address='Москва, Тверская 1', lat=55.76, lon=37.61)
+
+    def setUp(self):
+        cache.clear()
+
+    def make_order(self, phonenumber='+79161234567', products=None):
+        return {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': phonenumber,
+            'address': 'Москва, Тверская 1',
+            'products': [
+                {'product': product.id, 'quantity': 2}
+                for product in (self.products if products is None else products)
+            ],
+        }
+
+    def post_batch(self, orders, token='partner-token'):
+        return self.client.post(
+            '/api/orders/batch/',
+            orders,
+            content_type='application/json',
+            headers={'Authorization': f'Bearer {token}'} if token else {},
+        )
+
+    def test_requires_partner_token(self):
+        self.assertEqual(self.post_batch([self.make_order()], token=None).status_code, 403)
+        self.assertEqual(self.post_batch([self.make_order()], token='wrong-token').status_code, 403)
+        self.assertFalse(Order.objects.exists())
+
+    def test_reports_results_by_index(self):
+        response = self.post_batch([
+            self.make_order(),
+            self.make_order(products=[]),
+            self.make_order(phonenumber='+79161234568', products=self.products[:1]),
+        ])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['orders']
+        self.assertEqual([result['index'] for result in results], [0, 1, 2])
+        self.assertIn('products', results[1]['errors'])
+
+        # bulk_create не вызывает save(), стоимость и Location проставляет сама вьюха
+        first, third = Order.objects.filter(id__in=[results[0]['id'], results[2]['id']]).order_by('id')
+        self.assertEqual(first.total_price, 2 * (self.products[0].price + self.products[1].price))
+        self.assertEqual(third.total_price, 2 * self.products[0].price)
+        self.assertEqual(first.location, self.location)
+        self.assertEqual(first.items.count(), 2)
+
+    def test_rejects_empty_and_oversized_batches(self):
+        empty = self.post_batch([])
+        oversized = self.post_batch([self.make_order()] * 4)
+        not_list = self.post_batch(self.make_order())
+
+        self.assertEqual(empty.status_code, 400)
+        self.assertEqual(oversized.status_code, 400)
+        self.assertEqual(not_list.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 100), 'phone': (1, 1)})
+    def test_phone_limit_applies_to_each_order(self):
+        response = self.post_batch([
+            self.make_order(),
+            self.make_order(phonenumber='8 (916) 123-45-67'),
+            self.make_order(phonenumber='+79161234568'),
+        ])
+
+        results = response.json()['orders']
+        self.assertIn('id', results[0])
+        self.assertIn('phonenumber', results[1]['errors'])
+        self.assertIn('id', results[2])
+        self.assertEqual(Order.objects.count(), 2)
+
+    def test_all_invalid_orders_give_400(self):
+        response = self.post_batch([self.make_order(products=[])])
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+
+
+class IdempotentRegisterOrderTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Location.objects.create(address='Москва, Тверская 1')
+
+    def setUp(self):
+        # Вёдра токенов живут в кэше между тестами
+        cache.clear()
+
+    def post_order(self, key, firstname='Иван'):
+        return self.client.post(
+            '/api/order/',
+            {
+                'firstname': firstname,
+                'lastname': 'Петров',
+                'phonenumber': '+79161234567',
+                'address': 'Москва, Тверская 1',
+                'products': [{'product': self.product.id, 'quantity': 2}],
+            },
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    def test_repeat_returns_stored_response_without_new_order(self):
+        first = self.post_order('order-1')
+
+        # Только SELECT ключа: ни товаров, ни заказов повтор не читает
+        with self.assertNumQueries(1):
+            repeat = self.post_order('order-1')
+
+        self.assertEqual(repeat.status_code, 201)
+        self.assertEqual(repeat.json(), first.json())
+        self.assertEqual(repeat.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_same_key_with_other_body_is_rejected(self):
+        self.post_order('order-1')
+
+        response = self.post_order('order-1', firstname='Пётр')
+
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(Order.objects.count(), 1)
+
+    @override_settings(IDEMPOTENCY_KEY_TTL=0)
+    def test_expired_key_creates_new_order(self):
+        first = self.post_order('order-1')
+        second = self.post_order('order-1')
+
+        self.assertNotEqual(first.json()['id'], second.json()['id'])
+        self.assertEqual(IdempotencyKey.objects.count(), 1)
+
+        call_command('purge_idempotency_keys', stdout=StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+@override_settings(CATALOG_MAX_AGE=60)
+class CatalogApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = ProductCategory.objects.create(name='Бургеры')
+        cls.product = Product.objects.create(
+            name='Бургер', price=100, image='burger.jpg', category=cls.category,
+        )
+        cls.restaurant = Restaurant.objects.create(name='Ресторан', address='Москва, Тверская 1')
+        cls.menu_item = RestaurantMenuItem.objects.create(restaurant=cls.restaurant, product=cls.product)
+
+    def setUp(self):
+        cache.clear()
+
+    def get_catalog(self, **headers):
+        return self.client.get('/api/products/', headers=headers)
+
+    def assertCatalogChanges(self, change):
+        """Правка внутри on_commit меняет ETag и отдаёт новые данные. Возвращает новый каталог."""
+        before = self.get_catalog()
+        with self.captureOnCommitCallbacks(execute=True):
+            change()
+
+        after = self.get_catalog(**{'If-None-Match': before['ETag']})
+
+        self.assertEqual(after.status_code, 200)
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        return json.loads(after.content)
+
+    def test_sync_catalog_sets_etag_and_cache_control(self):
+        response = self.get_catalog()
+        repeat = self.get_catalog(**{'If-None-Match': response['ETag']})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['ETag'])
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=60', response['Cache-Control'])
+        self.assertEqual([product['name'] for product in json.loads(response.content)], ['Бургер'])
+        self.assertEqual(repeat.status_code, 304)
+        self.assertEqual(repeat.content, b'')
+
+    def test_product_save_updates_catalog(self):
+        def change():
+            product = Product.objects.get(pk=self.product.pk)
+            product.price = 150
+            product.save()
+
+        self.assertEqual(self.assertCatalogChanges(change)[0]['price'], 150)
+
+    def test_product_delete_updates_catalog(self):
+        self.assertEqual(self.assertCatalogChanges(Product.objects.get(pk=self.product.pk).delete), [])
+
+    def test_category_save_updates_catalog(self):
+        def change():
+            category = ProductCategory.objects.get(pk=self.category.pk)
+            category.name = 'Закуски'
+            category.save()
+
+        self.assertEqual(self.assertCatalogChanges(change)[0]['category']['name'], 'Закуски')
+
+    def test_category_delete_updates_catalog(self):
+        catalog = self.assertCatalogChanges(ProductCategory.objects.get(pk=self.category.pk).delete)
+
+        self.assertIsNone(catalog[0]['category'])
+
+    def test_menu_item_save_updates_catalog(self):
+        def change():
+            menu_item = RestaurantMenuItem.objects.get(pk=self.menu_item.pk)
+            menu_item.availability = False
+            menu_item.save()
+
+        self.assertEqual(self.assertCatalogChanges(change), [])
+
+    def test_menu_item_delete_updates_catalog(self):
+        menu_item = RestaurantMenuItem.objects.get(pk=self.menu_item.pk)
+        self.assertEqual(self.assertCatalogChanges(menu_item.delete), [])
+
+
+class AsyncApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        Location.objects.create(address='Москва, Тверская 1')
+
+    def setUp(self):
+        cache.clear()
+        self.factory = AsyncRequestFactory()
+
+    def post_order(self, products, key):
+        return self.factory.post(
+            '/api/order/',
+            {
+                'firstname': 'Иван',
+                'lastname': 'Петров',
+                'phonenumber': '+79161234567',
+                'address': 'Москва, Тверская 1',
+                'products': [{'product': product_id, 'quantity': 2} for product_id in products],
+            },
+            content_type='application/json',
+            headers={'Idempotency-Key': key},
+        )
+
+    async def test_register_order_async_creates_and_replays_order(self):
+        response = await register_order_async(self.post_order([self.product.id], 'order-1'))
+        repeat = await register_order_async(self.post_order([self.product.id], 'order-1'))
+
+        self.assertEqual(response.status_code, 201)
+        order = await Order.objects.aget(id=json.loads(response.content)['id'])
+        self.assertEqual(order.total_price, 200)
+        self.assertEqual(json.loads(repeat.content), json.loads(response.content))
+        self.assertEqual(repeat.headers['Idempotent-Replayed'], 'true')
+        self.assertEqual(await Order.objects.acount(), 1)
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 100), 'phone': (1, 1)})
+    async def test_register_order_async_replays_despite_throttling(self):
+        first = await register_order_async(self.post_order([self.product.id], 'order-1'))
+        retry = await register_order_async(self.post_order([self.product.id], 'order-1'))
+        another = await register_order_async(self.post_order([self.product.id], 'order-2'))
+
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(json.loads(retry.content), json.loads(first.content))
+        self.assertEqual(another.status_code, 429)
+
+    async def test_register_order_async_rejects_unknown_product(self):
+        response = await register_order_async(self.post_order([999], 'order-2'))
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            json.loads(response.content),
+            {'products': ['Недопустимый первичный ключ "999"']},
+        )
+
+    async def test_product_list_async_answers_not_modified(self):
+        response = await product_list_api_async(self.factory.get('/api/products/'))
+        repeat = await product_list_api_async(
+            self.factory.get('/api/products/', headers={'If-None-Match': response['ETag']})
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(repeat.status_code, 304)
+
+
+class ThrottlingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def post_order(self, phonenumber, ip='10.0.0.1'):
+        return self.client.post(
+            '/api/order/',
+            {'phonenumber': phonenumber},
+            content_type='application/json',
+            REMOTE_ADDR=ip,
+        )
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 2), 'phone': (60, 10)})
+    def test_ip_bucket_returns_429_with_retry_after(self):
+        for _ in range(2):
+            self.assertEqual(self.client.get('/api/products/', REMOTE_ADDR='10.0.0.1').status_code, 200)
+
+        response = self.client.get('/api/products/', REMOTE_ADDR='10.0.0.1')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.client.get('/api/products/', REMOTE_ADDR='10.0.0.2').status_code, 200)
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 2), 'phone': (60, 10)})
+    def test_spoofed_forwarded_for_does_not_reset_ip_bucket(self):
+        statuses = [
+            self.client.get(
+                '/api/products/',
+                REMOTE_ADDR='10.0.0.1',
+                headers={'X-Forwarded-For': f'192.168.0.{index}'},
+            ).status_code
+            for index in range(4)
+        ]
+
+        self.assertEqual(statuses, [200, 200, 429, 429])
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 100), 'phone': (1, 1)})
+    def test_idempotent_retry_is_not_throttled(self):
+        order = {
+            'firstname': 'Иван',
+            'lastname': 'Петров',
+            'phonenumber': '+79161234567',
+            'address': 'Москва, Тверская 1',
+            'products': [{'product': Product.objects.create(name='Бургер', price=100, image='burger.jpg').id, 'quantity': 1}],
+        }
+
+        def post(key):
+            return self.client.post(
+                '/api/order/', order, content_type='application/json', headers={'Idempotency-Key': key},
+            )
+
+        first = post('order-1')
+        retry = post('order-1')
+        another = post('order-2')
+
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(another.status_code, 429)
+
+    @override_settings(API_THROTTLE_RATES={'ip': (60, 100), 'phone': (1, 2)})
+    def test_phone_bucket_counts_one_number_across_addresses(self):
+        self.post_order('+79161234567', ip='10.0.0.1')
+        self.post_order('8 (916) 123-45-67', ip='10.0.0.2')
+
+        response = self.post_order('+79161234567', ip='10.0.0.3')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response.headers['Retry-After'], '60')
+        self.assertEqual(self.post_order('+79161234568', ip='10.0.0.3').status_code, 400)
+
+    @override_settings(API_MAX_CONCURRENT_REQUESTS=1)
+    def test_sheds_load_over_concurrency_cap(self):
+        # Занимаем единственный слот, как будто идёт долгий запрос
+        api_concurrency_limiter.try_acquire(1)
+        try:
+            response = self.client.get('/api/products/')
+        finally:
+            api_concurrency_limiter.release()
+
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.headers['Retry-After'], '1')
+        self.assertEqual(self.client.get('/api/products/').status_code, 200)
+
+
+class AvailabilityIndexTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.restaurants = [
+            Restaurant.objects.create(name=f'Ресторан {index}', address=f'Москва, Тверская {index}')
+            for index in range(2)
+        ]
+        cls.burger, cls.fries = [
+            Product.objects.create(name=name, price=100, image='burger.jpg')
+            for name in ('Бургер', 'Картошка')
+        ]
+        cls.menu_items = [
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.burger)
+            for restaurant in cls.restaurants
+        ]
+
+    def setUp(self):
+        cache.clear()
+        availability_index.reset()
+        self.ids = [restaurant.id for restaurant in self.restaurants]
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), self.ids)
+
+    def assertReloadsOnly(self, product_ids):
+        """Индекс перечитывает одним запросом только строки изменённых продуктов."""
+        with CaptureQueriesContext(connection) as queries:
+            availability_index.restaurants_for([self.burger.id])
+        self.assertEqual(len(queries), 1)
+        sql = queries[0]['sql']
+        self.assertIn('"product_id" IN', sql)
+        for product_id in product_ids:
+            self.assertIn(str(product_id), sql)
+
+    def test_created_item_reloads_its_product(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.create(restaurant=self.restaurants[1], product=self.fries)
+
+        self.assertReloadsOnly([self.fries.id])
+        self.assertEqual(availability_index.restaurants_for([self.burger.id, self.fries.id]), self.ids[1:])
+
+    def test_updated_item_reloads_old_and_new_product(self):
+        menu_item = RestaurantMenuItem.objects.get(pk=self.menu_items[0].pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item.product = self.fries
+            menu_item.save()
+
+        self.assertReloadsOnly([self.burger.id, self.fries.id])
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), self.ids[1:])
+        self.assertEqual(availability_index.restaurants_for([self.fries.id]), self.ids[:1])
+
+    def test_unavailable_item_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            menu_item = RestaurantMenuItem.objects.get(pk=self.menu_items[0].pk)
+            menu_item.availability = False
+            menu_item.save()
+
+        self.assertReloadsOnly([self.burger.id])
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), self.ids[1:])
+
+    def test_deleted_item_is_dropped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.get(pk=self.menu_items[0].pk).delete()
+
+        self.assertReloadsOnly([self.burger.id])
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), self.ids[1:])
+
+    def test_change_in_another_worker_rebuilds_index(self):
+        RestaurantMenuItem.objects.filter(pk=self.menu_items[0].pk).update(availability=False)
+        bump_cache_version(AVAILABILITY_VERSION_KEY)
+
+        with CaptureQueriesContext(connection) as queries:
+            restaurants = availability_index.restaurants_for([self.burger.id])
+
+        self.assertEqual(restaurants, self.ids[1:])
+        self.assertNotIn(' IN ', queries[0]['sql'])
+
+    def test_snapshot_is_not_changed_by_later_updates(self):
+        bits = availability_index.snapshot()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.get(pk=self.menu_items[0].pk).delete()
+
+        self.assertEqual(availability_index.restaurants_for([self.burger.id], bits), self.ids)
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), self.ids[1:])
+
+    def test_queryset_delete_drops_items(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            RestaurantMenuItem.objects.filter(product=self.burger).delete()
+
+        self.assertReloadsOnly([self.burger.id])
+        self.assertEqual(availability_index.restaurants_for([self.burger.id]), [])
+
+
+class NearestRestaurantsApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.burger = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        cls.fries = Product.objects.create(name='Картофель фри', price=50, image='fries.jpg')
+        cls.restaurants = []
+        for index, coords in enumerate([(55.76, 37.61), (55.70, 37.50), (59.93, 30.31)]):
+            restaurant = Restaurant.objects.create(name=f'Ресторан {index}', address=f'Адрес {index}')
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.burger)
+            Location.objects.filter(pk=restaurant.location_id).update(lat=coords[0], lon=coords[1])
+            cls.restaurants.append(restaurant)
+        RestaurantMenuItem.objects.create(restaurant=cls.restaurants[1], product=cls.fries)
+
+    def setUp(self):
+        availability_index.reset()
+        restaurant_index.reset()
+
+    def get_nearest(self, **params):
+        response = self.client.get('/api/restaurants/nearest/', params)
+        self.assertEqual(response.status_code, 200)
+        return [restaurant['id'] for restaurant in response.json()]
+
+    def test_returns_restaurants_within_radius_by_distance(self):
+        self.assertEqual(
+            self.get_nearest(lat=55.75, lon=37.62, radius=100),
+            [self.restaurants[0].id, self.restaurants[1].id],
+        )
+        self.assertEqual(self.get_nearest(lat=55.75, lon=37.62, limit=1), [self.restaurants[0].id])
+
+    def test_filters_by_products(self):
+        self.assertEqual(
+            self.get_nearest(lat=55.75, lon=37.62, products=f'{self.burger.id},{self.fries.id}'),
+            [self.restaurants[1].id],
+        )
+
+    def test_index_follows_geocoded_address_change(self):
+        self.get_nearest(lat=59.93, lon=30.31)
+        restaurant = self.restaurants[0]
+
+        with self.captureOnCommitCallbacks(execute=True):
+            restaurant.address = 'Санкт-Петербург, Невский 1'
+            restaurant.save()
+        with self.captureOnCommitCallbacks(execute=True):
+            save_coordinates({restaurant.address: (59.93, 30.32)})
+
+        self.assertEqual(
+            self.get_nearest(lat=59.93, lon=30.31, radius=5),
+            [self.restaurants[2].id, restaurant.id],
+        )
+
+    def test_invalid_coordinates_are_rejected(self):
+        response = self.client.get('/api/restaurants/nearest/', {'lat': 100, 'lon': 37.62})
+        self.assertEqual(response.status_code, 400)
+
+
+class BenchmarkCommandsTest(TestCase):
+    def test_benchmarks_run_offline_on_synthetic_data(self):
+        call_command(
+            'generate_synthetic_data',
+            restaurants=5, products=10, orders=20, menu_density=1, stdout=StringIO(),
+        )
+        orders_count = Order.objects.count()
+        output = StringIO()
+
+        call_command('run_benchmarks', repeat=1, stdout=output)
+
+        report = json.loads(output.getvalue())
+        self.assertEqual(
+            set(report['benchmarks']),
+            {'product_list_api', 'register_order', 'view_orders', 'view_products', 'with_available_restaurants'},
+        )
+        self.assertEqual(report['dataset']['orders'], orders_count)
+        self.assertGreater(report['benchmarks']['register_order']['queries'], 0)
+        # Заказы, созданные бенчмарком, откатываются
+        self.assertEqual(Order.objects.count(), orders_count)
+
+
+@override_settings(METRICS_TOKEN=None)
+class MetricsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(DEBUG=True)
+    def test_metrics_endpoint_reports_requests_by_url_name(self):
+        self.client.get('/api/products/')
+        self.client.get('/api/products/')
+
+        response = self.client.get('/metrics')
+
+        self.assertEqual(response.status_code, 200)
+        content = response.content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds histogram', content)
+        self.assertIn('catalog_cache_requests_total{result="hit"}', content)
+        self.assertRegex(
+            content,
+            r'http_request_db_queries_count\{view="foodcartapp:foodcartapp.views.product_list_api"\} \d+',
+        )
+
+    def db_queries(self, view):
+        key = ('http_request_db_queries', (('view', view),))
+        _, _, total, count = registry.snapshot()['histograms'].get(key, (None, None, 0, 0))
+        return total, count
+
+    async def test_queries_are_counted_under_asgi(self):
+        view = 'foodcartapp:foodcartapp.views.product_list_api'
+        total_before, count_before = self.db_queries(view)
+
+        # Промах кэша каталога: ORM работает в потоке sync_to_async, а не в потоке middleware
+        response = await self.async_client.get('/api/products/')
+
+        self.assertEqual(response.status_code, 200)
+        total, count = self.db_queries(view)
+        self.assertEqual(count, count_before + 1)
+        self.assertGreater(total, total_before)
+
+    def test_metrics_are_closed_without_token_outside_debug(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_require_token_when_configured(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+
+class NormalizePhonenumbersTest(TestCase):
+    def create_order(self, phonenumber):
+        return Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber=phonenumber, address='Москва, Тверская 1',
+        )
+
+    def get_phonenumbers(self):
+        return list(Order.objects.order_by('id').values_list('phonenumber', flat=True))
+
+    def test_normalizes_in_chunks_and_records_progress(self):
+        for phonenumber in ('8 916 123-45-67', '+79161234568', '8 (916) 123-45-69', 'не номер'):
+            self.create_order(phonenumber)
+
+        call_command('normalize_phonenumbers', chunk_size=2, stdout=StringIO())
+
+        self.assertEqual(
+            self.get_phonenumbers(),
+            ['+79161234567', '+79161234568', '+79161234569', 'не номер'],
+        )
+        checkpoint = BatchCheckpoint.objects.get(name='normalize_phonenumbers')
+        self.assertEqual((checkpoint.processed, checkpoint.updated), (4, 2))
+        self.assertIsNotNone(checkpoint.finished_at)
+
+    def test_resumes_after_interrupted_run(self):
+        first = self.create_order('8 916 123-45-67')
+        self.create_order('8 916 123-45-68')
+        BatchCheckpoint.objects.create(name='normalize_phonenumbers', last_pk=first.id, processed=1)
+
+        call_command('normalize_phonenumbers', stdout=StringIO())
+
+        self.assertEqual(self.get_phonenumbers(), ['8 916 123-45-67', '+79161234568'])
+        self.assertEqual(BatchCheckpoint.objects.get(name='normalize_phonenumbers').processed, 2)
+
+
+class OrderTotalsTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+
+    def create_order(self, *items):
+        order = Order.objects.create(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address='Москва, Тверская 1',
+        )
+        for quantity, price in items:
+            OrderItem.objects.create(order=order, product=self.product, quantity=quantity, price=price)
+        return order
+
+    def test_backfill_fills_totals_and_keeps_correct_orders_untouched(self):
+        stale = self.create_order((2, 150), (1, 10))
+        empty = self.create_order()
+        correct = self.create_order((1, 100))
+        correct.update_total_price()
+        Order.objects.filter(pk=stale.pk).update(total_price=0)
+        correct_updated_at = Order.objects.get(pk=correct.pk).updated_at
+
+        call_command('backfill_order_totals', chunk_size=2, only_mismatched=True, stdout=StringIO())
+
+        totals = dict(Order.objects.values_list('id', 'total_price'))
+        self.assertEqual(totals, {stale.id: 310, empty.id: 0, correct.id: 100})
+        # Доска менеджера не должна получить неизменённые заказы как новые
+        self.assertEqual(Order.objects.get(pk=correct.pk).updated_at, correct_updated_at)
+        checkpoint = BatchCheckpoint.objects.get(name='backfill_order_totals')
+        self.assertEqual(checkpoint.updated, 1)
+
+    def test_check_reports_mismatched_orders(self):
+        order = self.create_order((2, 150))
+        order.update_total_price()
+        call_command('check_order_totals', stdout=StringIO())
+
+        Order.objects.filter(pk=order.pk).update(total_price=1)
+        stdout = StringIO()
+        with self.assertRaisesMessage(CommandError, 'Расхождений: 1'):
+            call_command('check_order_totals', stdout=stdout)
+        self.assertIn(f'Заказ {order.id}: сохранено 1.00, по позициям 300', stdout.getvalue())
+
+    def test_admin_inline_changes_update_total(self):
+        order = self.create_order((1, 100))
+        item = order.items.get()
+        self.client.force_login(User.objects.create_superuser('admin', password='secret'))
+
+        response = self.client.post(
+            reverse('admin:foodcartapp_order_change', args=(order.id,)),
+            {
+                'firstname': order.firstname,
+                'lastname': order.lastname,
+                'phonenumber': order.phonenumber,
+                'address': order.address,
+                'status': 'UNPROCESSED',
+                'payment_method': 'CASH',
+                'comment': '',
+                'items-TOTAL_FORMS': 2,
+                'items-INITIAL_FORMS': 1,
+                'items-0-id': item.id,
+                'items-0-order': order.id,
+                'items-0-product': self.product.id,
+                'items-0-quantity': 3,
+                'items-0-price': 100,
+                'items-1-order': order.id,
+                'items-1-product': self.product.id,
+                'items-1-quantity': 1,
+                'items-1-price': 50,
+            },
+        )
+
+        self.assertEqual(response.status_code, 302)
+        order.refresh_from_db()
+        self.assertEqual(order.total_price, 350)
+
+
+class AdminInlinesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', password='secret')
+        cls.restaurant = Restaurant.objects.create(name='Ресторан', address='Москва, Тверская 1')
+        products = Product.objects.bulk_create([
+            Product(name=f'Товар {index}', price=100, image='burger.jpg')
+            for index in range(30)
+        ])
+        RestaurantMenuItem.objects.bulk_create([
+            RestaurantMenuItem(restaurant=cls.restaurant, product=product)
+            for product in products[:3]
+        ])
+
+    def test_menu_inline_does_not_render_whole_catalog(self):
+        self.client.force_login(self.admin)
+
+        response = self.client.get(
+            reverse('admin:foodcartapp_restaurant_change', args=(self.restaurant.id,))
+        )
+
+        self.assertContains(response, 'Товар 2')
+        # Виджет автодополнения выводит только выбранные товары, остальные подгружает поиском
+        self.assertNotContains(response, 'Товар 29')
@@ -0,0 +1,205 @@
+import threading
+import time
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from star_burger.metrics import registry
+
+from .phones import normalize_phonenumber
+
+THROTTLE_KEY_PREFIX = 'throttle:'
+
+
+class TokenBucketStore:
+    """
+    Вёдра токенов в кэше Django, общие для всех воркеров.
+
+    Ведро хранится парой (токенов осталось, когда пересчитано), токены
+    доливаются со скоростью rate в секунду до capacity. Чтение и запись
+    не атомарны, поэтому при одновременных запросах от одного клиента
+    воркеры могут пропустить пару лишних запросов — для защиты от
+    перегрузки этого достаточно. Если кэш недоступен, вёдра ведутся
+    в памяти процесса, и лимит действует для каждого воркера отдельно.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = {}
+
+    def consume(self, key, rate, capacity):
+        """
+        Забирает токен из ведра. Возвращает (пропустить ли запрос,
+        сколько секунд ждать следующего токена).
+        """
+        key = THROTTLE_KEY_PREFIX + key
+        try:
+            return self._consume(key, rate, capacity, cache.get, cache.set)
+        except Exception:
+            with self._lock:
+                return self._consume(key, rate, capacity, self._local.get, self._set_local)
+
+    def clear(self):
+        with self._lock:
+            self._local.clear()
+
+    def _consume(self, key, rate, capacity, get, set_):
+        now = time.time()
+        tokens, updated_at = get(key) or (capacity, now)
+        tokens = min(capacity, tokens + (now - updated_at) * rate)
+        allowed = tokens >= 1
+        if allowed:
+            tokens -= 1
+        # Полное ведро ничем не отличается от отсутствующего, запись можно забыть
+        set_(key, (tokens, now), int((capacity - tokens) / rate) + 1)
+        return allowed, 0 if allowed else (1 - tokens) / rate
+
+    def _set_local(self, key, value, timeout):
+        self._local[key] = value
+
+
+bucket_store = TokenBucketStore()
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Троттлинг DRF на вёдрах токенов. Наследники задают scope и get_key(),
+    а скорость и размер ведра берутся из настроек API_THROTTLE_RATES.
+    """
+    scope = None
+
+    def allow_request(self, request, view):
+        return self.allow_key(self.get_key(request))
+
+    def allow_key(self, key):
+        self.wait_seconds = None
+        if not settings.API_THROTTLE_ENABLED or key is None:
+            return True
+
+        per_minute, capacity = settings.API_THROTTLE_RATES[self.scope]
+        allowed, self.wait_seconds = bucket_store.consume(
+            f'{self.scope}:{key}', per_minute / 60, capacity
+        )
+        if not allowed:
+            registry.inc('api_rejected_requests_total', reason=self.scope)
+        return allowed
+
+    def get_key(self, request):
+        raise NotImplementedError
+
+    def wait(self):
+        return self.wait_seconds
+
+
+class IPTokenBucketThrottle(TokenBucketThrottle):
+    """
+    Адрес клиента берётся из X-Forwarded-For, только если перед сайтом
+    стоит NUM_PROXIES доверенных прокси, иначе из REMOTE_ADDR: подменив
+    заголовок, клиент получал бы новое ведро на каждый запрос.
+    """
+    scope = 'ip'
+
+    def get_key(self, request):
+        return self.get_ident(request)
+
+
+class PhoneTokenBucketThrottle(TokenBucketThrottle):
+    """Ограничивает заказы на один номер телефона, с какого бы адреса они ни шли."""
+    scope = 'phone'
+
+    def get_key(self, request):
+        if request.method != 'POST' or not hasattr(request.data, 'get'):
+            return None
+        return normalize_phonenumber(request.data.get('phonenumber'))
+
+    def allow_phonenumber(self, phonenumber):
+        """Проверка одного номера, например для каждого заказа из пакета."""
+        return self.allow_key(normalize_phonenumber(phonenumber))
+
+
+class ConcurrencyLimiter:
+    """
+    Счётчик запросов, которые воркер обрабатывает прямо сейчас.
+    Лимит действует на процесс: общий счётчик в кэше терял бы слоты
+    упавших воркеров, а число воркеров и так задаётся при запуске.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.active = 0
+
+    def try_acquire(self, limit):
+        with self._lock:
+            if limit and self.active >= limit:
+                return False
+            self.active += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+
+
+api_concurrency_limiter = ConcurrencyLimiter()
+
+
+def check_throttles(request, throttle_classes):
+    """
+    Проверяет троттлинг для вьюх, которые не проходят через APIView DRF,
+    например асинхронных. Как и DRF, опрашивает все троттлы, чтобы каждый
+    списал свой токен. Возвращает ответ 429 или None.
+    """
+    waits = []
+    for throttle_class in throttle_classes:
+        throttle = throttle_class()
+        if not throttle.allow_request(request, None):
+            waits.append(throttle.wait())
+    if not waits:
+        return None
+    error = Throttled(max(waits))
+    response = JsonResponse({'detail': error.detail}, status=429)
+    response['Retry-After'] = str(error.wait)
+    return response
+
+
+def shed_load(view):
+    """
+    Отвечает 503 сразу, если воркер уже обрабатывает
+    API_MAX_CONCURRENT_REQUESTS запросов к API. Ставится над @api_view,
+    чтобы лишний запрос отсекался до разбора тела и похода в базу.
+    Годится и для асинхронных вьюх.
+    """
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not api_concurrency_limiter.try_acquire(settings.API_MAX_CONCURRENT_REQUESTS):
+                return overloaded_response()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                api_concurrency_limiter.release()
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not api_concurrency_limiter.try_acquire(settings.API_MAX_CONCURRENT_REQUESTS):
+            return overloaded_response()
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            api_concurrency_limiter.release()
+
+    return wrapper
+
+
+def overloaded_response():
+    registry.inc('api_rejected_requests_total', reason='concurrency')
+    response = JsonResponse({'detail': 'Сервис перегружен, повторите запрос позже'}, status=503)
+    response['Retry-After'] = str(settings.API_SHED_RETRY_AFTER)
+    return response
@@ -1,12 +1,27 @@
+from django.conf import settings
 from django.urls import path
 
-from .views import product_list_api, banners_list_api, register_order
+from .views import (
+    product_list_api,
+    product_list_api_async,
+    banners_list_api,
+    banners_list_api_async,
+    nearest_restaurants_api,
+    register_order,
+    register_order_async,
+    register_orders_batch,
+)
 
 
 app_name = "foodcartapp"
 
+# Под ASGI горячие эндпоинты отвечают асинхронными вьюхами
+ASYNC_API = settings.ASYNC_API
+
 urlpatterns = [
-    path('products/', product_list_api),
-    path('banners/', banners_list_api),
-    path('order/', register_order),
+    path('products/', product_list_api_async if ASYNC_API else product_list_api),
+    path('banners/', banners_list_api_async if ASYNC_API else banners_list_api),
+    path('restaurants/nearest/', nearest_restaurants_api),
+    path('order/', register_order_async if ASYNC_API else register_order),
+    path('orders/batch/', register_orders_batch),
 ]
@@ -1,10 +1,29 @@
-from django.db import transaction
-from .models import Order, OrderItem, Product
-from rest_framework.decorators import api_view
+import hashlib
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET, require_POST
+from django.utils.cache import get_conditional_response, patch_cache_control
+from .availability import availability_index
+from .catalog import get_catalog
+from .models import IdempotencyKey, Order, OrderItem, Product, Restaurant
+from .nearby import restaurant_index
+from .permissions import HasPartnerToken
+from .throttling import IPTokenBucketThrottle, PhoneTokenBucketThrottle, check_throttles, shed_load
+from rest_framework.decorators import api_view, permission_classes, throttle_classes
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.request import Request
 from rest_framework.response import Response
 from django.templatetags.static import static
 from rest_framework import serializers
 from phonenumber_field.serializerfields import PhoneNumberField
+from geocoding.models import Location
+from geocoding.utils import enqueue_addresses
 
 
 class ProductOrderSerializer(serializers.Serializer):
@@ -26,19 +45,46 @@ class OrderSerializer(serializers.Serializer):
     )
 
     def validate_products(self, value):
+        """
+        Проверяет, что товары существуют, и подставляет вместо ID сами товары
+        (только id и цену), чтобы при создании заказа не запрашивать их снова.
+        """
         product_ids = [item['product'] for item in value]
-        existing_ids = set(Product.objects.filter(id__in=product_ids).values_list('id', flat=True))
-        missing_ids = set(product_ids) - existing_ids
+        # При пакетной загрузке товары всех заказов уже получены одним запросом
+        products = self.context.get('products')
+        if products is None:
+            products = {
+                product.id: product
+                for product in Product.objects.filter(id__in=product_ids).only('id', 'price')
+            }
+        missing_ids = set(product_ids) - set(products)
         if missing_ids:
             raise serializers.ValidationError(
                 f'Недопустимый первичный ключ "{sorted(missing_ids)[0]}"'
             )
-        return value
+        return [
+            {**item, 'product': products[item['product']]}
+            for item in value
+        ]
 
 
-@api_view(['GET'])
-def banners_list_api(request):
-    return Response([
+class NearestRestaurantsQuerySerializer(serializers.Serializer):
+    lat = serializers.FloatField(min_value=-90, max_value=90)
+    lon = serializers.FloatField(min_value=-180, max_value=180)
+    products = serializers.CharField(required=False, allow_blank=True)
+    limit = serializers.IntegerField(min_value=1, max_value=100, required=False)
+    radius = serializers.FloatField(min_value=0, required=False)
+
+    def validate_products(self, value):
+        """Разбирает список ID товаров через запятую: «1,2,3»."""
+        try:
+            return {int(product_id) for product_id in value.split(',') if product_id.strip()}
+        except ValueError:
+            raise serializers.ValidationError('Ожидается список ID товаров через запятую')
+
+
+def get_banners():
+    return [
         {
             'title': 'Burger',
             'src': static('burger.jpg'),
@@ -54,56 +100,355 @@ def banners_list_api(request):
             'src': static('tasty.jpg'),
             'text': 'Food is incomplete without a tasty dessert',
         }
-    ])
+    ]
 
 
+@shed_load
+@api_view(['GET'])
+def banners_list_api(request):
+    return Response(get_banners())
+
+
+@shed_load
 @api_view(['GET'])
 def product_list_api(request):
-    products = Product.objects.select_related('category').available()
-
-    dumped_products = []
-    for product in products:
-        dumped_product = {
-            'id': product.id,
-            'name': product.name,
-            'price': product.price,
-            'special_status': product.special_status,
-            'description': product.description,
-            'category': {
-                'id': product.category.id,
-                'name': product.category.name,
-            } if product.category else None,
-            'image': product.image.url,
+    etag, content = get_catalog()
+    return catalog_response(request, etag, content)
+
+
+def catalog_response(request, etag, content):
+    response = HttpResponse(content, content_type='application/json')
+    response['ETag'] = etag
+    patch_cache_control(response, public=True, max_age=settings.CATALOG_MAX_AGE)
+    # Если у клиента та же версия каталога, отвечаем 304 без тела
+    return get_conditional_response(request, etag=etag, response=response) or response
+
+
+@shed_load
+@require_GET
+async def banners_list_api_async(request):
+    throttled = await sync_to_async(check_throttles)(request, [IPTokenBucketThrottle])
+    return throttled or JsonResponse(get_banners(), safe=False)
+
+
+@shed_load
+@require_GET
+async def product_list_api_async(request):
+    """
+    Асинхронная версия product_list_api. Каталог почти всегда берётся
+    из кэша, база нужна только после правок товаров.
+    """
+    throttled = await sync_to_async(check_throttles)(request, [IPTokenBucketThrottle])
+    if throttled is not None:
+        return throttled
+    etag, content = await sync_to_async(get_catalog)()
+    return catalog_response(request, etag, content)
+
+
+@shed_load
+@api_view(['GET'])
+def nearest_restaurants_api(request):
+    """
+    Ближайшие к точке рестораны, которые могут приготовить все переданные товары.
+    Кандидаты ищутся по пространственному индексу, из БД читаются только
+    рестораны, попавшие в ответ.
+    """
+    serializer = NearestRestaurantsQuerySerializer(data=request.query_params)
+    serializer.is_valid(raise_exception=True)
+    params = serializer.validated_data
+
+    allowed_ids = None
+    if params.get('products'):
+        allowed_ids = set(availability_index.restaurants_for(params['products']))
+
+    nearest = []
+    if allowed_ids is None or allowed_ids:
+        nearest = restaurant_index.nearest(
+            (params['lat'], params['lon']),
+            k=params.get('limit', settings.NEAREST_RESTAURANTS_LIMIT),
+            radius_km=params.get('radius', settings.RESTAURANT_SEARCH_RADIUS_KM),
+            allowed_ids=allowed_ids,
+        )
+
+    restaurants = Restaurant.objects.in_bulk(
+        [restaurant_id for restaurant_id, _ in nearest]
+    )
+    return Response([
+        {
+            'id': restaurant_id,
+            'name': restaurants[restaurant_id].name,
+            'address': restaurants[restaurant_id].address,
+            'distance': round(distance, 3),
         }
-        dumped_products.append(dumped_product)
-    return Response(dumped_products)
+        for restaurant_id, distance in nearest
+        if restaurant_id in restaurants
+    ])
+
 
+ORDER_THROTTLES = [IPTokenBucketThrottle, PhoneTokenBucketThrottle]
+
+
+@shed_load
 @api_view(['POST'])
+# Троттлинг проверяется в самой вьюхе после поиска сохранённого ответа
+@throttle_classes([])
 def register_order(request):
+    idempotency_key = request.headers.get('Idempotency-Key')
+    request_hash = None
+    if idempotency_key is not None:
+        if not is_valid_idempotency_key(idempotency_key):
+            return Response({'error': 'Некорректный заголовок Idempotency-Key'}, status=400)
+        # Повтор отвечаем одним запросом к таблице ключей, без товаров и заказов
+        request_hash = hash_request_data(request.data)
+        stored = find_stored_response(idempotency_key, request_hash)
+        if stored is not None:
+            return Response(stored[1], status=stored[0], headers=stored[2])
+
+    # Повторы уже созданных заказов не упираются в лимиты: именно их клиент
+    # шлёт, когда сеть подвела, и они должны получить сохранённый ответ
+    throttled = check_throttles(request, ORDER_THROTTLES)
+    if throttled is not None:
+        return throttled
+
     serializer = OrderSerializer(data=request.data)
-    if serializer.is_valid():
+    if not serializer.is_valid():
+        return Response(serializer.errors, status=400)
+    try:
+        response_data = save_order(serializer.validated_data, idempotency_key, request_hash)
+    except IntegrityError:
+        stored = idempotency_key and find_stored_response(idempotency_key, request_hash)
+        if not stored:
+            raise
+        return Response(stored[1], status=stored[0], headers=stored[2])
+    return Response(response_data, status=201)
+
+
+@shed_load
+@csrf_exempt
+@require_POST
+async def register_order_async(request):
+    """
+    Асинхронная версия register_order для запуска под ASGI.
+
+    Ключ идемпотентности и товары читаются асинхронным ORM, а запись
+    заказа идёт в потоке через sync_to_async: транзакции в асинхронном
+    ORM Django пока не поддерживаются. Геокодер в запросе не вызывается,
+    адрес только ставится в очередь, поэтому медленный ответ Яндекса
+    воркер не держит.
+    """
+    drf_request = Request(request, parsers=[JSONParser()])
+    try:
+        data = drf_request.data
+    except ParseError as error:
+        return JsonResponse({'detail': error.detail}, status=400)
+
+    idempotency_key = request.headers.get('Idempotency-Key')
+    request_hash = None
+    if idempotency_key is not None:
+        if not is_valid_idempotency_key(idempotency_key):
+            return JsonResponse({'error': 'Некорректный заголовок Idempotency-Key'}, status=400)
+        request_hash = hash_request_data(data)
+        stored = await afind_stored_response(idempotency_key, request_hash)
+        if stored is not None:
+            return JsonResponse(stored[1], status=stored[0], headers=stored[2], safe=False)
+
+    throttled = await sync_to_async(check_throttles)(drf_request, ORDER_THROTTLES)
+    if throttled is not None:
+        return throttled
+
+    # Товары загружаем заранее, тогда сериализатор не пойдёт в базу синхронно
+    products = {
+        product.id: product
+        async for product in Product.objects.filter(
+            id__in=collect_product_ids([data])
+        ).only('id', 'price')
+    }
+    serializer = OrderSerializer(data=data, context={'products': products})
+    if not serializer.is_valid():
+        return JsonResponse(serializer.errors, status=400)
+    try:
+        response_data = await sync_to_async(save_order)(
+            serializer.validated_data, idempotency_key, request_hash
+        )
+    except IntegrityError:
+        stored = idempotency_key and await afind_stored_response(idempotency_key, request_hash)
+        if not stored:
+            raise
+        return JsonResponse(stored[1], status=stored[0], headers=stored[2], safe=False)
+    return JsonResponse(response_data, status=201)
+
+
+def save_order(order_data, idempotency_key=None, request_hash=None):
+    """
+    Создаёт заказ с позициями по проверенным данным и возвращает
+    тело ответа. С ключом идемпотентности сохраняет и его.
+    """
+    with transaction.atomic():
+        order = Order.objects.create(
+            firstname=order_data['firstname'],
+            lastname=order_data['lastname'],
+            phonenumber=order_data['phonenumber'],
+            address=order_data['address'],
+            total_price=calculate_total_price(order_data['products'])
+        )
+        # Товары уже загружены при валидации
+        order_items = []
+        for item in order_data['products']:
+            order_items.append(OrderItem(
+                order=order,
+                product=item['product'],
+                quantity=item['quantity'],
+                price=item['product'].price
+            ))
+        OrderItem.objects.bulk_create(order_items)
+        # Координаты найдёт фоновый воркер process_geocoding_queue
+        enqueue_addresses([order.address])
+
+        response_data = OrderSerializer(order).data
+        if idempotency_key:
+            # Ключ пишется в той же транзакции: если два повтора пришли
+            # одновременно, второй упрётся в уникальность ключа и откатит свой заказ
+            IdempotencyKey.objects.create(
+                key=idempotency_key,
+                request_hash=request_hash,
+                response_status=201,
+                response_body=response_data,
+            )
+    return response_data
+
+
+def is_valid_idempotency_key(idempotency_key):
+    return 0 < len(idempotency_key) <= IdempotencyKey._meta.get_field('key').max_length
+
+
+def hash_request_data(data):
+    """Хэш тела запроса: повтор с тем же ключом, но другим телом — ошибка клиента."""
+    canonical = json.dumps(data, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+def find_stored_response(idempotency_key, request_hash):
+    """
+    Возвращает сохранённый ответ для ключа тройкой (статус, тело, заголовки)
+    или None, если ключа ещё нет либо его срок истёк.
+    """
+    stored = IdempotencyKey.objects.filter(key=idempotency_key).first()
+    if stored is not None and stored.is_expired():
+        stored.delete()
+        return None
+    return get_stored_response(stored, request_hash)
+
+
+async def afind_stored_response(idempotency_key, request_hash):
+    stored = await IdempotencyKey.objects.filter(key=idempotency_key).afirst()
+    if stored is not None and stored.is_expired():
+        await stored.adelete()
+        return None
+    return get_stored_response(stored, request_hash)
+
+
+def get_stored_response(stored, request_hash):
+    """Ключ с другим телом запроса даёт ответ 422."""
+    if stored is None:
+        return None
+    if stored.request_hash != request_hash:
+        return 422, {'error': 'Этот Idempotency-Key уже использован для другого запроса'}, {}
+    return stored.response_status, stored.response_body, {'Idempotent-Replayed': 'true'}
+
+
+def calculate_total_price(products_data):
+    """Стоимость заказа по проверенным позициям с загруженными товарами."""
+    return sum(item['product'].price * item['quantity'] for item in products_data)
+
+
+def collect_product_ids(orders_data):
+    """Собирает ID товаров из сырых данных заказов, пропуская некорректные."""
+    product_ids = set()
+    for order_data in orders_data:
+        if not isinstance(order_data, dict) or not isinstance(order_data.get('products'), list):
+            continue
+        for item in order_data['products']:
+            try:
+                product_ids.add(int(item['product']))
+            except (TypeError, ValueError, KeyError):
+                continue
+    return product_ids
+
+
+@shed_load
+@api_view(['POST'])
+@permission_classes([HasPartnerToken])
+def register_orders_batch(request):
+    """
+    Принимает список заказов от партнёров-агрегаторов.
+
+    Все товары проверяются одним запросом, заказы и их позиции
+    сохраняются двумя bulk_create. Некорректные заказы не мешают
+    остальным: для каждого заказа возвращается либо id, либо ошибки.
+    """
+    if not isinstance(request.data, list):
+        return Response({'error': 'Ожидается список заказов'}, status=400)
+    if not request.data:
+        return Response({'error': 'Этот список не может быть пустым'}, status=400)
+    if len(request.data) > settings.ORDERS_BATCH_MAX_SIZE:
+        return Response(
+            {'error': f'Не больше {settings.ORDERS_BATCH_MAX_SIZE} заказов за один запрос'},
+            status=400,
+        )
+
+    product_ids = collect_product_ids(request.data)
+    products = {
+        product.id: product
+        for product in Product.objects.filter(id__in=product_ids).only('id', 'price')
+    }
+
+    results = []
+    valid_orders = []
+    # Лимит на номер телефона действует и для заказов партнёров, по каждому заказу отдельно
+    phone_throttle = PhoneTokenBucketThrottle()
+    for index, order_data in enumerate(request.data):
+        serializer = OrderSerializer(data=order_data, context={'products': products})
+        if not serializer.is_valid():
+            results.append({'index': index, 'errors': serializer.errors})
+        elif not phone_throttle.allow_phonenumber(serializer.validated_data['phonenumber'].as_e164):
+            results.append({
+                'index': index,
+                'errors': {'phonenumber': ['Слишком много заказов на этот номер, повторите позже']},
+            })
+        else:
+            valid_orders.append((index, serializer.validated_data))
+
+    if valid_orders:
         with transaction.atomic():
-            
-            product_ids = [item['product'] for item in serializer.validated_data['products']]
-            product_map = {p.id: p for p in Product.objects.filter(id__in=product_ids)}
-            
-            order = Order.objects.create(
-                firstname=serializer.validated_data['firstname'],
-                lastname=serializer.validated_data['lastname'],
-                phonenumber=serializer.validated_data['phonenumber'],
-                address=serializer.validated_data['address']
+            # bulk_create не вызывает save(), поэтому Location привязываем сами
+            locations = Location.objects.for_addresses(
+                order_data['address'] for index, order_data in valid_orders
             )
+            orders = Order.objects.bulk_create([
+                Order(
+                    firstname=order_data['firstname'],
+                    lastname=order_data['lastname'],
+                    phonenumber=order_data['phonenumber'],
+                    address=order_data['address'],
+                    location=locations.get(order_data['address']),
+                    total_price=calculate_total_price(order_data['products']),
+                )
+                for index, order_data in valid_orders
+            ])
             order_items = []
-            for item in serializer.validated_data['products']:
-                product = product_map[item['product']]
-                order_items.append(OrderItem(
-                    order=order,
-                    product=product,
-                    quantity=item['quantity'],
-                    price=product.price
-                ))
+            for order, (index, order_data) in zip(orders, valid_orders):
+                for item in order_data['products']:
+                    order_items.append(OrderItem(
+                        order=order,
+                        product=item['product'],
+                        quantity=item['quantity'],
+                        price=item['product'].price
+                    ))
             OrderItem.objects.bulk_create(order_items)
-             
-        response_serializer = OrderSerializer(order)    
-        return Response(response_serializer.data, status=201)
-    return Response(serializer.errors, status=400)
+            enqueue_addresses([order.address for order in orders])
+
+        for order, (index, order_data) in zip(orders, valid_orders):
+            results.append({'index': index, 'id': order.id})
+
+    results.sort(key=lambda result: result['index'])
+    return Response({'orders': results}, status=201 if valid_orders else 400)
@@ -0,0 +1,62 @@
+import re
+
+
+# Сокращения с дефисом нужно развернуть до того, как пунктуация станет пробелами
+HYPHENATED_ABBREVIATIONS = {
+    'пр-т': 'проспект',
+    'пр-кт': 'проспект',
+    'б-р': 'бульвар',
+    'р-н': 'район',
+}
+
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'мкр': 'микрорайон',
+    'обл': 'область',
+    'г': 'город',
+    'д': 'дом',
+    'стр': 'строение',
+    'к': 'корпус',
+    'корп': 'корпус',
+}
+
+# Слова, которые обычно опускают, не меняя смысла адреса:
+# «Москва, Тверская 1» и «г. Москва, ул. Тверская, д. 1» — один адрес
+OPTIONAL_WORDS = {'город', 'улица', 'дом'}
+
+HYPHENATED_RE = re.compile(
+    r'(?<!\w)(' + '|'.join(re.escape(abbr) for abbr in HYPHENATED_ABBREVIATIONS) + r')(?!\w)'
+)
+NON_WORD_RE = re.compile(r'[\W_]+')
+# «5к2» — то же, что «5 корпус 2»
+HOUSE_WITH_BLOCK_RE = re.compile(r'(\d+)(к|корп|стр)(\d+)')
+
+
+def canonicalize_address(address):
+    """
+    Приводит адрес к каноническому ключу для поиска координат.
+
+    Регистр, ё, пробелы и пунктуация не важны, сокращения вроде «ул.»
+    разворачиваются, а необязательные слова «город», «улица», «дом»
+    отбрасываются. Порядок слов сохраняется.
+    """
+    if not address:
+        return ''
+    address = address.lower().replace('ё', 'е')
+    address = HYPHENATED_RE.sub(lambda match: HYPHENATED_ABBREVIATIONS[match.group(1)], address)
+
+    address = NON_WORD_RE.sub(' ', address)
+    address = HOUSE_WITH_BLOCK_RE.sub(r'\1 \2 \3', address)
+
+    words = []
+    for word in address.split():
+        word = ABBREVIATIONS.get(word, word)
+        if word not in OPTIONAL_WORDS:
+            words.append(word)
+    return ' '.join(words)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class GeocodingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'geocoding'
+
+    def ready(self):
+        from . import signals  # noqa: F401
+        from star_burger.metrics import registry
+        from .cache import collect_metrics
+
+        registry.register_collector(collect_metrics)
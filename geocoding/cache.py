@@ -0,0 +1,196 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from geocoding.addresses import canonicalize_address
+from geocoding.models import Location
+from star_burger.replicas import read_from_primary
+from star_burger.versioning import VersionTracker
+
+
+LOCATION_CACHE_VERSION_KEY = 'geocoding:location-cache-version'
+
+MISSING = object()
+
+
+class LocationCache:
+    """
+    Кэш координат в памяти процесса перед таблицей Location.
+
+    Ключ — канонический адрес. Кроме найденных координат хранит и
+    ненайденные адреса: такая запись живёт до next_retry_at, чтобы
+    не отправлять геокодеру адрес, для которого ещё не подошёл повтор.
+    Размер ограничен maxsize (вытесняются давно не использованные адреса),
+    срок жизни записи — ttl секунд. Когда координаты в Location меняются
+    или удаляются, счётчик версии в кэше Django увеличивается, и все
+    воркеры сбрасывают свой локальный кэш при следующем обращении.
+    """
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = VersionTracker(LOCATION_CACHE_VERSION_KEY)
+
+    def get(self, address):
+        return self.get_many([address]).get(address)
+
+    def get_many(self, addresses):
+        """
+        Возвращает словарь адрес → (lat, lon) для адресов с известными координатами.
+        Всё, чего нет в памяти, добирается из Location одним запросом.
+        """
+        coordinates, backed_off = self.resolve_many(addresses)
+        return coordinates
+
+    def resolve_many(self, addresses):
+        """
+        Возвращает пару: словарь адрес → (lat, lon) для найденных адресов
+        и множество адресов, которые геокодер не нашёл и повторять рано.
+        """
+        addresses = {address for address in addresses if address}
+        if not addresses:
+            return {}, set()
+
+        keys = {address: canonicalize_address(address) for address in addresses}
+        found = {}
+        missing = set()
+        now = time.monotonic()
+        with self._lock:
+            self._check_version()
+            for key in set(keys.values()):
+                coords = self._get_entry(key, now)
+                if coords is MISSING:
+                    missing.add(key)
+                else:
+                    found[key] = coords
+            self.hits += len(found)
+            self.misses += len(missing)
+
+        if missing:
+            found.update(self._load(missing))
+
+        coordinates = {}
+        backed_off = set()
+        for address, key in keys.items():
+            if key not in found:
+                continue
+            if found[key] is None:
+                backed_off.add(address)
+            else:
+                coordinates[address] = found[key]
+        return coordinates, backed_off
+
+    def set_many(self, coordinates):
+        """Кладёт в кэш словарь адрес → (lat, lon)."""
+        self._set_keys({
+            canonicalize_address(address): coords
+            for address, coords in coordinates.items()
+        })
+
+    def set_failed(self, addresses, next_retry_at):
+        """Запоминает ненайденные адреса до момента следующей попытки."""
+        self._set_keys(
+            dict.fromkeys({canonicalize_address(address) for address in addresses}),
+            next_retry_at=next_retry_at,
+        )
+
+    def _load(self, keys):
+        now = timezone.now()
+        locations = (
+            Location.objects
+            .filter(canonical_key__in=keys)
+            .filter(Q(lat__isnull=False, lon__isnull=False) | Q(next_retry_at__gt=now))
+            .values_list('canonical_key', 'lat', 'lon', 'next_retry_at')
+        )
+        with read_from_primary():
+            locations = list(locations)
+        positive = {}
+        negative = {}
+        for key, lat, lon, next_retry_at in locations:
+            if lat is not None and lon is not None:
+                positive[key] = (lat, lon)
+            else:
+                negative[key] = min(negative.get(key, next_retry_at), next_retry_at)
+
+        # Если у адреса есть и найденная, и ненайденная запись, верим найденной
+        for key in positive:
+            negative.pop(key, None)
+
+        self._set_keys(positive)
+        for key, next_retry_at in negative.items():
+            self._set_keys({key: None}, next_retry_at=next_retry_at)
+        return {**dict.fromkeys(negative), **positive}
+
+    def _set_keys(self, coordinates, next_retry_at=None):
+        if not coordinates:
+            return
+        ttl = self._get_ttl()
+        if next_retry_at is not None:
+            ttl = min(ttl, max(0, (next_retry_at - timezone.now()).total_seconds()))
+        expires_at = time.monotonic() + ttl
+        maxsize = self._get_maxsize()
+        with self._lock:
+            self._check_version()
+            for key, coords in coordinates.items():
+                self._entries[key] = (coords, expires_at)
+                self._entries.move_to_end(key)
+            while len(self._entries) > maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def invalidate(self):
+        """Сбрасывает кэш во всех воркерах."""
+        with self._lock:
+            self._version.bump()
+            self._entries.clear()
+
+    @property
+    def stats(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'size': len(self._entries),
+        }
+
+    def _check_version(self):
+        if not self._version.is_current():
+            self._entries.clear()
+
+    def _get_entry(self, key, now):
+        entry = self._entries.get(key)
+        if entry is None:
+            return MISSING
+        coords, expires_at = entry
+        if expires_at < now:
+            del self._entries[key]
+            return MISSING
+        self._entries.move_to_end(key)
+        return coords
+
+    def _get_maxsize(self):
+        return self.maxsize or settings.GEOCODER_CACHE_SIZE
+
+    def _get_ttl(self):
+        return self.ttl or settings.GEOCODER_CACHE_TTL
+
+
+location_cache = LocationCache()
+
+
+def collect_metrics():
+    """Попадания и промахи кэша координат для реестра метрик."""
+    return {
+        ('location_cache_requests_total', (('result', 'hit'),)): location_cache.hits,
+        ('location_cache_requests_total', (('result', 'miss'),)): location_cache.misses,
+    }
@@ -0,0 +1,67 @@
+from math import asin, cos, radians, sin, sqrt
+
+from geopy.distance import geodesic
+
+
+EARTH_RADIUS_KM = 6371.0088
+
+HAVERSINE = 'haversine'
+GEODESIC = 'geodesic'
+
+
+def distance_matrix(origins, destinations, method=HAVERSINE):
+    """
+    Считает матрицу расстояний в км размером len(origins) × len(destinations).
+
+    origins и destinations — последовательности пар (lat, lon) или None.
+    Если у одной из точек нет координат, в ячейке будет None.
+
+    Режим HAVERSINE быстрый: синусы и косинусы каждой точки считаются
+    один раз, а на ячейку остаётся несколько умножений. Погрешность
+    относительно эллипсоида — доли процента, для выбора ближайшего
+    ресторана этого достаточно. Режим GEODESIC точный, но медленный.
+    """
+    if method == GEODESIC:
+        return [
+            [
+                geodesic(origin, destination).km if origin and destination else None
+                for destination in destinations
+            ]
+            for origin in origins
+        ]
+    if method != HAVERSINE:
+        raise ValueError(f'Неизвестный способ расчёта расстояний: {method}')
+
+    prepared_destinations = [_prepare(point) for point in destinations]
+    matrix = []
+    for origin in origins:
+        prepared_origin = _prepare(origin)
+        if prepared_origin is None:
+            matrix.append([None] * len(prepared_destinations))
+            continue
+        matrix.append([
+            _haversine(prepared_origin, destination) if destination else None
+            for destination in prepared_destinations
+        ])
+    return matrix
+
+
+def haversine(coord1, coord2):
+    """Расстояние по большому кругу между двумя точками (lat, lon) в км."""
+    if not coord1 or not coord2:
+        return None
+    return _haversine(_prepare(coord1), _prepare(coord2))
+
+
+def _prepare(point):
+    if not point:
+        return None
+    lat, lon = radians(point[0]), radians(point[1])
+    return lat, lon, cos(lat)
+
+
+def _haversine(point1, point2):
+    lat1, lon1, cos_lat1 = point1
+    lat2, lon2, cos_lat2 = point2
+    h = sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * cos_lat2 * sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(h)))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db.models import F
+
+from geocoding.cache import location_cache
+from geocoding.models import GeocodingTask
+from geocoding.utils import fetch_coordinates_batch
+from star_burger.metrics import flush_metrics
+
+
+class Command(BaseCommand):
+    help = 'Геокодирует адреса из очереди GeocodingTask и сохраняет координаты в Location'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+        parser.add_argument(
+            '--max-attempts', type=int, default=5,
+            help='После стольких неудачных попыток задача удаляется из очереди',
+        )
+        parser.add_argument(
+            '--forever', action='store_true',
+            help='Не завершаться, когда очередь пуста, а ждать новых задач',
+        )
+        parser.add_argument('--sleep', type=float, default=5, help='Пауза между опросами пустой очереди, сек')
+
+    def handle(self, *args, **options):
+        try:
+            while True:
+                # Один проход по очереди: неудачные задачи ждут следующего прохода
+                last_id = 0
+                while last_id is not None:
+                    last_id = self.process_batch(last_id, options['batch_size'], options['max_attempts'])
+                if not options['forever']:
+                    break
+                time.sleep(options['sleep'])
+        finally:
+            # Счётчики прерванной пачки тоже попадают в /metrics
+            flush_metrics()
+
+    def process_batch(self, after_id, batch_size, max_attempts):
+        tasks = list(GeocodingTask.objects.filter(id__gt=after_id).order_by('id')[:batch_size])
+        if not tasks:
+            return None
+
+        addresses = {task.address for task in tasks}
+        coordinates, backed_off = location_cache.resolve_many(addresses)
+        resolved = set(coordinates)
+        resolved.update(fetch_coordinates_batch(addresses - resolved - backed_off))
+
+        # Ненайденные адреса дальше повторяет команда retry_geocoding
+        failed_ids = [task.id for task in tasks if task.address not in resolved | backed_off]
+        GeocodingTask.objects.filter(address__in=resolved | backed_off).delete()
+        GeocodingTask.objects.filter(id__in=failed_ids).update(attempts=F('attempts') + 1)
+        GeocodingTask.objects.filter(id__in=failed_ids, attempts__gte=max_attempts).delete()
+
+        self.stdout.write(f'Найдено координат: {len(resolved)}, не найдено: {len(failed_ids)}')
+        flush_metrics()
+        return tasks[-1].id
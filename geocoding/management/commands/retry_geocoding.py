@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from geocoding.models import Location
+from geocoding.utils import fetch_coordinates_batch
+from star_burger.metrics import flush_metrics
+
+
+class Command(BaseCommand):
+    help = 'Повторно геокодирует ненайденные адреса, у которых подошло время следующей попытки'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=50)
+
+    def handle(self, *args, **options):
+        due_locations = (
+            Location.objects
+            .filter(Q(lat__isnull=True) | Q(lon__isnull=True))
+            .filter(Q(next_retry_at__isnull=True) | Q(next_retry_at__lte=timezone.now()))
+            .order_by('id')
+        )
+
+        last_id = 0
+        resolved_count = 0
+        failed_count = 0
+        try:
+            while True:
+                batch = list(
+                    due_locations
+                    .filter(id__gt=last_id)
+                    .values_list('id', 'address')[:options['batch_size']]
+                )
+                if not batch:
+                    break
+                last_id = batch[-1][0]
+
+                addresses = {address for _, address in batch}
+                resolved = fetch_coordinates_batch(addresses)
+                resolved_count += len(resolved)
+                failed_count += len(addresses) - len(resolved)
+                flush_metrics()
+        finally:
+            # Счётчики прерванной пачки тоже попадают в /metrics
+            flush_metrics()
+
+        self.stdout.write(f'Найдено координат: {resolved_count}, не найдено: {failed_count}')
@@ -0,0 +1,88 @@
+import re
+
+from django.db import migrations, models
+
+# Копия geocoding.addresses на момент написания миграции: правки живого
+# канонизатора не должны менять то, что делает уже применённая миграция
+# Сокращения с дефисом нужно развернуть до того, как пунктуация станет пробелами
+HYPHENATED_ABBREVIATIONS = {
+    'пр-т': 'проспект',
+    'пр-кт': 'проспект',
+    'б-р': 'бульвар',
+    'р-н': 'район',
+}
+
+ABBREVIATIONS = {
+    'ул': 'улица',
+    'просп': 'проспект',
+    'пер': 'переулок',
+    'пл': 'площадь',
+    'бул': 'бульвар',
+    'ш': 'шоссе',
+    'наб': 'набережная',
+    'мкр': 'микрорайон',
+    'обл': 'область',
+    'г': 'город',
+    'д': 'дом',
+    'стр': 'строение',
+    'к': 'корпус',
+    'корп': 'корпус',
+}
+
+# Слова, которые обычно опускают, не меняя смысла адреса:
+# «Москва, Тверская 1» и «г. Москва, ул. Тверская, д. 1» — один адрес
+OPTIONAL_WORDS = {'город', 'улица', 'дом'}
+
+HYPHENATED_RE = re.compile(
+    r'(?<!\w)(' + '|'.join(re.escape(abbr) for abbr in HYPHENATED_ABBREVIATIONS) + r')(?!\w)'
+)
+NON_WORD_RE = re.compile(r'[\W_]+')
+# «5к2» — то же, что «5 корпус 2»
+HOUSE_WITH_BLOCK_RE = re.compile(r'(\d+)(к|корп|стр)(\d+)')
+
+
+def canonicalize_address(address):
+    if not address:
+        return ''
+    address = address.lower().replace('ё', 'е')
+    address = HYPHENATED_RE.sub(lambda match: HYPHENATED_ABBREVIATIONS[match.group(1)], address)
+
+    address = NON_WORD_RE.sub(' ', address)
+    address = HOUSE_WITH_BLOCK_RE.sub(r'\1 \2 \3', address)
+
+    words = []
+    for word in address.split():
+        word = ABBREVIATIONS.get(word, word)
+        if word not in OPTIONAL_WORDS:
+            words.append(word)
+    return ' '.join(words)
+
+
+def fill_canonical_keys(apps, schema_editor):
+    Location = apps.get_model('geocoding', 'Location')
+    locations = Location.objects.using(schema_editor.connection.alias)
+    batch = []
+    for location in locations.only('id', 'address').iterator(chunk_size=1000):
+        location.canonical_key = canonicalize_address(location.address)
+        batch.append(location)
+        if len(batch) >= 1000:
+            locations.bulk_update(batch, ['canonical_key'])
+            batch = []
+    locations.bulk_update(batch, ['canonical_key'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geocoding', '0002_geocodingtask'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='canonical_key',
+            field=models.CharField(db_index=True, default='', editable=False, help_text='Адрес без различий в регистре, пунктуации и сокращениях', max_length=200, verbose_name='Канонический адрес'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(fill_canonical_keys, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.10 on 2026-10-18 02:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('geocoding', '0003_location_canonical_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='location',
+            name='failures_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name='Неудачных попыток геокодирования'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='last_attempt_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Последняя попытка геокодирования'),
+        ),
+        migrations.AddField(
+            model_name='location',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, db_index=True, help_text='До этого времени адрес считается ненайденным и не отправляется геокодеру', null=True, verbose_name='Следующая попытка геокодирования'),
+        ),
+    ]
@@ -1,15 +1,123 @@
 from django.db import models
 
+from .addresses import canonicalize_address
+
+
+class LocationQuerySet(models.QuerySet):
+    def get_for_address(self, address):
+        """
+        Возвращает запись Location для адреса, создавая её без координат при необходимости.
+        Варианты написания одного адреса получают одну и ту же запись.
+        """
+        location = (
+            self.filter(canonical_key=canonicalize_address(address))
+            .order_by(models.F('lat').asc(nulls_last=True))
+            .first()
+        )
+        if location is None:
+            location, created = self.get_or_create(address=address)
+        return location
+
+    def for_addresses(self, addresses):
+        """
+        То же для многих адресов сразу: словарь адрес → Location.
+        Недостающие записи создаются одним bulk_create.
+        """
+        keys = {address: canonicalize_address(address) for address in set(addresses) if address}
+        if not keys:
+            return {}
+
+        def load():
+            by_key = {}
+            locations = (
+                self.filter(canonical_key__in=set(keys.values()))
+                .order_by(models.F('lat').desc(nulls_first=True))
+            )
+            # Записи с координатами идут последними и перекрывают записи без координат
+            for location in locations:
+                by_key[location.canonical_key] = location
+            return by_key
+
+        by_key = load()
+        missing = {}
+        for address, key in keys.items():
+            if key not in by_key:
+                missing.setdefault(key, address)
+        if missing:
+            self.bulk_create(
+                [self.model(address=address, canonical_key=key) for key, address in missing.items()],
+                ignore_conflicts=True,
+            )
+            by_key = load()
+
+        return {
+            address: by_key[key]
+            for address, key in keys.items()
+            if key in by_key
+        }
+
+
 class Location(models.Model):
     address = models.CharField('Адрес', max_length=200, unique=True)
+    canonical_key = models.CharField(
+        'Канонический адрес',
+        max_length=200,
+        db_index=True,
+        editable=False,
+        help_text='Адрес без различий в регистре, пунктуации и сокращениях',
+    )
     lat = models.FloatField('Широта', null=True, blank=True)
     lon = models.FloatField('Долгота', null=True, blank=True)
     created_at = models.DateTimeField('Дата создания', auto_now_add=True)
     updated_at = models.DateTimeField('Дата обновления', auto_now=True)
 
+    failures_count = models.PositiveSmallIntegerField('Неудачных попыток геокодирования', default=0)
+    last_attempt_at = models.DateTimeField('Последняя попытка геокодирования', null=True, blank=True)
+    next_retry_at = models.DateTimeField(
+        'Следующая попытка геокодирования',
+        null=True,
+        blank=True,
+        db_index=True,
+        help_text='До этого времени адрес считается ненайденным и не отправляется геокодеру',
+    )
+
+    loaded_coords = (None, None)
+
+    objects = LocationQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'локация'
         verbose_name_plural = 'локации'
 
     def __str__(self):
         return f"{self.address} ({self.lat}, {self.lon})"
+
+    def save(self, *args, **kwargs):
+        self.canonical_key = canonicalize_address(self.address)
+        super().save(*args, **kwargs)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Исходные координаты нужны, чтобы понять, устарел ли кэш координат
+        instance.loaded_coords = (instance.__dict__.get('lat'), instance.__dict__.get('lon'))
+        return instance
+
+    @property
+    def coords(self):
+        if self.lat is None or self.lon is None:
+            return None
+        return (self.lat, self.lon)
+
+
+class GeocodingTask(models.Model):
+    address = models.CharField('Адрес', max_length=200, unique=True)
+    attempts = models.PositiveSmallIntegerField('Попыток', default=0)
+    created_at = models.DateTimeField('Дата создания', auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = 'задача геокодирования'
+        verbose_name_plural = 'задачи геокодирования'
+
+    def __str__(self):
+        return self.address
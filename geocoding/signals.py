@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
+
+from .cache import location_cache
+from .models import Location
+
+# Координаты записей Location изменились или записи удалены.
+# Аргумент location_ids — id затронутых записей
+coordinates_changed = Signal()
+
+
+@receiver(post_save, sender=Location)
+@receiver(post_delete, sender=Location)
+def invalidate_location_cache(sender, instance, created=False, **kwargs):
+    # Новых записей ещё нет ни в одном кэше. Пакетные пути геокодирования
+    # (bulk_update, update) сигналов не шлют и обновляют кэш сами
+    if created:
+        return
+    if kwargs['signal'] is post_save and instance.loaded_coords == (instance.lat, instance.lon):
+        return
+    transaction.on_commit(location_cache.invalidate)
+    coordinates_changed.send(sender=Location, location_ids=[instance.pk])
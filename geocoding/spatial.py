@@ -0,0 +1,127 @@
+from collections import defaultdict
+from math import cos, floor, radians
+
+from .distances import HAVERSINE, distance_matrix
+
+
+KM_PER_DEGREE = 111.32
+
+
+class GridIndex:
+    """
+    Пространственный индекс точек на равномерной сетке широта × долгота.
+
+    Точка попадает в ячейку размером cell_size_km по широте (по долготе
+    в градусах ячейка такая же). Поиск перебирает только ячейки, которые
+    пересекают круг радиуса R, поэтому точки в других городах не смотрятся.
+    Точки можно добавлять и удалять по одной, без перестройки индекса.
+    Переход через 180-й меридиан не учитывается.
+    """
+
+    def __init__(self, cell_size_km=5, method=HAVERSINE):
+        self.cell_size_km = cell_size_km
+        self.method = method
+        self._cell_degrees = cell_size_km / KM_PER_DEGREE
+        self._cells = defaultdict(dict)
+        self._points = {}
+
+    def __len__(self):
+        return len(self._points)
+
+    def __contains__(self, item_id):
+        return item_id in self._points
+
+    def insert(self, item_id, coords):
+        """Добавляет точку или переносит её на новые координаты."""
+        self.remove(item_id)
+        if not coords:
+            return
+        cell = self._get_cell(coords)
+        self._cells[cell][item_id] = coords
+        self._points[item_id] = cell
+
+    def remove(self, item_id):
+        cell = self._points.pop(item_id, None)
+        if cell is None:
+            return
+        del self._cells[cell][item_id]
+        if not self._cells[cell]:
+            del self._cells[cell]
+
+    def clear(self):
+        self._cells.clear()
+        self._points.clear()
+
+    def within(self, coords, radius_km, allowed_ids=None):
+        """
+        Возвращает пары (id, расстояние в км) для точек в радиусе radius_km,
+        отсортированные по расстоянию. allowed_ids ограничивает выборку.
+        """
+        lat, lon = coords
+        lat_cells = radius_km / self.cell_size_km
+        # Градус долготы короче к полюсам, поэтому по долготе ячеек больше
+        lon_cells = lat_cells / max(cos(radians(lat)), 0.01)
+        lat_position = lat / self._cell_degrees
+        lon_position = lon / self._cell_degrees
+        lat_range = range(floor(lat_position - lat_cells), floor(lat_position + lat_cells) + 1)
+        lon_range = range(floor(lon_position - lon_cells), floor(lon_position + lon_cells) + 1)
+
+        if len(lat_range) * len(lon_range) <= len(self._cells):
+            cells = (
+                self._cells.get((i, j), {})
+                for i in lat_range
+                for j in lon_range
+            )
+        else:
+            # Круг больше занятой части сетки: дешевле пройти по непустым ячейкам
+            cells = (
+                points
+                for (i, j), points in self._cells.items()
+                if i in lat_range and j in lon_range
+            )
+
+        candidates = {}
+        for points in cells:
+            for item_id, point in points.items():
+                if allowed_ids is None or item_id in allowed_ids:
+                    candidates[item_id] = point
+
+        if not candidates:
+            return []
+        ids = list(candidates)
+        distances = distance_matrix([coords], [candidates[item_id] for item_id in ids], self.method)[0]
+        found = [
+            (item_id, distance)
+            for item_id, distance in zip(ids, distances)
+            if distance <= radius_km
+        ]
+        found.sort(key=lambda pair: pair[1])
+        return found
+
+    def nearest(self, coords, k=None, radius_km=None, allowed_ids=None):
+        """
+        Возвращает до k ближайших точек (id, расстояние в км) не дальше radius_km.
+
+        Без радиуса круг поиска расширяется вдвое, пока не наберётся k точек
+        или не будут просмотрены все точки индекса.
+        """
+        if radius_km is not None:
+            found = self.within(coords, radius_km, allowed_ids)
+            return found[:k] if k else found
+
+        if allowed_ids is not None:
+            total = len(set(allowed_ids) & self._points.keys())
+        else:
+            total = len(self._points)
+        wanted = min(k, total) if k else total
+
+        radius_km = self.cell_size_km
+        while True:
+            found = self.within(coords, radius_km, allowed_ids)
+            if len(found) >= wanted or radius_km > 2 * KM_PER_DEGREE * 180:
+                return found[:k] if k else found
+            radius_km *= 2
+
+    def _get_cell(self, coords):
+        lat, lon = coords
+        return (floor(lat / self._cell_degrees), floor(lon / self._cell_degrees))
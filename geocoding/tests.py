@@ -1,3 +1,363 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
+from geopy.distance import geodesic
+
+from geocoding.addresses import canonicalize_address
+from geocoding.cache import LocationCache, location_cache
+from geocoding.distances import GEODESIC, HAVERSINE, distance_matrix, haversine
+from geocoding.models import GeocodingTask, Location
+from geocoding.spatial import GridIndex
+from geocoding.stub import StubGeocoder
+from geocoding.utils import enqueue_addresses, fetch_coordinates_batch, get_geolocator
+from star_burger.metrics import WORKER_KEY_PREFIX, registry
+
+
+class FetchCoordinatesBatchTest(TestCase):
+    def test_resolves_and_saves_addresses(self):
+        geolocator = StubGeocoder(unknown_addresses={'нет такого адреса'})
+
+        coordinates = fetch_coordinates_batch(
+            ['Москва, Тверская 1', 'Москва, Арбат 2', 'нет такого адреса'],
+            geolocator=geolocator,
+        )
+
+        self.assertEqual(set(coordinates), {'Москва, Тверская 1', 'Москва, Арбат 2'})
+        self.assertEqual(
+            Location.objects.filter(lat__isnull=False).count(),
+            2,
+        )
+
+    def test_updates_existing_location_without_coordinates(self):
+        Location.objects.create(address='Москва, Тверская 1')
+
+        fetch_coordinates_batch(['Москва, Тверская 1'], geolocator=StubGeocoder())
+
+        location = Location.objects.get(address='Москва, Тверская 1')
+        self.assertIsNotNone(location.lat)
+
+    def test_returns_what_resolved_before_deadline(self):
+        geolocator = StubGeocoder(delay=0.5)
+
+        coordinates = fetch_coordinates_batch(
+            ['Москва, Тверская 1', 'Москва, Арбат 2'],
+            geolocator=geolocator,
+            deadline=0.05,
+        )
+
+        self.assertEqual(coordinates, {})
+        self.assertFalse(Location.objects.exists())
+
+
+class CanonicalizeAddressTest(TestCase):
+    def test_spelling_variants_share_key(self):
+        variants = [
+            'Москва, Тверская 1',
+            'москва тверская, 1 ',
+            'г. Москва, ул. Тверская, д. 1',
+        ]
+        self.assertEqual(
+            {canonicalize_address(address) for address in variants},
+            {'москва тверская 1'},
+        )
+
+    def test_expands_abbreviations(self):
+        self.assertEqual(
+            canonicalize_address('Москва, Ленинский пр-т, 5к2'),
+            canonicalize_address('Москва, Ленинский проспект, д. 5, корп. 2'),
+        )
+
+    def test_batch_geocodes_variants_once(self):
+        geolocator = StubGeocoder()
+
+        coordinates = fetch_coordinates_batch(
+            ['Москва, Тверская 1', 'москва тверская, 1 '],
+            geolocator=geolocator,
+        )
+
+        self.assertEqual(len(geolocator.calls), 1)
+        self.assertEqual(len(coordinates), 2)
+        self.assertEqual(Location.objects.count(), 1)
+
+
+class LocationCacheTest(TestCase):
+    def setUp(self):
+        Location.objects.create(address='Москва, Тверская 1', lat=55.76, lon=37.61)
+        Location.objects.create(address='нет такого адреса')
+        self.cache = LocationCache(maxsize=10, ttl=60)
+
+    def test_get_many_does_not_hit_database_after_warm_up(self):
+        addresses = ['Москва, Тверская 1', 'нет такого адреса']
+        with self.assertNumQueries(1):
+            self.cache.get_many(addresses)
+        with self.assertNumQueries(0):
+            coordinates = self.cache.get_many(['Москва, Тверская 1'])
+
+        self.assertEqual(coordinates, {'Москва, Тверская 1': (55.76, 37.61)})
+        self.assertEqual(self.cache.stats['hits'], 1)
+        self.assertEqual(self.cache.stats['misses'], 2)
+
+    def test_evicts_least_recently_used(self):
+        cache = LocationCache(maxsize=2, ttl=60)
+        cache.set_many({'a': (1, 1), 'b': (2, 2)})
+        cache.get('a')
+        cache.set_many({'c': (3, 3)})
+
+        with self.assertNumQueries(0):
+            self.assertEqual(cache.get_many(['a', 'c']), {'a': (1, 1), 'c': (3, 3)})
+        self.assertEqual(cache.stats['size'], 2)
+
+    def test_changed_coordinates_invalidate_cache(self):
+        self.cache.get('Москва, Тверская 1')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            location = Location.objects.get(address='Москва, Тверская 1')
+            location.lat = 55.0
+            location.save()
+
+        self.assertEqual(self.cache.get('Москва, Тверская 1'), (55.0, 37.61))
+
+
+@override_settings(GEOCODER_RETRY_BASE_DELAY=60, GEOCODER_RETRY_MAX_DELAY=600)
+class NegativeCachingTest(TestCase):
+    def setUp(self):
+        location_cache.clear()
+
+    def test_failure_schedules_exponential_retry(self):
+        geolocator = StubGeocoder(unknown_addresses={'нет такого адреса'})
+
+        fetch_coordinates_batch(['нет такого адреса'], geolocator=geolocator)
+        location = Location.objects.get(address='нет такого адреса')
+        self.assertEqual(location.failures_count, 1)
+        self.assertEqual((location.next_retry_at - location.last_attempt_at).total_seconds(), 60)
+
+        fetch_coordinates_batch(['нет такого адреса'], geolocator=geolocator)
+        location.refresh_from_db()
+        self.assertEqual(location.failures_count, 2)
+        self.assertEqual((location.next_retry_at - location.last_attempt_at).total_seconds(), 120)
+
+    def test_backed_off_address_is_not_geocoded_again(self):
+        geolocator = StubGeocoder(unknown_addresses={'нет такого адреса'})
+        fetch_coordinates_batch(['нет такого адреса'], geolocator=geolocator)
+
+        # По этому ответу очередь геокодирования не шлёт адрес геокодеру до next_retry_at
+        self.assertEqual(location_cache.resolve_many(['нет такого адреса']), ({}, {'нет такого адреса'}))
+        self.assertEqual(geolocator.calls, ['нет такого адреса'])
+
+    def test_success_resets_failures(self):
+        fetch_coordinates_batch(
+            ['Москва, Тверская 1'],
+            geolocator=StubGeocoder(unknown_addresses={'Москва, Тверская 1'}),
+        )
+        fetch_coordinates_batch(['Москва, Тверская 1'], geolocator=StubGeocoder())
+
+        location = Location.objects.get(address='Москва, Тверская 1')
+        self.assertIsNotNone(location.coords)
+        self.assertEqual(location.failures_count, 0)
+        self.assertIsNone(location.next_retry_at)
+
+
+class DistanceMatrixTest(TestCase):
+    origins = [(55.751, 37.617), None, (59.939, 30.316)]
+    destinations = [(55.765, 37.605), (55.796, 49.106), None]
+
+    def test_geodesic_matches_geopy(self):
+        matrix = distance_matrix(self.origins, self.destinations, method=GEODESIC)
+
+        for origin, row in zip(self.origins, matrix):
+            for destination, distance in zip(self.destinations, row):
+                if origin and destination:
+                    self.assertAlmostEqual(distance, geodesic(origin, destination).km, places=6)
+                else:
+                    self.assertIsNone(distance)
+
+    def test_haversine_is_close_to_geodesic(self):
+        matrix = distance_matrix(self.origins, self.destinations, method=HAVERSINE)
+
+        self.assertEqual(matrix[1], [None, None, None])
+        self.assertEqual([row[2] for row in matrix], [None, None, None])
+        for origin, row in zip(self.origins, matrix):
+            for destination, distance in zip(self.destinations, row):
+                if origin and destination:
+                    exact = geodesic(origin, destination).km
+                    # Сфера вместо эллипсоида даёт доли процента
+                    self.assertLess(abs(distance - exact) / exact, 0.005)
+                    self.assertEqual(distance, haversine(origin, destination))
+
+    def test_unknown_method_is_rejected(self):
+        with self.assertRaises(ValueError):
+            distance_matrix(self.origins, self.destinations, method='manhattan')
+
+
+class GridIndexTest(TestCase):
+    def setUp(self):
+        self.index = GridIndex(cell_size_km=5)
+        self.points = {
+            'Тверская': (55.765, 37.605),
+            'Арбат': (55.750, 37.590),
+            'Химки': (55.889, 37.445),
+            'Казань': (55.796, 49.106),
+        }
+        for name, coords in self.points.items():
+            self.index.insert(name, coords)
+
+    def test_within_matches_full_scan(self):
+        center = (55.751, 37.617)
+        expected = sorted(
+            (name for name, coords in self.points.items() if haversine(center, coords) <= 20),
+            key=lambda name: haversine(center, self.points[name]),
+        )
+
+        found = self.index.within(center, 20)
+
+        self.assertEqual([name for name, _ in found], expected)
+        self.assertEqual(expected, ['Арбат', 'Тверская', 'Химки'])
+
+    def test_nearest_expands_search_until_k_found(self):
+        found = self.index.nearest((55.751, 37.617), k=4)
+
+        self.assertEqual([name for name, _ in found], ['Арбат', 'Тверская', 'Химки', 'Казань'])
+
+    def test_nearest_respects_allowed_ids(self):
+        found = self.index.nearest((55.751, 37.617), k=1, allowed_ids={'Химки', 'Казань'})
+
+        self.assertEqual([name for name, _ in found], ['Химки'])
+
+    def test_moved_point_is_found_at_new_place(self):
+        self.index.insert('Тверская', (55.796, 49.100))
+        self.index.remove('Арбат')
+
+        self.assertEqual(self.index.within((55.751, 37.617), 10), [])
+        self.assertEqual(len(self.index), 3)
+        self.assertEqual(
+            [name for name, _ in self.index.nearest((55.796, 49.106), radius_km=5)],
+            ['Казань', 'Тверская'],
+        )
+
+
+@override_settings(GEOCODER_BACKEND='geocoding.stub.StubGeocoder')
+class GeocodingQueueTest(TestCase):
+    def setUp(self):
+        get_geolocator.cache_clear()
+        self.addCleanup(get_geolocator.cache_clear)
+        location_cache.clear()
+        self.geolocator = get_geolocator()
+
+    def process_queue(self, **options):
+        call_command('process_geocoding_queue', stdout=StringIO(), **options)
+
+    def test_enqueue_skips_repeated_and_empty_addresses(self):
+        enqueue_addresses(['Москва, Тверская 1', 'Москва, Тверская 1', ''])
+        enqueue_addresses(['Москва, Тверская 1', 'Москва, Арбат 2'])
+
+        self.assertEqual(
+            sorted(GeocodingTask.objects.values_list('address', 'attempts')),
+            [('Москва, Арбат 2', 0), ('Москва, Тверская 1', 0)],
+        )
+
+    def test_resolved_tasks_are_deleted(self):
+        Location.objects.create(address='Москва, Арбат 2', lat=55.75, lon=37.59)
+        enqueue_addresses(['Москва, Тверская 1', 'Москва, Арбат 2', 'Москва, Ленина 3'])
+
+        self.process_queue(batch_size=2)
+
+        self.assertFalse(GeocodingTask.objects.exists())
+        # Адрес с известными координатами берётся из базы, а не у геокодера
+        self.assertEqual(sorted(self.geolocator.calls), ['Москва, Ленина 3', 'Москва, Тверская 1'])
+        self.assertEqual(Location.objects.filter(lat__isnull=False).count(), 3)
+
+    def test_failed_task_counts_attempt_and_is_left_to_retry_command(self):
+        self.geolocator.unknown_addresses.add('нет такого адреса')
+        enqueue_addresses(['нет такого адреса', 'Москва, Тверская 1'])
+
+        self.process_queue(max_attempts=2)
+
+        task = GeocodingTask.objects.get()
+        self.assertEqual((task.address, task.attempts), ('нет такого адреса', 1))
+        self.assertIsNotNone(Location.objects.get(address='нет такого адреса').next_retry_at)
+
+        # Пока адрес ждёт следующей попытки, его повторяет retry_geocoding, а не очередь
+        self.process_queue(max_attempts=2)
+
+        self.assertFalse(GeocodingTask.objects.exists())
+        self.assertEqual(self.geolocator.calls.count('нет такого адреса'), 1)
+
+    def test_task_is_dropped_after_max_attempts(self):
+        self.geolocator.unknown_addresses.add('нет такого адреса')
+        enqueue_addresses(['нет такого адреса'])
+
+        self.process_queue(max_attempts=1)
+
+        self.assertFalse(GeocodingTask.objects.exists())
+
+
+@override_settings(GEOCODER_BACKEND='geocoding.stub.StubGeocoder')
+class RetryGeocodingTest(TestCase):
+    def setUp(self):
+        get_geolocator.cache_clear()
+        self.addCleanup(get_geolocator.cache_clear)
+        location_cache.clear()
+        self.geolocator = get_geolocator()
+
+    def create_failed_location(self, address, retry_in):
+        now = timezone.now()
+        return Location.objects.create(
+            address=address,
+            failures_count=1,
+            last_attempt_at=now - timedelta(hours=1),
+            next_retry_at=now + retry_in,
+        )
+
+    def test_retries_only_due_addresses(self):
+        due = self.create_failed_location('Москва, Тверская 1', timedelta(minutes=-1))
+        waiting = self.create_failed_location('Москва, Арбат 2', timedelta(hours=1))
+        still_unknown = self.create_failed_location('нет такого адреса', timedelta(minutes=-1))
+        self.geolocator.unknown_addresses.add('нет такого адреса')
+
+        stdout = StringIO()
+        call_command('retry_geocoding', batch_size=1, stdout=stdout)
+
+        self.assertEqual(sorted(self.geolocator.calls), ['Москва, Тверская 1', 'нет такого адреса'])
+        self.assertIn('Найдено координат: 1, не найдено: 1', stdout.getvalue())
+        due.refresh_from_db()
+        self.assertIsNotNone(due.coords)
+        self.assertEqual((due.failures_count, due.next_retry_at), (0, None))
+        waiting.refresh_from_db()
+        self.assertIsNone(waiting.coords)
+        still_unknown.refresh_from_db()
+        self.assertEqual(still_unknown.failures_count, 2)
+        self.assertGreater(still_unknown.next_retry_at, timezone.now())
+
+
+@override_settings(GEOCODER_BACKEND='geocoding.stub.StubGeocoder', METRICS_ENABLED=True)
+class GeocodingCommandsMetricsTest(TestCase):
+    def setUp(self):
+        get_geolocator.cache_clear()
+        self.addCleanup(get_geolocator.cache_clear)
+        location_cache.clear()
+        cache.clear()
+
+    def geocoder_requests(self):
+        snapshot = cache.get(WORKER_KEY_PREFIX + registry.worker_id)
+        return sum(
+            value for (name, _), value in snapshot['counters'].items()
+            if name == 'geocoder_requests_total'
+        )
+
+    def test_process_geocoding_queue_flushes_metrics(self):
+        GeocodingTask.objects.create(address='Москва, Тверская 1')
+
+        call_command('process_geocoding_queue', stdout=StringIO())
+
+        self.assertGreaterEqual(self.geocoder_requests(), 1)
+
+    def test_retry_geocoding_flushes_metrics(self):
+        Location.objects.create(address='Москва, Тверская 1')
+
+        call_command('retry_geocoding', stdout=StringIO())
+
+        self.assertGreaterEqual(self.geocoder_requests(), 1)
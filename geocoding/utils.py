@@ -1,38 +1,191 @@
 import logging
-from geopy.distance import geodesic
-from geopy.geocoders import Yandex
+from datetime import timedelta
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
 from geopy.exc import GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable, GeocoderQueryError
 from django.conf import settings
-from geocoding.models import Location
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from geocoding.addresses import canonicalize_address
+from geocoding.cache import location_cache
+from geocoding.models import Location, GeocodingTask
+from geocoding.signals import coordinates_changed
+from star_burger.metrics import registry
 
 logger = logging.getLogger(__name__)
 
-def fetch_coordinates(address):
-    if not address:
-        return None
-    
-    location, created = Location.objects.get_or_create(
-        address=address,
-        defaults={'lat': None, 'lon': None}
+GEOCODER_ERRORS = (GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable, GeocoderQueryError)
+
+
+@lru_cache(maxsize=None)
+def get_geolocator():
+    """Общий клиент геокодера на весь процесс."""
+    geocoder_class = import_string(settings.GEOCODER_BACKEND)
+    return geocoder_class(
+        api_key=settings.YANDEX_GEOCODER_API_KEY,
+        timeout=settings.GEOCODER_TIMEOUT,
     )
-    
-    if location.lat is not None and location.lon is not None:
-        return (location.lat, location.lon)
-    
-    try:
-        geolocator = Yandex(api_key=getattr(settings, 'YANDEX_GEOCODER_API_KEY', None))
-        location_data = geolocator.geocode(address)
+
+
+def fetch_coordinates_batch(addresses, geolocator=None, max_workers=None, timeout=None, deadline=None):
+    """
+    Геокодирует адреса параллельно в ограниченном пуле потоков.
+
+    Каждый запрос ограничен timeout, вся пачка — deadline секундами.
+    Возвращает словарь адрес → (lat, lon) только для адресов, которые
+    успели найтись. Остальные не ждём: их догеокодирует следующий вызов.
+    Найденные координаты сохраняются в Location из вызывающего потока,
+    а адресам, которые геокодер не нашёл, назначается время следующей попытки.
+    Варианты написания одного адреса геокодируются одним запросом.
+    """
+    addresses_by_key = {}
+    for address in set(addresses):
+        if address:
+            addresses_by_key.setdefault(canonicalize_address(address), []).append(address)
+    if not addresses_by_key:
+        return {}
+    addresses = [variants[0] for variants in addresses_by_key.values()]
+
+    geolocator = geolocator or get_geolocator()
+    max_workers = max_workers or settings.GEOCODER_MAX_WORKERS
+    timeout = timeout if timeout is not None else settings.GEOCODER_TIMEOUT
+    deadline = deadline if deadline is not None else settings.GEOCODER_DEADLINE
+
+    def geocode(address):
+        try:
+            location_data = geolocator.geocode(address, timeout=timeout)
+        except GEOCODER_ERRORS as e:
+            registry.inc('geocoder_requests_total', result='error')
+            logger.warning(f"Geocoder error for address '{address}': {e}")
+            return None
+        registry.inc('geocoder_requests_total', result='found' if location_data else 'not_found')
         if location_data:
-            coordinates = (location_data.latitude, location_data.longitude)
-            location.lat = coordinates[0]
-            location.lon = coordinates[1]
-            location.save()
-            return coordinates
-    except (GeocoderServiceError, GeocoderTimedOut, GeocoderUnavailable, GeocoderQueryError) as e:
-        logger.exception(f"Geocoder error for address '{address}': {e}")
-    return None
-
-def calculate_distance(coord1, coord2):
-    if coord1 and coord2:
-        return geodesic(coord1, coord2).km
-    return None
\ No newline at end of file
+            return (location_data.latitude, location_data.longitude)
+        return None
+
+    executor = ThreadPoolExecutor(max_workers=min(max_workers, len(addresses)))
+    try:
+        futures = {executor.submit(geocode, address): address for address in addresses}
+        done, not_done = wait(futures, timeout=deadline)
+    finally:
+        # Не блокируемся на опоздавших запросах: их потоки сами завершатся по таймауту
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if not_done:
+        logger.warning(f"Geocoder deadline exceeded, {len(not_done)} addresses left for later")
+
+    coordinates = {}
+    failed = []
+    for future in done:
+        coords = future.result()
+        address = futures[future]
+        if not coords:
+            failed.append(address)
+            continue
+        for variant in addresses_by_key[canonicalize_address(address)]:
+            coordinates[variant] = coords
+
+    save_coordinates(coordinates)
+    location_cache.set_many(coordinates)
+    record_failures(failed)
+    return coordinates
+
+
+def save_coordinates(coordinates):
+    """
+    Сохраняет словарь адрес → (lat, lon) в Location пачкой.
+    Для каждого канонического адреса создаётся не больше одной записи.
+    """
+    if not coordinates:
+        return
+
+    by_key = {}
+    for address, coords in coordinates.items():
+        by_key.setdefault(canonicalize_address(address), (address, coords))
+
+    existing = list(Location.objects.filter(canonical_key__in=by_key))
+    now = timezone.now()
+    for location in existing:
+        location.lat, location.lon = by_key[location.canonical_key][1]
+        location.failures_count = 0
+        location.next_retry_at = None
+        location.last_attempt_at = now
+        location.updated_at = now
+
+    existing_keys = {location.canonical_key for location in existing}
+    new_locations = [
+        Location(address=address, canonical_key=key, lat=lat, lon=lon, last_attempt_at=now)
+        for key, (address, (lat, lon)) in by_key.items()
+        if key not in existing_keys
+    ]
+
+    Location.objects.bulk_update(
+        existing,
+        ['lat', 'lon', 'failures_count', 'next_retry_at', 'last_attempt_at', 'updated_at'],
+    )
+    Location.objects.bulk_create(new_locations, ignore_conflicts=True)
+    # Новые записи ещё ни к чему не привязаны, сообщаем только об обновлённых
+    if existing:
+        coordinates_changed.send(
+            sender=Location,
+            location_ids=[location.pk for location in existing],
+        )
+
+
+def get_retry_delay(failures_count):
+    """Экспоненциальная пауза перед следующей попыткой геокодирования."""
+    delay = settings.GEOCODER_RETRY_BASE_DELAY * 2 ** (failures_count - 1)
+    return timedelta(seconds=min(delay, settings.GEOCODER_RETRY_MAX_DELAY))
+
+
+def record_failures(addresses):
+    """
+    Запоминает адреса, которые геокодер не нашёл.
+    Увеличивает счётчик неудач и откладывает следующую попытку.
+    """
+    by_key = {}
+    for address in addresses:
+        by_key.setdefault(canonicalize_address(address), address)
+    if not by_key:
+        return
+
+    now = timezone.now()
+    locations = list(Location.objects.filter(canonical_key__in=by_key))
+    existing_keys = {location.canonical_key for location in locations}
+    existing = [location for location in locations if location.coords is None]
+    for location in existing:
+        location.failures_count += 1
+        location.last_attempt_at = now
+        location.next_retry_at = now + get_retry_delay(location.failures_count)
+        location.updated_at = now
+        location_cache.set_failed([location.address], location.next_retry_at)
+
+    new_locations = []
+    for key, address in by_key.items():
+        if key in existing_keys:
+            continue
+        new_locations.append(Location(
+            address=address,
+            canonical_key=key,
+            failures_count=1,
+            last_attempt_at=now,
+            next_retry_at=now + get_retry_delay(1),
+        ))
+        location_cache.set_failed([address], now + get_retry_delay(1))
+
+    Location.objects.bulk_update(
+        existing,
+        ['failures_count', 'last_attempt_at', 'next_retry_at', 'updated_at'],
+    )
+    Location.objects.bulk_create(new_locations, ignore_conflicts=True)
+
+
+def enqueue_addresses(addresses):
+    """
+    Ставит адреса в очередь на фоновое геокодирование.
+    Один INSERT без обращения к геокодеру; повторы игнорируются.
+    """
+    GeocodingTask.objects.bulk_create(
+        [GeocodingTask(address=address) for address in set(addresses) if address],
+        ignore_conflicts=True,
+    )
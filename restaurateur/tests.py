@@ -1,3 +1,381 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connections
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, override_settings
+from django.urls import reverse
+
+from foodcartapp.availability import availability_index
+from foodcartapp.models import Order, OrderItem, Product, ProductCategory, Restaurant, RestaurantMenuItem
+from foodcartapp.nearby import restaurant_index
+from geocoding.cache import location_cache
+from geocoding.models import Location
+from star_burger.replicas import REPLICA_ALIAS, ReplicaPinMiddleware, read_from_replica
+
+
+@override_settings(GEOCODER_BACKEND='geocoding.stub.StubGeocoder')
+class ViewOrdersTest(TestCase):
+    # Сессия, пользователь, рестораны для фильтра, страница заказов с координатами,
+    # позиции, индекс наличия, пространственный индекс ресторанов, рестораны для страницы
+    EXPECTED_QUERIES = 8
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.product = Product.objects.create(name='Бургер', price=100, image='burger.jpg')
+        for index in range(3):
+            restaurant = Restaurant.objects.create(
+                name=f'Ресторан {index}',
+                address=f'Москва, Тверская {index}',
+            )
+            RestaurantMenuItem.objects.create(restaurant=restaurant, product=cls.product)
+            Location.objects.filter(pk=restaurant.location_id).update(lat=55.7 + index / 100, lon=37.6)
+
+    def setUp(self):
+        availability_index.reset()
+        restaurant_index.reset()
+        location_cache.clear()
+        self.client.force_login(self.manager)
+
+    def create_orders(self, count, status='UNPROCESSED'):
+        for index in range(count):
+            order = Order.objects.create(
+                firstname='Иван',
+                lastname='Петров',
+                phonenumber='+79161234567',
+                address=f'Москва, Арбат {index}',
+                status=status,
+            )
+            OrderItem.objects.create(order=order, product=self.product, quantity=1, price=100)
+            Location.objects.filter(pk=order.location_id).update(lat=55.75, lon=37.59)
+
+    def test_query_count_does_not_depend_on_number_of_orders(self):
+        for count in (1, 10):
+            self.create_orders(count)
+            self.create_orders(count, status='PROCESSING')
+            availability_index.reset()
+            restaurant_index.reset()
+            location_cache.clear()
+
+            with self.assertNumQueries(self.EXPECTED_QUERIES):
+                response = self.client.get(reverse('restaurateur:view_orders'))
+            self.assertEqual(response.status_code, 200)
+
+    def test_cache_lookups_do_not_depend_on_number_of_orders(self):
+        lookups = []
+        for count in (1, 10):
+            self.create_orders(count)
+            self.client.get(reverse('restaurateur:view_orders'))
+
+            with mock.patch.object(cache, 'get', wraps=cache.get) as cache_get:
+                response = self.client.get(reverse('restaurateur:view_orders'))
+            self.assertEqual(response.status_code, 200)
+            lookups.append(cache_get.call_count)
+
+        self.assertEqual(lookups[0], lookups[1])
+
+    def test_unprocessed_orders_get_restaurants_sorted_by_distance(self):
+        self.create_orders(1)
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        order = next(
+            order for order in response.context['order_items']
+            if order.status == 'UNPROCESSED'
+        )
+        distances = [item['distance'] for item in order.available_restaurants]
+        self.assertEqual(len(distances), 3)
+        self.assertEqual(distances, sorted(distances))
+
+    def test_restaurants_outside_search_radius_are_skipped(self):
+        far_away = Restaurant.objects.create(name='Ресторан в Казани', address='Казань, Баумана 1')
+        RestaurantMenuItem.objects.create(restaurant=far_away, product=self.product)
+        Location.objects.filter(pk=far_away.location_id).update(lat=55.79, lon=49.12)
+        self.create_orders(1)
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        order = next(
+            order for order in response.context['order_items']
+            if order.status == 'UNPROCESSED'
+        )
+        names = {item['restaurant'].name for item in order.available_restaurants}
+        self.assertEqual(len(names), 3)
+        self.assertNotIn(far_away.name, names)
+
+    @override_settings(ORDER_BOARD_PAGE_SIZE=3)
+    def test_cursor_pages_cover_all_orders_once(self):
+        self.create_orders(4)
+        self.create_orders(3, status='PROCESSING')
+        self.create_orders(1, status='COMPLETED')
+        expected_ids = list(
+            Order.objects.exclude(status='COMPLETED').order_by('registrated_at', 'id').values_list('id', flat=True)
+        )
+
+        pages = []
+        query = ''
+        while query is not None:
+            response = self.client.get(reverse('restaurateur:view_orders') + '?' + query)
+            pages.append([order.id for order in response.context['order_items']])
+            query = response.context['next_page_query']
+
+        self.assertEqual([len(page) for page in pages], [3, 3, 1])
+        self.assertEqual(sum(pages, []), expected_ids)
+
+        response = self.client.get(
+            reverse('restaurateur:view_orders') + '?' + response.context['previous_page_query']
+        )
+        self.assertEqual([order.id for order in response.context['order_items']], pages[1])
+
+    def test_filters_by_status(self):
+        self.create_orders(2)
+        self.create_orders(2, status='PROCESSING')
+
+        response = self.client.get(reverse('restaurateur:view_orders'), {'status': 'PROCESSING'})
+
+        self.assertEqual(
+            {order.status for order in response.context['order_items']},
+            {'PROCESSING'},
+        )
+        self.assertEqual(len(response.context['order_items']), 2)
+
+    def test_broken_cursor_shows_first_page(self):
+        self.create_orders(1)
+
+        response = self.client.get(reverse('restaurateur:view_orders'), {'after': 'испорчен'})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['order_items']), 1)
+        self.assertTrue(response.context['filter_form'].errors)
+
+    def read_events(self, response):
+        events = []
+        for chunk in response.streaming_content:
+            fields = dict(
+                line.split(': ', 1)
+                for line in chunk.decode().splitlines()
+                if line and not line.startswith(':')
+            )
+            if fields.get('event') == 'order':
+                events.append((fields['id'], json.loads(fields['data'])))
+        return events
+
+    @override_settings(ORDER_STREAM_TIMEOUT=0, ORDER_STREAM_LAG=0)
+    def test_stream_sends_only_orders_changed_after_cursor(self):
+        self.create_orders(1)
+        response = self.client.get(reverse('restaurateur:view_orders'))
+        cursor = response.context['stream_cursor']
+
+        self.create_orders(1)
+        changed = Order.objects.latest('id')
+        completed = Order.objects.earliest('id')
+        completed.status = 'COMPLETED'
+        completed.save()
+
+        response = self.client.get(reverse('restaurateur:order_updates'), {'since': cursor})
+        events = self.read_events(response)
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertEqual([data['id'] for _, data in events], [changed.id, completed.id])
+        self.assertIn(f'id="order-{changed.id}"', events[0][1]['html'])
+        # Выполненный заказ пропадает с доски
+        self.assertEqual(events[1][1]['html'], '')
+
+        response = self.client.get(
+            reverse('restaurateur:order_updates'),
+            HTTP_LAST_EVENT_ID=events[-1][0],
+        )
+        self.assertEqual(self.read_events(response), [])
+
+    @override_settings(ORDER_STREAM_TIMEOUT=60, ORDER_STREAM_LAG=0)
+    def test_stream_under_wsgi_returns_after_one_check_without_geocoding(self):
+        cursor = self.client.get(reverse('restaurateur:view_orders')).context['stream_cursor']
+        self.create_orders(1)
+        order = Order.objects.get()
+        Location.objects.filter(pk=order.location_id).update(lat=None, lon=None)
+
+        response = self.client.get(reverse('restaurateur:order_updates'), {'since': cursor})
+        events = self.read_events(response)
+
+        # Соединение закрылось сразу, не дожидаясь ORDER_STREAM_TIMEOUT
+        self.assertEqual([data['id'] for _, data in events], [order.id])
+        self.assertIsNone(Location.objects.get(pk=order.location_id).lat)
+
+    @override_settings(ASYNC_API=True, ORDER_STREAM_TIMEOUT=0, ORDER_STREAM_LAG=0)
+    async def test_stream_under_asgi_is_async(self):
+        await self.async_client.aforce_login(self.manager)
+        response = await self.async_client.get(reverse('restaurateur:view_orders'))
+        cursor = response.context['stream_cursor']
+        await sync_to_async(self.create_orders)(1)
+        order = await Order.objects.aget()
+
+        response = await self.async_client.get(reverse('restaurateur:order_updates'), {'since': cursor})
+        chunks = [chunk async for chunk in response.streaming_content]
+
+        self.assertTrue(response.is_async)
+        self.assertIn(f'"id": {order.id}', b''.join(chunks).decode())
+
+
+@override_settings(PRODUCTS_PAGE_SIZE=2, PRODUCTS_PAGE_COLUMNS=2)
+class ViewProductsTest(TestCase):
+    # Сессия, пользователь, рестораны, число товаров, страница товаров с категориями
+    EXPECTED_QUERIES = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        cls.restaurants = [
+            Restaurant.objects.create(name=f'Ресторан {index}', address=f'Москва, Тверская {index}')
+            for index in range(3)
+        ]
+        cls.products = [
+            Product.objects.create(name=f'Бургер {index}', price=100, image='burger.jpg')
+            for index in range(3)
+        ]
+        RestaurantMenuItem.objects.create(restaurant=cls.restaurants[0], product=cls.products[0])
+        RestaurantMenuItem.objects.create(
+            restaurant=cls.restaurants[1], product=cls.products[0], availability=False,
+        )
+        RestaurantMenuItem.objects.create(restaurant=cls.restaurants[2], product=cls.products[1])
+
+    def setUp(self):
+        availability_index.reset()
+        self.client.force_login(self.manager)
+
+    def test_query_count_does_not_depend_on_menu_size(self):
+        self.client.get(reverse('restaurateur:ProductsView'))
+
+        with self.assertNumQueries(self.EXPECTED_QUERIES):
+            response = self.client.get(reverse('restaurateur:ProductsView'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_shows_window_of_restaurants_and_page_of_products(self):
+        response = self.client.get(reverse('restaurateur:ProductsView'))
+
+        self.assertEqual(response.context['restaurants'], self.restaurants[:2])
+        self.assertEqual(
+            [
+                (product, availability)
+                for product, availability in response.context['products_with_restaurant_availability']
+            ],
+            [(self.products[0], [True, False]), (self.products[1], [False, False])],
+        )
+
+        response = self.client.get(
+            reverse('restaurateur:ProductsView') + '?' + response.context['next_columns_query']
+        )
+        self.assertEqual(response.context['restaurants'], self.restaurants[2:])
+        self.assertEqual(
+            [availability for _, availability in response.context['products_with_restaurant_availability']],
+            [[False], [True]],
+        )
+        self.assertIsNone(response.context['next_columns_query'])
+
+
+class ReplicaRoutingTest(TestCase):
+    """Реплика — второй файл SQLite со своими данными, чтобы было видно, откуда пришло чтение."""
+
+    @classmethod
+    def setUpClass(cls):
+        # Псевдоним добавляется уже после создания тестовых баз, поэтому и
+        # список баз теста задаём здесь, а не атрибутом класса
+        cls.databases = {'default', REPLICA_ALIAS}
+        replica_dir = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(replica_dir.cleanup)
+        # Если реплика задана в окружении, в тестах она зеркалит основную базу — подменяем её
+        cls.configured_replica = connections.settings.get(REPLICA_ALIAS)
+        cls.close_replica()
+        connections.settings[REPLICA_ALIAS] = {
+            **connections.settings['default'],
+            'NAME': os.path.join(replica_dir.name, 'replica.sqlite3'),
+        }
+        cls.addClassCleanup(cls.restore_replica)
+        with connections[REPLICA_ALIAS].schema_editor() as editor:
+            for model in (Location, Restaurant, ProductCategory, Product, Order, OrderItem):
+                editor.create_model(model)
+        super().setUpClass()
+
+    @classmethod
+    def close_replica(cls):
+        if REPLICA_ALIAS in connections.settings:
+            connections[REPLICA_ALIAS].close()
+            del connections[REPLICA_ALIAS]
+
+    @classmethod
+    def restore_replica(cls):
+        cls.close_replica()
+        if cls.configured_replica is None:
+            del connections.settings[REPLICA_ALIAS]
+        else:
+            connections.settings[REPLICA_ALIAS] = cls.configured_replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.manager = User.objects.create_user('manager', password='secret', is_staff=True)
+        Restaurant.objects.using(REPLICA_ALIAS).bulk_create([Restaurant(name='С реплики')])
+
+    def handle(self, get_response, cookies=None):
+        request = RequestFactory().get('/')
+        request.COOKIES.update(cookies or {})
+        return ReplicaPinMiddleware(get_response)(request)
+
+    def read_names(self):
+        with read_from_replica():
+            return list(Restaurant.objects.values_list('name', flat=True))
+
+    def test_manager_pages_read_from_replica(self):
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('restaurateur:RestaurantView'))
+
+        self.assertContains(response, 'С реплики')
+
+    def test_board_with_flagged_order_does_not_pin_to_primary(self):
+        Order.objects.using(REPLICA_ALIAS).bulk_create([Order(
+            firstname='Иван', lastname='Петров', phonenumber='+79161234567', address='',
+            payment_method='CASH', coords_error=True,
+        )])
+        self.client.force_login(self.manager)
+
+        response = self.client.get(reverse('restaurateur:view_orders'))
+
+        self.assertEqual([order.coords_error for order in response.context['order_items']], [True])
+        self.assertNotIn('primary_pin', response.cookies)
+
+    def test_request_reads_own_writes_from_primary(self):
+        def get_response(request):
+            names = self.read_names()
+            Restaurant.objects.bulk_create([Restaurant(name='Новый')])
+            return HttpResponse(json.dumps([names, self.read_names()]))
+
+        response = self.handle(get_response)
+
+        self.assertEqual(json.loads(response.content), [['С реплики'], ['Новый']])
+        self.assertIn('primary_pin', response.cookies)
+
+    def test_pin_cookie_keeps_next_requests_on_primary(self):
+        def get_response(request):
+            return HttpResponse(json.dumps(self.read_names()))
+
+        pinned = self.handle(get_response, cookies={'primary_pin': '1'})
+        unpinned = self.handle(get_response)
+
+        self.assertEqual(json.loads(pinned.content), [])
+        self.assertNotIn('primary_pin', pinned.cookies)
+        self.assertEqual(json.loads(unpinned.content), ['С реплики'])
+
+
+class NoReplicaTest(TestCase):
+    def test_reads_fall_back_to_primary(self):
+        Restaurant.objects.bulk_create([Restaurant(name='Основная')])
+
+        with read_from_replica():
+            names = list(Restaurant.objects.values_list('name', flat=True))
+
+        self.assertEqual(names, ['Основная'])
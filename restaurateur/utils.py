@@ -1,73 +1,265 @@
-from geocoding.utils import fetch_coordinates, calculate_distance
-from geocoding.models import Location
+import base64
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from geocoding.cache import location_cache
+from geocoding.utils import fetch_coordinates_batch
+from foodcartapp.availability import attach_available_restaurants
 from foodcartapp.models import Restaurant, Order
+from foodcartapp.nearby import restaurant_index
+
+
+def encode_cursor(moment, order_id):
+    """Курсор — непрозрачная строка с ключом (момент времени, id) заказа."""
+    key = json.dumps([moment.isoformat(), order_id])
+    return base64.urlsafe_b64encode(key.encode()).decode()
+
+
+def decode_cursor(cursor):
+    """Возвращает пару (момент времени, id) или ValueError для испорченного курсора."""
+    try:
+        moment, order_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(moment), int(order_id)
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError(f'Некорректный курсор: {cursor}')
+
+
+def paginate_orders(orders, after=None, before=None, page_size=None):
+    """
+    Листает заказы по ключу (registrated_at, id) без OFFSET.
+
+    after и before — раскодированные курсоры соседних страниц. Запрос
+    читает на одну запись больше страницы, чтобы узнать, есть ли следующая.
+    Возвращает тройку: заказы страницы, курсор предыдущей и следующей
+    страницы (None, если листать некуда).
+    """
+    page_size = page_size or settings.ORDER_BOARD_PAGE_SIZE
+    if before is not None:
+        registrated_at, order_id = before
+        orders = orders.filter(
+            Q(registrated_at__lt=registrated_at)
+            | Q(registrated_at=registrated_at, id__lt=order_id)
+        ).order_by('-registrated_at', '-id')
+    else:
+        if after is not None:
+            registrated_at, order_id = after
+            orders = orders.filter(
+                Q(registrated_at__gt=registrated_at)
+                | Q(registrated_at=registrated_at, id__gt=order_id)
+            )
+        orders = orders.order_by('registrated_at', 'id')
+
+    page = list(orders[:page_size + 1])
+    has_more = len(page) > page_size
+    page = page[:page_size]
+    if before is not None:
+        page.reverse()
+        has_previous, has_next = has_more, True
+    else:
+        has_previous, has_next = after is not None, has_more
+
+    if not page:
+        return page, None, None
+    previous_cursor = encode_cursor(page[0].registrated_at, page[0].id) if has_previous else None
+    next_cursor = encode_cursor(page[-1].registrated_at, page[-1].id) if has_next else None
+    return page, previous_cursor, next_cursor
+
+
+def get_changed_orders(orders, since, limit=None):
+    """
+    Возвращает заказы, созданные или изменённые после курсора since,
+    по ключу (updated_at, id), и курсор для следующего запроса.
+
+    Самые свежие ORDER_STREAM_LAG секунд не отдаются: транзакция,
+    начатая раньше, может ещё не закоммитить заказ с меньшей датой
+    изменения, и курсор не должен его перепрыгнуть.
+    """
+    limit = limit or settings.ORDER_STREAM_BATCH_SIZE
+    updated_at, order_id = since
+    horizon = timezone.now() - timedelta(seconds=settings.ORDER_STREAM_LAG)
+    changed = list(
+        orders
+        .filter(
+            Q(updated_at__gt=updated_at)
+            | Q(updated_at=updated_at, id__gt=order_id)
+        )
+        .filter(updated_at__lte=horizon)
+        .order_by('updated_at', 'id')[:limit]
+    )
+    if not changed:
+        return changed, since
+    return changed, (changed[-1].updated_at, changed[-1].id)
 
 
 def get_restaurants_by_ids(restaurant_ids):
     """Получает рестораны по списку ID. Атомарная функция."""
     if not restaurant_ids:
         return []
-    return list(Restaurant.objects.filter(id__in=restaurant_ids))
+    return list(Restaurant.objects.filter(id__in=restaurant_ids).select_related('location'))
 
 
 def fetch_coordinates_for_addresses(addresses):
     """
     Получает координаты для адресов.
-    Возвращает словарь: адрес → (lat, lon).
+    Возвращает пару: словарь адрес → (lat, lon) и множество адресов,
+    которые геокодер не нашёл.
     """
     if not addresses:
-        return {}
+        return {}, set()
     
-    coords_cache = {}
+    # Берем из кэша в памяти, недостающее — из Location одним запросом.
+    # Ненайденные адреса не повторяем, пока не подошло время следующей попытки
+    coords_cache, unresolvable = location_cache.resolve_many(addresses)
     
-    # Берем из кэша БД
-    locations = Location.objects.filter(address__in=addresses)
-    for loc in locations:
-        if loc.lat is not None and loc.lon is not None:
-            coords_cache[loc.address] = (loc.lat, loc.lon)
+    # Запрашиваем недостающие у геокодера параллельно, с общим дедлайном.
+    # Не успевшие адреса останутся без координат до следующего открытия страницы
+    missing = addresses - set(coords_cache.keys()) - unresolvable
+    coords_cache.update(fetch_coordinates_batch(missing))
     
-    # Запрашиваем недостающие у геокодера
-    missing = addresses - set(coords_cache.keys())
-    for address in missing:
-        coords = fetch_coordinates(address)
-        if coords:
-            coords_cache[address] = coords
-            Location.objects.get_or_create(
-                address=address,
-                defaults={'lat': coords[0], 'lon': coords[1]}
-            )
+    not_resolved = missing - set(coords_cache.keys())
+    if not_resolved:
+        unresolvable.update(location_cache.resolve_many(not_resolved)[1])
     
-    return coords_cache
+    return coords_cache, unresolvable
 
 
-def calculate_distance_for_order(order, restaurants, coords_cache):
+def collect_coordinates(objects, geocode=True):
     """
-    Считает расстояния для ОДНОГО заказа до списка ресторанов.
-    Возвращает (список_с_расстояниями, есть_ли_ошибка_координат).
+    Собирает координаты заказов и ресторанов, загруженных с select_related('location').
+    Возвращает пару: словарь адрес → (lat, lon) и множество адресов,
+    которые геокодер не нашёл. К геокодеру идут только адреса,
+    у которых в привязанной Location ещё нет координат, и только при geocode=True.
     """
-    order_coords = coords_cache.get(order.address)
-    
-    if not order_coords:
-        return [], True  # Ошибка координат
-    
-    results = []
-    for restaurant in restaurants:
-        rest_coords = coords_cache.get(restaurant.address)
-        distance = calculate_distance(order_coords, rest_coords)
-        results.append({
-            'restaurant': restaurant,
-            'distance': distance
-        })
-    
-    # Сортируем по расстоянию
-    results.sort(
-        key=lambda x: x['distance'] if x['distance'] is not None else float('inf')
+    coords_cache = {}
+    unresolvable = set()
+    missing = set()
+    now = timezone.now()
+    for obj in objects:
+        if not obj.address:
+            continue
+        location = obj.location
+        if location is not None and location.coords:
+            coords_cache[obj.address] = location.coords
+        elif location is not None and location.next_retry_at and location.next_retry_at > now:
+            unresolvable.add(obj.address)
+        else:
+            missing.add(obj.address)
+
+    if not geocode:
+        return coords_cache, unresolvable
+    fetched, failed = fetch_coordinates_for_addresses(missing - set(coords_cache))
+    coords_cache.update(fetched)
+    unresolvable.update(failed)
+    return coords_cache, unresolvable
+
+
+def find_nearest_restaurants(orders, coords_cache, unresolvable=()):
+    """
+    Подбирает заказам ближайшие рестораны из тех, что могут их приготовить.
+    Кандидаты берутся из пространственного индекса: не дальше
+    RESTAURANT_SEARCH_RADIUS_KM и не больше NEAREST_RESTAURANTS_LIMIT штук.
+    Рестораны без координат идут в конце списка без расстояния, как и все
+    рестораны для заказов, чей адрес ещё не успели геокодировать.
+    Ошибкой координат считается только адрес, который геокодер не нашёл.
+    Возвращает пару: словарь order.id → список (restaurant_id, distance)
+    и ID заказов с ошибкой координат.
+    """
+    limit = settings.NEAREST_RESTAURANTS_LIMIT
+    unlocated = restaurant_index.unlocated_ids()
+
+    nearest = {}
+    error_order_ids = []
+    located_orders = []
+    for order in orders:
+        if not order.address or order.address in unresolvable:
+            error_order_ids.append(order.id)
+            nearest[order.id] = []
+        elif coords_cache.get(order.address):
+            located_orders.append(order)
+        else:
+            nearest[order.id] = [
+                (restaurant_id, None) for restaurant_id in sorted(order.available_restaurant_ids)
+            ][:limit]
+
+    # Одним вызовом на всю страницу: индекс сверяет версию в кэше один раз
+    found_by_order = restaurant_index.nearest_many(
+        [
+            (coords_cache[order.address], set(order.available_restaurant_ids))
+            for order in located_orders
+        ],
+        k=limit,
+        radius_km=settings.RESTAURANT_SEARCH_RADIUS_KM,
     )
-    
-    return results, False
+    for order, found in zip(located_orders, found_by_order):
+        without_coords = sorted(set(order.available_restaurant_ids) & unlocated)
+        found.extend((restaurant_id, None) for restaurant_id in without_coords)
+        nearest[order.id] = found[:limit]
+
+    return nearest, error_order_ids
 
 
 def mark_coords_errors(order_ids):
     """Обновляет флаг coords_error для заказов. Атомарная функция."""
     if order_ids:
-        Order.objects.filter(id__in=order_ids).update(coords_error=True)
\ No newline at end of file
+        # Уже отмеченные не трогаем, чтобы не сдвигать им дату изменения
+        Order.objects.filter(id__in=order_ids, coords_error=False).update(
+            coords_error=True,
+            updated_at=timezone.now(),
+        )
+
+
+def attach_restaurants_with_distances(orders, geocode=True):
+    """
+    Для уже загруженных заказов (с prefetch позиций и select_related('location'))
+    находит рестораны, которые могут их приготовить, и расстояния до них.
+    Работает с теми же объектами, без повторной загрузки заказов.
+    С geocode=False обходится уже известными координатами и не ждёт геокодер.
+    """
+    if not orders:
+        return orders
+
+    attach_available_restaurants(orders)
+
+    # Координаты заказов берём из привязанных Location, геокодируем только недостающие
+    coords_cache, unresolvable = collect_coordinates(orders, geocode)
+
+    # Рестораны-кандидаты без координат геокодируем сразу: сигнал геокодера
+    # обновит их в индексе до поиска ближайших
+    candidate_ids = set()
+    for order in orders:
+        candidate_ids.update(order.available_restaurant_ids)
+    unlocated_ids = restaurant_index.unlocated_ids() & candidate_ids
+    if unlocated_ids and geocode:
+        collect_coordinates(get_restaurants_by_ids(unlocated_ids))
+
+    nearest, error_order_ids = find_nearest_restaurants(orders, coords_cache, unresolvable)
+
+    # Загружаем одним запросом только рестораны, которые попадут на страницу
+    restaurants = {
+        restaurant.id: restaurant
+        for restaurant in get_restaurants_by_ids({
+            restaurant_id
+            for found in nearest.values()
+            for restaurant_id, _ in found
+        })
+    }
+    # Уже отмеченные не пишем заново: лишний UPDATE закрепил бы менеджера за основной базой
+    new_error_order_ids = [
+        order.id for order in orders
+        if order.id in error_order_ids and not order.coords_error
+    ]
+    for order in orders:
+        order.coords_error = order.id in error_order_ids
+        order.available_restaurants = [
+            {'restaurant': restaurants[restaurant_id], 'distance': distance}
+            for restaurant_id, distance in nearest[order.id]
+            if restaurant_id in restaurants
+        ]
+
+    # Сохраняем ошибки координат в БД
+    mark_coords_errors(new_error_order_ids)
+    return orders
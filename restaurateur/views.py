@@ -1,19 +1,33 @@
+import asyncio
+import json
+import time
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
 from django import forms
+from django.conf import settings
+from django.core.paginator import Paginator
 from django.db import models
+from django.http import HttpResponseBadRequest, StreamingHttpResponse
 from django.shortcuts import redirect, render
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.views import View
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.contrib.auth.decorators import user_passes_test
 
 from django.contrib.auth import authenticate, login
 from django.contrib.auth import views as auth_views
 
-from foodcartapp.models import Product, Restaurant, Order, OrderItem
+from foodcartapp.availability import availability_index
+from foodcartapp.models import ORDER_STATUSES, PAYMENT_METHODS, Product, Restaurant, Order, OrderItem
+from star_burger.replicas import replica_reads
 from .utils import (
-    get_restaurants_by_ids,
-    fetch_coordinates_for_addresses,
-    calculate_distance_for_order,
-    mark_coords_errors,
+    attach_restaurants_with_distances,
+    decode_cursor,
+    encode_cursor,
+    get_changed_orders,
+    paginate_orders,
 )
 
 
@@ -34,6 +48,44 @@ class Login(forms.Form):
     )
 
 
+class OrderFilterForm(forms.Form):
+    status = forms.ChoiceField(
+        label='Статус', required=False,
+        choices=[('', 'Все, кроме выполненных'), *ORDER_STATUSES],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    payment_method = forms.ChoiceField(
+        label='Способ оплаты', required=False,
+        choices=[('', 'Любой'), *PAYMENT_METHODS],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    restaurant = forms.TypedChoiceField(
+        label='Ресторан', required=False, coerce=int, empty_value=None,
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    after = forms.CharField(required=False, widget=forms.HiddenInput)
+    before = forms.CharField(required=False, widget=forms.HiddenInput)
+
+    def __init__(self, *args, restaurants=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['restaurant'].choices = [('', 'Любой'), *restaurants]
+
+    def clean_after(self):
+        return self.clean_cursor('after')
+
+    def clean_before(self):
+        return self.clean_cursor('before')
+
+    def clean_cursor(self, name):
+        cursor = self.cleaned_data[name]
+        if not cursor:
+            return None
+        try:
+            return decode_cursor(cursor)
+        except ValueError:
+            raise forms.ValidationError('Ссылка на страницу устарела, начните с первой')
+
+
 class LoginView(View):
     def get(self, request, *args, **kwargs):
         form = Login()
@@ -70,118 +122,234 @@ def is_manager(user):
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@replica_reads
 def view_products(request):
-    restaurants = list(Restaurant.objects.order_by('name'))
-    products = list(Product.objects.prefetch_related('menu_items'))
+    # Рестораны — колонки таблицы: показываем окно из PRODUCTS_PAGE_COLUMNS штук
+    restaurants = list(Restaurant.objects.order_by('name').only('id', 'name'))
+    columns = settings.PRODUCTS_PAGE_COLUMNS
+    try:
+        column_offset = max(0, int(request.GET.get('columns', 0)))
+    except ValueError:
+        column_offset = 0
+    visible_restaurants = restaurants[column_offset:column_offset + columns]
 
+    paginator = Paginator(
+        Product.objects.select_related('category').order_by('id'),
+        settings.PRODUCTS_PAGE_SIZE,
+    )
+    page = paginator.get_page(request.GET.get('page'))
+
+    # Наличие берём из битсетов индекса, без загрузки пунктов меню
     products_with_restaurant_availability = []
-    for product in products:
-        availability = {item.restaurant_id: item.availability for item in product.menu_items.all()}
-        ordered_availability = [availability.get(restaurant.id, False) for restaurant in restaurants]
+    availability = availability_index.snapshot()
+    for product in page:
+        bits = availability.get(product.id, 0)
+        ordered_availability = [bool(bits >> restaurant.id & 1) for restaurant in visible_restaurants]
 
         products_with_restaurant_availability.append(
             (product, ordered_availability)
         )
 
+    previous_page_query = next_page_query = None
+    if page.has_previous():
+        previous_page_query = update_query(request, page=page.previous_page_number())
+    if page.has_next():
+        next_page_query = update_query(request, page=page.next_page_number())
+
+    previous_columns_query = next_columns_query = None
+    if column_offset > 0:
+        previous_columns_query = update_query(request, columns=max(0, column_offset - columns))
+    if column_offset + columns < len(restaurants):
+        next_columns_query = update_query(request, columns=column_offset + columns)
+
     return render(request, template_name="products_list.html", context={
         'products_with_restaurant_availability': products_with_restaurant_availability,
-        'restaurants': restaurants,
+        'restaurants': visible_restaurants,
+        'page': page,
+        'previous_page_query': previous_page_query,
+        'next_page_query': next_page_query,
+        'previous_columns_query': previous_columns_query,
+        'next_columns_query': next_columns_query,
     })
 
 
 @user_passes_test(is_manager, login_url='restaurateur:login')
+@replica_reads
 def view_restaurants(request):
     return render(request, template_name="restaurants_list.html", context={
         'restaurants': Restaurant.objects.all(),
     })
 
 
-@user_passes_test(is_manager, login_url='restaurateur:login')
-def view_orders(request):
-    # 1. Получаем заказы (без координат)
-    orders = Order.objects.exclude(status='COMPLETED').with_total_price().prefetch_related(
+def get_board_orders():
+    """Заказы для доски с рестораном, координатами и позициями: два запроса."""
+    return Order.objects.select_related('restaurant', 'location').prefetch_related(
         models.Prefetch(
             'items',
-            queryset=OrderItem.objects.select_related('product')
+            queryset=OrderItem.objects.only('id', 'order_id', 'product_id')
         )
     )
-    
-    # 2. Разделяем на необработанные и остальные
-    unprocessed_orders = []
-    other_orders = []
-    
-    for order in orders:
-        if order.status == 'UNPROCESSED':
-            unprocessed_orders.append(order)
-        else:
-            other_orders.append(order)
-    
-    # 3. Для необработанных: находим доступные рестораны и считаем расстояния
-    if unprocessed_orders:
-        unprocessed_ids = [order.id for order in unprocessed_orders]
-        
-        # Получаем заказы с available_restaurant_ids (только ID, без координат!)
-        orders_with_restaurants = Order.objects.filter(
-            id__in=unprocessed_ids
-        ).with_available_restaurants()
-        
-        # Собираем все ID ресторанов для загрузки
-        all_restaurant_ids = set()
-        for order in orders_with_restaurants:
-            all_restaurant_ids.update(order.available_restaurant_ids)
-        
-        # Загружаем рестораны одним запросом
-        restaurants = get_restaurants_by_ids(all_restaurant_ids)
-        restaurants_dict = {r.id: r for r in restaurants}
-        
-        # Собираем адреса для геокодинга
-        addresses = set()
-        for order in orders_with_restaurants:
-            if order.address:
-                addresses.add(order.address)
-        for r in restaurants:
-            if r.address:
-                addresses.add(r.address)
-        
-        # Получаем координаты (атомарная функция)
-        coords_cache = fetch_coordinates_for_addresses(addresses)
-        
-        # Считаем расстояния для каждого заказа
-        error_order_ids = []
-        
-        for order in orders_with_restaurants:
-            # Получаем объекты ресторанов для этого заказа
-            order_restaurants = [
-                restaurants_dict[rid] 
-                for rid in order.available_restaurant_ids 
-                if rid in restaurants_dict
-            ]
-            
-            # Атомарная функция: считает расстояния
-            distances, has_error = calculate_distance_for_order(
-                order, order_restaurants, coords_cache
-            )
-            
-            if has_error:
-                order.coords_error = True
-                order.available_restaurants = []
-                error_order_ids.append(order.id)
-            else:
-                order.coords_error = False
-                order.available_restaurants = distances
-        
-        # Сохраняем ошибки координат в БД
-        mark_coords_errors(error_order_ids)
-        
-        # Обновляем unprocessed_orders на обработанные версии
-        orders_by_id = {order.id: order for order in orders_with_restaurants}
-        for index, order in enumerate(unprocessed_orders):
-            if order.id in orders_by_id:
-                unprocessed_orders[index] = orders_by_id[order.id]
-    
-    # 4. Объединяем и возвращаем
-    all_orders = unprocessed_orders + other_orders
-    
+
+
+def get_order_filters(request):
+    """Разбирает фильтры доски из GET-параметров. Возвращает форму и словарь фильтров."""
+    restaurants = list(Restaurant.objects.order_by('name').values_list('id', 'name'))
+    form = OrderFilterForm(request.GET, restaurants=restaurants)
+    filters = form.cleaned_data if form.is_valid() else {}
+    return form, filters
+
+
+def filter_orders(orders, filters):
+    # Фильтры совпадают с префиксами индексов (поле, registrated_at, id)
+    if filters.get('status'):
+        orders = orders.filter(status=filters['status'])
+    else:
+        orders = orders.exclude(status='COMPLETED')
+    if filters.get('payment_method'):
+        orders = orders.filter(payment_method=filters['payment_method'])
+    if filters.get('restaurant'):
+        orders = orders.filter(restaurant_id=filters['restaurant'])
+    return orders
+
+
+def order_matches_filters(order, filters):
+    """То же, что filter_orders, но для уже загруженного заказа."""
+    if filters.get('status'):
+        if order.status != filters['status']:
+            return False
+    elif order.status == 'COMPLETED':
+        return False
+    if filters.get('payment_method') and order.payment_method != filters['payment_method']:
+        return False
+    if filters.get('restaurant') and order.restaurant_id != filters['restaurant']:
+        return False
+    return True
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+@replica_reads
+def view_orders(request):
+    # Изменения после этого момента доска получит через поток обновлений
+    stream_since = timezone.now() - timedelta(seconds=settings.ORDER_STREAM_LAG)
+    form, filters = get_order_filters(request)
+
+    # 1. Загружаем только одну страницу: заказы и их позиции — два запроса
+    orders, previous_cursor, next_cursor = paginate_orders(
+        filter_orders(get_board_orders(), filters),
+        after=filters.get('after'),
+        before=filters.get('before'),
+    )
+
+    # 2. Рестораны и расстояния считаем только для необработанных заказов страницы
+    attach_restaurants_with_distances(
+        [order for order in orders if order.status == 'UNPROCESSED']
+    )
+
     return render(request, template_name='order_items.html', context={
-        'order_items': all_orders,
-    })
\ No newline at end of file
+        'order_items': orders,
+        'filter_form': form,
+        'board_url': request.get_full_path(),
+        'previous_page_query': get_page_query(request, 'before', previous_cursor),
+        'next_page_query': get_page_query(request, 'after', next_cursor),
+        'stream_cursor': encode_cursor(stream_since, 0),
+    })
+
+
+def get_page_query(request, name, cursor):
+    """Строка запроса соседней страницы с теми же фильтрами."""
+    if cursor is None:
+        return None
+    return update_query(request, **{'after': None, 'before': None, name: cursor})
+
+
+def update_query(request, **params):
+    """Строка запроса текущей страницы с заменёнными параметрами. None убирает параметр."""
+    query = request.GET.copy()
+    for name, value in params.items():
+        query.pop(name, None)
+        if value is not None:
+            query[name] = value
+    return query.urlencode()
+
+
+@user_passes_test(is_manager, login_url='restaurateur:login')
+def stream_order_updates(request):
+    """
+    Поток Server-Sent Events с заказами, созданными или изменёнными после курсора.
+
+    Для каждого заказа отдаётся готовая строка таблицы или пустой html,
+    если заказ больше не подходит под фильтры доски. Под ASGI (ASYNC_API)
+    соединение живёт ORDER_STREAM_TIMEOUT секунд и ждёт изменений без
+    потока-воркера. Под WSGI открытый поток держал бы воркер, поэтому
+    ответ содержит одну проверку и сразу закрывается, а браузер
+    переподключается через ORDER_STREAM_POLL_INTERVAL секунд. Последний
+    полученный курсор браузер присылает в заголовке Last-Event-ID.
+    """
+    cursor = request.headers.get('Last-Event-ID') or request.GET.get('since', '')
+    try:
+        since = decode_cursor(cursor)
+    except ValueError:
+        return HttpResponseBadRequest('Некорректный курсор')
+
+    _, filters = get_order_filters(request)
+    query = request.GET.copy()
+    for name in ('since', 'after', 'before'):
+        query.pop(name, None)
+    board_url = f"{reverse('restaurateur:view_orders')}?{query.urlencode()}"
+
+    if settings.ASYNC_API:
+        events = stream_order_events(since, filters, board_url)
+    else:
+        events = poll_order_events(since, filters, board_url)
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Не даём nginx буферизовать поток
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def poll_order_events(since, filters, board_url):
+    retry = max(settings.ORDER_STREAM_RETRY, settings.ORDER_STREAM_POLL_INTERVAL)
+    yield f'retry: {int(retry * 1000)}\n\n'
+    events, _, _ = get_order_events(since, filters, board_url)
+    yield from events
+
+
+async def stream_order_events(since, filters, board_url):
+    yield f'retry: {settings.ORDER_STREAM_RETRY * 1000}\n\n'
+    deadline = time.monotonic() + settings.ORDER_STREAM_TIMEOUT
+    while True:
+        events, since, count = await sync_to_async(get_order_events)(since, filters, board_url)
+        for event in events:
+            yield event
+
+        if time.monotonic() >= deadline:
+            return
+        if count < settings.ORDER_STREAM_BATCH_SIZE:
+            # Комментарий не даёт прокси закрыть молчащее соединение
+            yield ': ping\n\n'
+            await asyncio.sleep(settings.ORDER_STREAM_POLL_INTERVAL)
+
+
+def get_order_events(since, filters, board_url):
+    """
+    Одна проверка изменений. Возвращает события, новый курсор и число
+    изменённых заказов. Геокодер здесь не вызывается: адреса новых заказов
+    найдёт фоновый воркер, а до тех пор рестораны идут без расстояний.
+    """
+    # Когда ничего не менялось, один запрос по индексу (updated_at, id)
+    orders, since = get_changed_orders(get_board_orders(), since)
+    matching = {order.id for order in orders if order_matches_filters(order, filters)}
+    attach_restaurants_with_distances([
+        order for order in orders
+        if order.id in matching and order.status == 'UNPROCESSED'
+    ], geocode=False)
+
+    events = []
+    for order in orders:
+        html = ''
+        if order.id in matching:
+            html = render_to_string('order_row.html', {'item': order, 'board_url': board_url})
+        data = json.dumps({'id': order.id, 'html': html})
+        events.append(f'id: {encode_cursor(order.updated_at, order.id)}\nevent: order\ndata: {data}\n\n')
+    return events, since, len(orders)
@@ -0,0 +1,272 @@
+import hmac
+import os
+import socket
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+WORKERS_KEY = 'metrics:workers'
+WORKER_KEY_PREFIX = 'metrics:worker:'
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+# Счётчики SQL текущего запроса. Соединения у Django свои в каждом потоке,
+# а под ASGI ORM работает в потоках sync_to_async; контекст доходит и туда
+_db_stats = ContextVar('db_stats', default=None)
+
+# Имя метрики → (тип, описание) для заголовков HELP и TYPE
+METRICS = {
+    'http_requests_total': ('counter', 'Запросы по имени URL, методу и классу статуса'),
+    'http_request_duration_seconds': ('histogram', 'Время ответа по имени URL'),
+    'http_request_db_queries': ('histogram', 'Число SQL-запросов на один HTTP-запрос'),
+    'http_request_db_duration_seconds': ('histogram', 'Время в базе данных на один HTTP-запрос'),
+    'geocoder_requests_total': ('counter', 'Запросы к геокодеру по результату'),
+    'location_cache_requests_total': ('counter', 'Обращения к кэшу координат: попадания и промахи'),
+    'catalog_cache_requests_total': ('counter', 'Обращения к кэшу каталога: попадания и промахи'),
+    'api_rejected_requests_total': ('counter', 'Запросы к API, отклонённые лимитами, по причине'),
+}
+
+
+class MetricsRegistry:
+    """
+    Счётчики и гистограммы в памяти процесса.
+
+    Запись — это захват блокировки и сложение в словаре, поэтому на
+    горячем пути почти ничего не стоит. Раз в METRICS_FLUSH_INTERVAL
+    секунд воркер кладёт свой накопленный снимок в кэш Django,
+    а /metrics складывает снимки всех живых воркеров. Для сборки
+    метрик с нескольких процессов кэш должен быть общим (Redis, Memcached).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self._collectors = []
+        self._flushed_at = 0
+        self.worker_id = f'{socket.gethostname()}:{os.getpid()}'
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = [buckets, [0] * (len(buckets) + 1), 0, 0]
+            histogram[1][bisect_left(buckets, value)] += 1
+            histogram[2] += value
+            histogram[3] += 1
+
+    def register_collector(self, collector):
+        """
+        Добавляет функцию, которая при снятии снимка возвращает словарь
+        (имя, ((метка, значение), ...)) → значение счётчика. Так в метрики
+        попадает статистика, которую модули и так ведут сами, например
+        попадания в кэш координат.
+        """
+        self._collectors.append(collector)
+
+    def snapshot(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {
+                key: (buckets, list(counts), total, count)
+                for key, (buckets, counts, total, count) in self._histograms.items()
+            }
+        for collector in self._collectors:
+            for (name, labels), value in collector().items():
+                counters[(name, tuple(sorted(labels)))] = value
+        return {'counters': counters, 'histograms': histograms}
+
+    def maybe_flush(self):
+        if time.monotonic() - self._flushed_at >= settings.METRICS_FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        self._flushed_at = time.monotonic()
+        ttl = settings.METRICS_WORKER_TTL
+        cache.set(WORKER_KEY_PREFIX + self.worker_id, self.snapshot(), ttl)
+        workers = cache.get(WORKERS_KEY) or set()
+        if self.worker_id not in workers:
+            cache.set(WORKERS_KEY, {*workers, self.worker_id}, None)
+
+    def collect(self):
+        """Складывает снимки всех воркеров, чьи записи в кэше ещё не истекли."""
+        self.flush()
+        workers = cache.get(WORKERS_KEY) or set()
+        snapshots = cache.get_many([WORKER_KEY_PREFIX + worker_id for worker_id in workers])
+        alive = {key[len(WORKER_KEY_PREFIX):] for key in snapshots}
+        if alive != workers:
+            cache.set(WORKERS_KEY, alive, None)
+
+        counters = {}
+        histograms = {}
+        for snapshot in snapshots.values():
+            for key, value in snapshot['counters'].items():
+                counters[key] = counters.get(key, 0) + value
+            for key, (buckets, counts, total, count) in snapshot['histograms'].items():
+                merged = histograms.get(key)
+                if merged is None:
+                    histograms[key] = [buckets, list(counts), total, count]
+                    continue
+                merged[1] = [left + right for left, right in zip(merged[1], counts)]
+                merged[2] += total
+                merged[3] += count
+        return counters, histograms
+
+
+registry = MetricsRegistry()
+
+
+def flush_metrics():
+    """
+    Сбрасывает снимок сразу. Нужен management-командам: их не обслуживает
+    MetricsMiddleware, и без явного сброса счётчики пропадали бы с процессом.
+    """
+    if settings.METRICS_ENABLED:
+        registry.flush()
+
+
+def render_prometheus(counters, histograms):
+    lines = []
+    names = sorted({name for name, _ in counters} | {name for name, _ in histograms})
+    for name in names:
+        metric_type, description = METRICS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {metric_type}')
+        for (counter_name, labels), value in sorted(counters.items()):
+            if counter_name == name:
+                lines.append(f'{name}{format_labels(labels)} {value}')
+        for (histogram_name, labels), (buckets, counts, total, count) in sorted(histograms.items()):
+            if histogram_name != name:
+                continue
+            cumulative = 0
+            for bound, bucket_count in zip((*buckets, '+Inf'), counts):
+                cumulative += bucket_count
+                lines.append(f'{name}_bucket{format_labels((*labels, ("le", bound)))} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {total}')
+            lines.append(f'{name}_count{format_labels(labels)} {count}')
+    return '\n'.join(lines) + '\n'
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    pairs = []
+    for name, value in labels:
+        value = str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return '{' + ','.join(pairs) + '}'
+
+
+class MetricsMiddleware:
+    """
+    Замеряет время ответа, число SQL-запросов и время в базе для каждого
+    запроса и группирует их по имени URL, а не по пути, чтобы заказы
+    с разными id попадали в одну серию. Работает и под ASGI, не заставляя
+    Django переводить асинхронные вьюхи в поток.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+
+        db_stats = {'queries': 0, 'duration': 0.0}
+        started_at = time.perf_counter()
+        with self.count_queries(db_stats):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started_at, db_stats)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+
+        db_stats = {'queries': 0, 'duration': 0.0}
+        started_at = time.perf_counter()
+        with self.count_queries(db_stats):
+            response = await self.get_response(request)
+        self.record(request, response, time.perf_counter() - started_at, db_stats)
+        return response
+
+    @contextmanager
+    def count_queries(self, db_stats):
+        token = _db_stats.set(db_stats)
+        try:
+            yield
+        finally:
+            _db_stats.reset(token)
+
+    def record(self, request, response, duration, db_stats):
+        match = request.resolver_match
+        view = match.view_name if match and match.view_name else 'unresolved'
+        registry.inc(
+            'http_requests_total',
+            view=view,
+            method=request.method,
+            status=f'{response.status_code // 100}xx',
+        )
+        registry.observe('http_request_duration_seconds', duration, view=view)
+        registry.observe('http_request_db_queries', db_stats['queries'], QUERY_COUNT_BUCKETS, view=view)
+        registry.observe('http_request_db_duration_seconds', db_stats['duration'], view=view)
+        registry.maybe_flush()
+
+
+def count_query(execute, sql, params, many, context):
+    db_stats = _db_stats.get()
+    if db_stats is None:
+        return execute(sql, params, many, context)
+    started_at = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        db_stats['queries'] += 1
+        db_stats['duration'] += time.perf_counter() - started_at
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    """Ставит счётчик на каждое соединение, в каком бы потоке оно ни открылось."""
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+def metrics_view(request):
+    """
+    Метрики всех воркеров в текстовом формате Prometheus.
+    Без METRICS_TOKEN отдаются только при DEBUG.
+    """
+    token = settings.METRICS_TOKEN
+    if not token:
+        if not settings.DEBUG:
+            return HttpResponseForbidden()
+    elif not hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return HttpResponseForbidden()
+    counters, histograms = registry.collect()
+    return HttpResponse(
+        render_prometheus(counters, histograms),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
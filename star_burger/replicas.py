@@ -0,0 +1,137 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+REPLICA_ALIAS = 'replica'
+
+# Разрешено ли текущему запросу читать с реплики
+_replica_allowed = ContextVar('replica_allowed', default=False)
+# Клиент недавно писал в базу: запрос пришёл с cookie закрепления
+_pinned = ContextVar('pinned_to_primary', default=False)
+# Текущий запрос уже писал в основную базу
+_wrote = ContextVar('wrote_to_primary', default=False)
+
+
+def replica_configured():
+    return REPLICA_ALIAS in connections.settings
+
+
+@contextmanager
+def read_from_replica():
+    """Внутри блока чтения уходят на реплику, пока запрос ничего не записал."""
+    token = _replica_allowed.set(True)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+@contextmanager
+def read_from_primary():
+    """
+    Внутри блока чтения идут в основную базу. Нужен там, где прочитанное
+    кэшируется под текущей версией: отставшая реплика закэшировала бы
+    старые данные до следующего изменения.
+    """
+    token = _replica_allowed.set(False)
+    try:
+        yield
+    finally:
+        _replica_allowed.reset(token)
+
+
+def replica_reads(view):
+    """Разрешает вьюхе читать с реплики. Ставится под проверками доступа."""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            with read_from_replica():
+                return await view(request, *args, **kwargs)
+
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        with read_from_replica():
+            return view(request, *args, **kwargs)
+
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Отправляет на реплику чтения из блоков read_from_replica. После первой
+    записи запрос до конца читает из основной базы, чтобы видеть свои
+    изменения. Без REPLICA_DATABASE_URL всё идёт в основную базу.
+    """
+
+    def db_for_read(self, model, **hints):
+        if _replica_allowed.get() and not (_pinned.get() or _wrote.get()) and replica_configured():
+            return REPLICA_ALIAS
+        return None
+
+    def db_for_write(self, model, **hints):
+        _wrote.set(True)
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплика — копия основной базы, связи между ними допустимы
+        aliases = {DEFAULT_DB_ALIAS, REPLICA_ALIAS}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+
+class ReplicaPinMiddleware:
+    """
+    Read-your-writes между запросами. Если запрос что-то записал, ответ
+    ставит cookie на REPLICA_PIN_SECONDS — столько, сколько реплика может
+    отставать. Пока cookie живёт, запросы этого клиента читают из основной базы.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = self.start(request)
+        try:
+            return self.pin(self.get_response(request))
+        finally:
+            self.finish(tokens)
+
+    async def __acall__(self, request):
+        tokens = self.start(request)
+        try:
+            return self.pin(await self.get_response(request))
+        finally:
+            self.finish(tokens)
+
+    def start(self, request):
+        return _pinned.set(settings.REPLICA_PIN_COOKIE in request.COOKIES), _wrote.set(False)
+
+    def finish(self, tokens):
+        pinned_token, wrote_token = tokens
+        _pinned.reset(pinned_token)
+        _wrote.reset(wrote_token)
+
+    def pin(self, response):
+        # Cookie продлевается только записью, иначе читающий клиент остался бы на основной базе навсегда
+        if _wrote.get() and replica_configured():
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE,
+                '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True,
+                samesite='Lax',
+            )
+        return response
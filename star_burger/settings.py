@@ -2,6 +2,7 @@ import os
 
 import dj_database_url
 
+from django.core.exceptions import ImproperlyConfigured
 from environs import Env
 from django.urls import path
 
@@ -16,6 +17,24 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 SECRET_KEY = env('SECRET_KEY')
 DEBUG = env.bool('DEBUG', True)
 YANDEX_GEOCODER_API_KEY = os.getenv('YANDEX_GEOCODER_API_KEY')
+GEOCODER_BACKEND = env.str('GEOCODER_BACKEND', 'geopy.geocoders.Yandex')
+GEOCODER_MAX_WORKERS = env.int('GEOCODER_MAX_WORKERS', 8)
+# Таймаут одного запроса к геокодеру и общий лимит на пачку адресов, в секундах
+GEOCODER_TIMEOUT = env.float('GEOCODER_TIMEOUT', 3)
+GEOCODER_DEADLINE = env.float('GEOCODER_DEADLINE', 10)
+# Кэш координат в памяти процесса: число адресов и срок жизни записи в секундах
+GEOCODER_CACHE_SIZE = env.int('GEOCODER_CACHE_SIZE', 10000)
+GEOCODER_CACHE_TTL = env.int('GEOCODER_CACHE_TTL', 24 * 60 * 60)
+# Повторы для ненайденных адресов: пауза удваивается после каждой неудачи, в секундах
+GEOCODER_RETRY_BASE_DELAY = env.int('GEOCODER_RETRY_BASE_DELAY', 10 * 60)
+GEOCODER_RETRY_MAX_DELAY = env.int('GEOCODER_RETRY_MAX_DELAY', 7 * 24 * 60 * 60)
+# haversine — быстрый расчёт по сфере, geodesic — точный по эллипсоиду
+DISTANCE_METHOD = env.str('DISTANCE_METHOD', 'haversine')
+# Сетка индекса ресторанов и поиск ближайших: размер ячейки и радиус в км,
+# сколько ресторанов показывать менеджеру и отдавать в API
+RESTAURANT_GRID_CELL_KM = env.float('RESTAURANT_GRID_CELL_KM', 5)
+RESTAURANT_SEARCH_RADIUS_KM = env.float('RESTAURANT_SEARCH_RADIUS_KM', 50)
+NEAREST_RESTAURANTS_LIMIT = env.int('NEAREST_RESTAURANTS_LIMIT', 10)
 
 ALLOWED_HOSTS = env.list('ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
 
@@ -36,6 +55,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'star_burger.metrics.MetricsMiddleware',
+    'star_burger.replicas.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -92,6 +113,19 @@ DATABASES = {
     )
 }
 
+# Реплика для чтения: страницы менеджера читают с неё, заказы пишутся в основную базу
+REPLICA_DATABASE_URL = env.str('REPLICA_DATABASE_URL', None)
+if REPLICA_DATABASE_URL:
+    DATABASES['replica'] = {
+        **dj_database_url.parse(REPLICA_DATABASE_URL),
+        # В тестах реплика — та же тестовая база, что и основная
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['star_burger.replicas.ReplicaRouter']
+# Сколько секунд после записи клиент читает только из основной базы: не меньше отставания реплики
+REPLICA_PIN_SECONDS = env.int('REPLICA_PIN_SECONDS', 10)
+REPLICA_PIN_COOKIE = 'primary_pin'
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -130,6 +164,69 @@ STATICFILES_DIRS = [
 ]
 
 
+# Общий кэш воркеров: через него расходятся счётчики версий каталога, индексов
+# и кэша координат. Без Redis или Memcached у каждого процесса свой кэш,
+# и изменения, сделанные в одном воркере, другие не увидят
+CACHES = {
+    'default': env.dj_cache_url('CACHE_URL', 'locmem://'),
+}
+if not DEBUG and 'CACHE_URL' not in os.environ:
+    raise ImproperlyConfigured(
+        'Задайте CACHE_URL, например redis://127.0.0.1:6379/1. '
+        'Для одного процесса без общего кэша — CACHE_URL=locmem://'
+    )
+
+# Каталог товаров: сколько хранить собранный JSON в кэше и сколько его может держать браузер, в секундах
+CATALOG_CACHE_TIMEOUT = env.int('CATALOG_CACHE_TIMEOUT', 24 * 60 * 60)
+CATALOG_MAX_AGE = env.int('CATALOG_MAX_AGE', 60)
+
+# Сколько заказов партнёр может передать в одном запросе к /api/orders/batch/
+ORDERS_BATCH_MAX_SIZE = env.int('ORDERS_BATCH_MAX_SIZE', 500)
+# Токены партнёров через запятую: /api/orders/batch/ требует Authorization: Bearer <токен>
+PARTNER_API_TOKENS = env.list('PARTNER_API_TOKENS', [])
+# Сколько секунд повтор POST /api/order/ с тем же Idempotency-Key получает сохранённый ответ
+IDEMPOTENCY_KEY_TTL = env.int('IDEMPOTENCY_KEY_TTL', 24 * 60 * 60)
+
+# Ограничение частоты запросов к API: запросов в минуту и запас для всплесков,
+# отдельно на IP-адрес и на номер телефона в заказе
+API_THROTTLE_ENABLED = env.bool('API_THROTTLE_ENABLED', True)
+API_THROTTLE_RATES = {
+    'ip': (env.int('API_THROTTLE_IP_PER_MINUTE', 120), env.int('API_THROTTLE_IP_BURST', 30)),
+    'phone': (env.int('API_THROTTLE_PHONE_PER_MINUTE', 5), env.int('API_THROTTLE_PHONE_BURST', 5)),
+}
+# Сколько запросов к API один воркер обрабатывает одновременно, остальным сразу 503; 0 — без лимита
+API_MAX_CONCURRENT_REQUESTS = env.int('API_MAX_CONCURRENT_REQUESTS', 0)
+# Через сколько секунд клиенту повторить запрос, отклонённый из-за перегрузки
+API_SHED_RETRY_AFTER = env.int('API_SHED_RETRY_AFTER', 1)
+# Асинхронные версии /api/products/, /api/banners/, /api/order/ и долгий поток изменений
+# доски заказов; включайте при запуске под ASGI
+ASYNC_API = env.bool('ASYNC_API', False)
+
+# Сколько заказов показывать менеджеру на одной странице
+ORDER_BOARD_PAGE_SIZE = env.int('ORDER_BOARD_PAGE_SIZE', 50)
+# Поток изменений доски: как часто проверять заказы и сколько держать соединение под ASGI,
+# через сколько переподключаться и сколько заказов отдавать за проверку (секунды, штуки).
+# Под WSGI браузер переподключается к потоку каждые ORDER_STREAM_POLL_INTERVAL секунд
+# Заказы моложе ORDER_STREAM_LAG секунд ждут, пока закоммитятся параллельные транзакции
+ORDER_STREAM_POLL_INTERVAL = env.float('ORDER_STREAM_POLL_INTERVAL', 2)
+ORDER_STREAM_TIMEOUT = env.int('ORDER_STREAM_TIMEOUT', 30)
+ORDER_STREAM_RETRY = env.int('ORDER_STREAM_RETRY', 1)
+ORDER_STREAM_BATCH_SIZE = env.int('ORDER_STREAM_BATCH_SIZE', 100)
+ORDER_STREAM_LAG = env.float('ORDER_STREAM_LAG', 1)
+
+# Страница меню у менеджера: товаров на странице и ресторанов-колонок в окне
+PRODUCTS_PAGE_SIZE = env.int('PRODUCTS_PAGE_SIZE', 50)
+PRODUCTS_PAGE_COLUMNS = env.int('PRODUCTS_PAGE_COLUMNS', 20)
+
+# Метрики для Prometheus на /metrics: как часто воркер сбрасывает снимок в кэш
+# и сколько снимок живёт после остановки воркера, в секундах.
+# Если задан METRICS_TOKEN, /metrics требует заголовок Authorization: Bearer <токен>,
+# без токена метрики отдаются только при DEBUG
+METRICS_ENABLED = env.bool('METRICS_ENABLED', True)
+METRICS_FLUSH_INTERVAL = env.int('METRICS_FLUSH_INTERVAL', 10)
+METRICS_WORKER_TTL = env.int('METRICS_WORKER_TTL', 5 * 60)
+METRICS_TOKEN = env.str('METRICS_TOKEN', None)
+
 REST_FRAMEWORK = {
     'DEFAULT_PARSER_CLASSES': [
         'rest_framework.parsers.JSONParser',
@@ -138,4 +235,10 @@ REST_FRAMEWORK = {
         'rest_framework.renderers.JSONRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
+    'DEFAULT_THROTTLE_CLASSES': [
+        'foodcartapp.throttling.IPTokenBucketThrottle',
+    ],
+    # Сколько доверенных прокси перед сайтом дописывают X-Forwarded-For: за одним nginx — 1.
+    # При 0 адрес клиента берётся из REMOTE_ADDR, а заголовок игнорируется
+    'NUM_PROXIES': env.int('API_NUM_PROXIES', 0),
 }
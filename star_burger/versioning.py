@@ -0,0 +1,52 @@
+from django.core.cache import cache
+
+
+def bump_cache_version(key):
+    """
+    Увеличивает счётчик версии в кэше Django, видимый всем воркерам.
+    Возвращает новое значение счётчика.
+    """
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+class VersionTracker:
+    """
+    Версия локальной копии данных в памяти воркера — индекса или кэша —
+    относительно общего счётчика в кэше Django.
+
+    Свои изменения воркер применяет к копии точечно: если после его
+    инкремента счётчик вырос ровно на единицу, чужих изменений не было.
+    Иначе версия забывается, и при следующей сверке копия собирается
+    заново. Копия живёт до смены версии, поэтому данные для неё читают
+    из основной базы: отставшая реплика испортила бы её надолго.
+    Блокировку держит владелец копии.
+    """
+
+    def __init__(self, key):
+        self.key = key
+        self.version = None
+
+    def is_current(self):
+        """Сверяет версию с кэшем. False — копию нужно собрать заново."""
+        version = cache.get(self.key)
+        if version is None:
+            # Без счётчика первое же наше изменение выглядело бы чужим
+            cache.add(self.key, 0, None)
+            version = cache.get(self.key)
+        current = version == self.version
+        self.version = version
+        return current
+
+    def bump(self):
+        """
+        Сообщает об изменении всем воркерам. Возвращает True, если других
+        изменений не было и копии хватит точечного обновления.
+        """
+        version = bump_cache_version(self.key)
+        own = self.version is not None and version == self.version + 1
+        self.version = version if own else None
+        return own